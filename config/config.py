@@ -2,8 +2,13 @@
 Configuration file for EV3 3D scanner system
 Contains all system constants and parameters
 """
-from ev3dev2.motor import OUTPUT_A, OUTPUT_B, OUTPUT_C
-from ev3dev2.sensor import INPUT_1, INPUT_2, INPUT_3
+try:
+    from ev3dev2.motor import OUTPUT_A, OUTPUT_B, OUTPUT_C
+    from ev3dev2.sensor import INPUT_1, INPUT_2, INPUT_3
+except ImportError:
+    # 离线处理、仿真和分析工具不需要 ev3dev2，使用同名端口标识
+    OUTPUT_A, OUTPUT_B, OUTPUT_C = 'outA', 'outB', 'outC'
+    INPUT_1, INPUT_2, INPUT_3 = 'in1', 'in2', 'in3'
 
 # Hardware Configuration
 ULTRASONIC_PORT = INPUT_1
@@ -25,6 +30,103 @@ SCAN_SPEED = 50         # 电机转速(度/秒)
 SAMPLE_RATE = 10        # 数据采样率(Hz)
 FILTER_WINDOW = 5       # 数据滤波窗口大小
 
+# Registration Parameters
+ICP_PYRAMID_RATIOS = (1/16, 1/64)  # 多分辨率ICP各层体素尺寸(相对点云对角线长度)
+ICP_MIN_LEVEL_POINTS = 10          # 金字塔层的最少点数
+ICP_RELATIVE_TOLERANCE = 1e-3      # ICP误差相对改善的收敛阈值
+
+# Kinematics Parameters
+LIFT_MM_PER_DEGREE = 0.05          # 升降电机每度对应的位移
+SENSOR_MOUNT_OFFSET = (0, 0, 0)    # 传感器相对旋转中心的安装偏移
+ENCODER_ANGLE_UNCERTAINTY = 2.0    # 编码器角度不确定度(度)
+LIFT_POSITION_UNCERTAINTY = 2.0    # 升降位置不确定度
+CORRESPONDENCE_SIGMA_SCALE = 3.0   # 对应点搜索半径与位姿不确定度之比
+MERGE_VOXEL_SIZE = 0.01            # 点云合并去重的体素尺寸
+POSE_GRAPH_MIN_OVERLAP = 0.3       # 多视角配准中建立边所需的最小包围盒重叠比例
+POSE_GRAPH_PARALLEL_MIN_PAIRS = 4  # 一次新增的配准边达到该数量时才使用进程池并行计算
+
+# Coverage Parameters
+VISIBILITY_MAX_VOXELS = 2000000     # 可见性地图体素数上限，超过时自动放大分辨率
+VISIBILITY_RESOLUTION = 0.05       # 可见性地图的默认分辨率(体素数超过上限时放大)
+OCCUPANCY_RESOLUTION_TOLERANCE = 0.02  # 增量占据地图分辨率落后于可见性地图超过该比例时重建
+COVERAGE_CACHE_SIZE = 4            # 覆盖分析缓存的最大条目数
+COVERAGE_HIERARCHY_LEVELS = 4      # 分层空洞检测的层数，最粗一层单元边长为 2**(层数-1) 个体素
+
+# Planning Parameters
+VIEWPOINT_LATTICE_SPACING = 50.0   # 候选视点网格间距
+VIEWPOINT_REFINE_TOP_K = 3         # 每个空洞局部细化的候选视点数
+VIEWPOINT_REFINE_ITERATIONS = 30   # 局部细化的迭代次数
+VIEWPOINT_SCORE_CHUNK = 2000000    # 分数矩阵分块计算时每块的元素数上限
+VIEWPOINT_SETTLE_TIME = 0.5        # 电机到位后的稳定等待时间(秒)
+SENSOR_BEAM_ANGLE = 30             # 超声波传感器声波锥角(度)
+NBV_CANDIDATES_PER_HOLE = 8        # 下一最佳视点选择中每个空洞的候选位置数
+PLANNING_SEED = 0                  # 逐空洞视点优化的基础随机种子
+PLANNING_CHUNKS_PER_WORKER = 4     # 并行规划时每个工作进程分到的任务块数
+SEQUENCE_AXIS_MODE = 'sequential'  # 扫描序列的关节代价：'sequential'两轴依次转动，'concurrent'两轴同时转动
+SEQUENCE_TIME_BUDGET = 0.5         # 扫描序列局部改进(2-opt/Or-opt)的时间预算(秒)
+SEQUENCE_OROPT_MAX_SEGMENT = 3     # Or-opt 一次移动的最长连续视点段
+
+# Cost Model Parameters
+MOTOR_ACCELERATION = 200.0         # 电机加速度(度/秒²)，标定前的初值
+MOTOR_COMMAND_OVERHEAD = 0.05      # 每次电机指令的固定开销(秒)
+SENSOR_READ_TIME = 0.1             # 单次传感器读取时间(秒)
+POINT_PROCESSING_TIME = 0.001      # 每个采样点的处理与配准时间(秒)
+ITERATION_OVERHEAD = 0.5           # 每轮扫描的固定处理开销(秒)
+COST_MODEL_MAX_SAMPLES = 1000      # 用于标定的计时样本上限
+COST_MODEL_MIN_SAMPLES = 5         # 标定某项参数所需的最少样本数
+COST_MODEL_FILE = 'scan_cost_model.json'  # 主程序保存标定参数的位置
+
+# Plan Cache Parameters
+PLAN_CACHE_DIR = 'plan_cache'              # 视点计划缓存目录
+PLAN_CACHE_MAX_BYTES = 50 * 1024 * 1024    # 计划缓存的磁盘容量上限(字节)
+PLAN_CACHE_QUANTUM = 20.0                  # 物体坐标系下空洞中心的量化尺寸(mm)
+PLAN_CACHE_MATCH_TOLERANCE = 15.0          # 近似匹配时空洞中心的最大偏差(mm)
+PLAN_CACHE_MIN_COVERAGE = 0.9              # 复用计划须覆盖的当前空洞权重比例
+
+# Pipeline Parameters
+PIPELINE_BATCH_SIZE = 4            # 流水线扫描中采集线程每批执行的视点数
+
+# Budget Parameters
+BUDGET_SAFETY_MARGIN = 0.1         # 预算扫描中为预测误差预留的剩余时间比例
+
+# Checkpoint Parameters
+CHECKPOINT_DIR = 'checkpoints'     # 自动扫描检查点目录
+
+# Stage Tracing Parameters
+TRACE_BUCKETS_PER_OCTAVE = 8       # 阶段耗时直方图每倍程的桶数(分位数相对误差约9%)
+TRACE_MIN_DURATION = 1e-6          # 直方图最小耗时(秒)
+TRACE_MAX_DURATION = 1e4           # 直方图最大耗时(秒)
+
+# Metrics Sampling Parameters
+METRICS_SAMPLE_INTERVAL = 1.0      # 后台系统指标采样间隔(秒)
+METRICS_LOW_OVERHEAD_INTERVAL = 5.0  # 低开销模式(EV3)的采样间隔(秒)
+METRICS_LOW_OVERHEAD = True        # 主程序在EV3上使用低开销采样(不导入psutil)
+
+# Metrics Export Parameters
+METRICS_EXPORTER_ENABLED = True    # 扫描期间是否导出实时指标
+METRICS_HTTP_HOST = '127.0.0.1'    # 指标HTTP服务监听地址，设为'0.0.0.0'可从主机访问
+METRICS_HTTP_PORT = 9108           # 指标HTTP服务端口(/metrics)
+METRICS_JSONL_FILE = 'logs/metrics.jsonl'  # 指标时间序列文件
+METRICS_JSONL_MAX_BYTES = 5 * 1024 * 1024  # 单个JSONL文件大小上限，超过后轮转
+METRICS_JSONL_BACKUPS = 3          # 保留的轮转文件数
+METRICS_EXPORT_INTERVAL = 5.0      # JSONL记录间隔(秒)
+
+# Batch Reprocessing Parameters
+BATCH_OUTPUT_DIR = 'reprocessed'   # 离线批量重处理输出目录
+BATCH_SUMMARY_FILE = 'summary.csv' # 每个会话的计时汇总表文件名
+BATCH_MAX_MEMORY_MB = 0            # 每个工作进程导入依赖后的内存预算(MB)，0表示不限制，'auto'为可用内存按进程数均分
+
+# Free Space Parameters
+FREE_SPACE_CARVING = True          # 是否沿测量射线更新自由空间栅格
+FREE_SPACE_RESOLUTION = 5.0        # 自由空间栅格分辨率
+RAY_BATCH_SIZE = 4096              # 射线批处理大小
+LOG_ODDS_HIT = 0.85                # 命中体素的对数几率增量
+LOG_ODDS_MISS = -0.4               # 射线经过体素的对数几率增量
+LOG_ODDS_MIN = -2.0                # 对数几率下限
+LOG_ODDS_MAX = 3.5                 # 对数几率上限
+FREE_SPACE_THRESHOLD = -0.2        # 低于该值视为自由空间
+OCCUPIED_SPACE_THRESHOLD = 0.2     # 高于该值视为占据
+
 # System Parameters
 DEBUG_MODE = True       # 调试模式开关
 LOG_LEVEL = 'INFO'      # 日志级别
@@ -2,85 +2,335 @@
 Detection of missing areas in scanned point cloud
 """
 import numpy as np
-from sklearn.neighbors import KDTree
 import logging
+import time
 from config import *
+from global_map import as_coords
+
+class VisibilityMap:
+    """
+    体素网格上的可见性地图：counts[i, j, k] 为网格点 origin + (i, j, k) * resolution 邻域内的点数
+    """
+    def __init__(self, counts, origin, resolution):
+        self.counts = counts
+        self.origin = np.asarray(origin, dtype=float)
+        self.resolution = resolution
+    
+    def __len__(self):
+        return self.counts.size
+    
+    @property
+    def shape(self):
+        return self.counts.shape
+    
+    @property
+    def total_voxels(self):
+        return self.counts.size
+    
+    @property
+    def covered_voxels(self):
+        return int(np.count_nonzero(self.counts))
+    
+    def positions(self, mask=None):
+        """
+        返回（满足mask的）体素网格点坐标
+        """
+        indices = np.argwhere(mask) if mask is not None else np.indices(self.shape).reshape(3, -1).T
+        return self.origin + indices * self.resolution
+
 
 class CoverageDetector:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         
-    def create_visibility_map(self, points, resolution=0.05):
+        # 最近一次分层空洞检测的逐层代价统计
+        self.last_level_stats = None
+    
+    def create_visibility_map(self, points, resolution=VISIBILITY_RESOLUTION, max_voxels=VISIBILITY_MAX_VOXELS):
         """
         创建扫描区域的可见性地图
+        点坐标整数量化后用bincount统计每个体素的点数，再用可分离的盒式滤波求邻域点数，整体为O(N)
         """
         try:
-            # 计算边界框
-            coords = np.array([[p['x'], p['y'], p['z']] for p in points])
-            min_bounds = np.min(coords, axis=0)
-            max_bounds = np.max(coords, axis=0)
+            indices, shape, min_bounds, resolution = self._quantize(points, resolution, max_voxels)
             
-            # 创建体素网格
-            x_range = np.arange(min_bounds[0], max_bounds[0], resolution)
-            y_range = np.arange(min_bounds[1], max_bounds[1], resolution)
-            z_range = np.arange(min_bounds[2], max_bounds[2], resolution)
+            # 统计每个体素的点数
+            flat = np.ravel_multi_index(indices.T, shape)
+            counts = np.bincount(flat, minlength=np.prod(shape)).reshape(shape)
             
-            # 构建KD树用于快速邻域搜索
-            tree = KDTree(coords)
+            # 3x3x3盒式邻域，体积与原先半径为两个体素的球形邻域相当
+            counts = self._box_sum(counts, radius=1)
             
-            visibility_map = {}
-            for x in x_range:
-                for y in y_range:
-                    for z in z_range:
-                        point = np.array([x, y, z])
-                        # 检查邻域内的点数
-                        indices = tree.query_radius([point], r=resolution*2)[0]
-                        visibility_map[(x,y,z)] = len(indices)
-            
-            return visibility_map
+            return VisibilityMap(counts.astype(np.int32), min_bounds, resolution)
             
         except Exception as e:
             self.logger.error(f"Visibility map creation failed: {str(e)}")
             return None
     
-    def detect_holes(self, visibility_map, threshold=3):
+    def _quantize(self, points, resolution, max_voxels):
+        """
+        计算边界框和网格尺寸，并将点量化到最近的网格点
+        points 可以是点字典列表或Nx3坐标数组(如 GlobalMap.coords)；体素数超过上限时放大分辨率
+        """
+        coords = as_coords(points)
+        min_bounds = np.min(coords, axis=0)
+        max_bounds = np.max(coords, axis=0)
+        
+        extent = max_bounds - min_bounds
+        shape = np.maximum(np.ceil(extent / resolution), 1).astype(np.int64)
+        if np.prod(shape) > max_voxels:
+            resolution = float(np.cbrt(np.prod(np.maximum(extent, resolution)) / max_voxels))
+            shape = np.maximum(np.ceil(extent / resolution), 1).astype(np.int64)
+            self.logger.info(f"Visibility map resolution coarsened to {resolution:.4f}")
+        
+        indices = np.rint((coords - min_bounds) / resolution).astype(np.int64)
+        indices = np.clip(indices, 0, shape - 1)
+        return indices, shape, min_bounds, resolution
+    
+    @staticmethod
+    def _box_sum(grid, radius):
+        """
+        可分离的盒式求和滤波：沿每个轴用累加和计算 [i-radius, i+radius] 窗口内的和
+        """
+        for axis in range(grid.ndim):
+            n = grid.shape[axis]
+            csum = np.cumsum(grid, axis=axis)
+            pad = [(0, 0)] * grid.ndim
+            pad[axis] = (1, 0)
+            csum = np.pad(csum, pad)
+            upper = np.minimum(np.arange(n) + radius + 1, n)
+            lower = np.maximum(np.arange(n) - radius, 0)
+            grid = np.take(csum, upper, axis=axis) - np.take(csum, lower, axis=axis)
+        return grid
+    
+    @staticmethod
+    def _sparse_box_sum(indices, shape, radius=1):
+        """
+        _box_sum 的稀疏版本：只沿各轴展开非零体素的窗口并合并，返回非零体素的索引和邻域点数
+        """
+        keys, counts = np.unique(np.ravel_multi_index(indices.T, shape), return_counts=True)
+        strides = np.array([shape[1] * shape[2], shape[2], 1], dtype=np.int64)
+        offsets = np.arange(-radius, radius + 1)
+        for axis in range(3):
+            moved = (keys // strides[axis] % shape[axis])[:, None] + offsets
+            valid = (moved >= 0) & (moved < shape[axis])
+            keys, inverse = np.unique((keys[:, None] + offsets * strides[axis])[valid], return_inverse=True)
+            counts = np.bincount(inverse, weights=np.broadcast_to(counts[:, None], moved.shape)[valid])
+        return np.column_stack(np.unravel_index(keys, shape)), counts.astype(np.int64)
+    
+    def detect_holes(self, visibility_map, threshold=3, min_size=3, connectivity=1):
         """
         检测点云中的空洞区域
+        对低密度体素做三维连通域标记，一次向量化计算每个空洞的质心、范围、体积和边界面积
+        connectivity: 1为面相邻，2为棱相邻，3为角相邻
         """
         try:
-            holes = []
-            for pos, count in visibility_map.items():
-                if count < threshold:
-                    holes.append({
-                        'position': pos,
-                        'density': count
-                    })
+            hole_mask = visibility_map.counts < threshold
+            return self._label_clusters(hole_mask, visibility_map.origin, visibility_map.resolution,
+                                        min_size, connectivity)
             
-            # 对空洞区域进行聚类
-            if holes:
-                positions = np.array([h['position'] for h in holes])
-                tree = KDTree(positions)
-                
-                # 使用基于密度的聚类
-                clusters = []
-                processed = set()
+        except Exception as e:
+            self.logger.error(f"Hole detection failed: {str(e)}")
+            return None
+    
+    def detect_holes_hierarchical(self, points, threshold=3, min_size=3, connectivity=1,
+                                  resolution=VISIBILITY_RESOLUTION, max_voxels=VISIBILITY_MAX_VOXELS,
+                                  levels=COVERAGE_HIERARCHY_LEVELS):
+        """
+        由粗到精的分层空洞检测，结果与 detect_holes(create_visibility_map(points)) 相同
+        只在非零体素上稀疏计算邻域点数；从最粗一层开始，不含已覆盖体素且完整位于网格内的单元整体作为空洞叶节点，
+        其余单元细分到下一层，直到目标分辨率。连通域标记和统计在叶节点上进行，逐层代价记录在 last_level_stats
+        """
+        try:
+            from scipy.ndimage import generate_binary_structure
+            from scipy.sparse import coo_matrix
+            from scipy.sparse.csgraph import connected_components
+            
+            start = time.perf_counter()
+            indices, shape, origin, resolution = self._quantize(points, resolution, max_voxels)
+            if threshold <= 0:
+                return []
+            cells, counts = self._sparse_box_sum(indices, shape)
+            covered = cells[counts >= threshold]
+            stats = {'total_voxels': int(np.prod(shape)), 'covered_voxels': len(covered),
+                     'counts_time': time.perf_counter() - start, 'levels': []}
+            
+            levels = max(int(levels), 1)
+            shapes = [-(-shape // (1 << j)) for j in range(levels)]
+            children = np.indices((2, 2, 2)).reshape(3, -1).T
+            
+            # 逐层由粗到精：含已覆盖体素或跨越网格边界的单元需要细分
+            dirty, leaves = [None] * levels, [None] * levels
+            candidates = np.indices(shapes[-1]).reshape(3, -1).T
+            for j in reversed(range(levels)):
+                level_start = time.perf_counter()
+                dirty[j] = np.zeros(shapes[j], dtype=bool)
+                dirty[j][tuple((covered >> j).T)] = True
+                for axis in range(3):
+                    if shape[axis] % (1 << j):
+                        dirty[j][(slice(None),) * axis + (-1,)] = True
                 
-                for i, pos in enumerate(positions):
-                    if i in processed:
-                        continue
-                        
-                    # 获取临近的空洞点
-                    indices = tree.query_radius([pos], r=threshold*0.1)[0]
-                    if len(indices) >= 3:  # 最小聚类大小
-                        clusters.append({
-                            'center': np.mean(positions[indices], axis=0),
-                            'size': len(indices),
-                            'points': positions[indices].tolist()
-                        })
-                        processed.update(indices)
+                split = dirty[j][tuple(candidates.T)]
+                leaves[j] = candidates[~split]
+                subdivided = candidates[split] if j else candidates[:0]
+                stats['levels'].append({
+                    'level': j,
+                    'cell_size': resolution * (1 << j),
+                    'evaluated': len(candidates),
+                    'holes': len(leaves[j]),
+                    'subdivided': len(subdivided),
+                    'time': time.perf_counter() - level_start
+                })
+                if j:
+                    candidates = (subdivided[:, None, :] * 2 + children).reshape(-1, 3)
+                    candidates = candidates[np.all(candidates < shapes[j - 1], axis=1)]
+            
+            label_start = time.perf_counter()
+            offsets = np.cumsum([0] + [len(cells) for cells in leaves])
+            n_leaves = int(offsets[-1])
+            if n_leaves == 0:
+                return []
+            ids = []
+            for j in range(levels):
+                id_map = np.full(shapes[j], -1, dtype=np.int32)
+                id_map[tuple(leaves[j].T)] = np.arange(offsets[j], offsets[j + 1])
+                ids.append(id_map.ravel())
+                dirty[j] = dirty[j].ravel()
+            
+            # 相邻叶节点：在同层邻居单元及其祖先中查找包含它的（不小于自身的）叶节点
+            structure = generate_binary_structure(3, connectivity)
+            neighbours = np.argwhere(structure) - 1
+            neighbours = neighbours[np.any(neighbours != 0, axis=1)]
+            src, dst, contact = [], [], []
+            for a in range(levels):
+                area = float(4 ** a)
+                for offset in neighbours:
+                    nb = leaves[a] + offset
+                    source = np.arange(offsets[a], offsets[a + 1])
+                    inside = np.all((nb >= 0) & (nb < shapes[a]), axis=1)
+                    nb, source = nb[inside], source[inside]
+                    for j in range(a, levels):
+                        anc = nb >> (j - a)
+                        anc = (anc[:, 0] * shapes[j][1] + anc[:, 1]) * shapes[j][2] + anc[:, 2]
+                        found = ids[j][anc]
+                        hit = found >= 0
+                        src.append(source[hit])
+                        dst.append(found[hit])
+                        # 面相邻的接触面积：同层双向各记一次，跨层只从较小的叶节点记一次
+                        face = np.count_nonzero(offset) == 1
+                        contact.append(np.full(np.count_nonzero(hit), area * (1 if j == a else 2) * face))
+                        keep = ~hit & ~dirty[j][anc]
+                        nb, source = nb[keep], source[keep]
+                        if len(nb) == 0:
+                            break
+            src, dst, contact = np.concatenate(src), np.concatenate(dst), np.concatenate(contact)
+            graph = coo_matrix((np.ones(len(src)), (src, dst)), shape=(n_leaves, n_leaves))
+            n_labels, component = connected_components(graph, directed=False)
+            
+            # 叶节点按体素加权统计；连通域按首个体素的光栅顺序编号，与 scipy.ndimage.label 一致
+            scale = np.concatenate([np.full(len(leaves[j]), 1 << j) for j in range(levels)])
+            lower_cells = np.concatenate(leaves) * scale[:, None]
+            upper_cells = lower_cells + scale[:, None] - 1
+            volume = scale.astype(float) ** 3
+            first = np.full(n_labels, np.iinfo(np.int64).max)
+            np.minimum.at(first, component, np.ravel_multi_index(lower_cells.T, shape))
+            order = np.argsort(first)
+            rank = np.empty(n_labels, dtype=np.int64)
+            rank[order] = np.arange(1, n_labels + 1)
+            labels = rank[component]
+            
+            sizes = np.bincount(labels, weights=volume, minlength=n_labels + 1)
+            centers = np.column_stack([
+                np.bincount(labels, weights=volume * (lower_cells[:, i] + (scale - 1) / 2), minlength=n_labels + 1)
+                for i in range(3)
+            ]) / np.maximum(sizes, 1)[:, None]
+            lower = np.full((n_labels + 1, 3), np.iinfo(np.int64).max)
+            upper = np.full((n_labels + 1, 3), -1)
+            for i in range(3):
+                np.minimum.at(lower[:, i], labels, lower_cells[:, i])
+                np.maximum.at(upper[:, i], labels, upper_cells[:, i])
+            faces = (np.bincount(labels, weights=6.0 * scale ** 2, minlength=n_labels + 1)
+                     - np.bincount(labels[src], weights=contact, minlength=n_labels + 1))
             
-            return clusters
+            stats['label_time'] = time.perf_counter() - label_start
+            stats['leaves'] = n_leaves
+            stats['evaluated'] = sum(level['evaluated'] for level in stats['levels'])
+            stats['time'] = time.perf_counter() - start
+            self.last_level_stats = stats
+            return self._cluster_dicts(sizes, centers, lower, upper, faces, origin, resolution, min_size)
             
         except Exception as e:
-            self.logger.error(f"Hole detection failed: {str(e)}")
+            self.logger.error(f"Hierarchical hole detection failed: {str(e)}")
             return None
+    
+    def detect_unknown_regions(self, log_odds_grid, min_size=3, connectivity=1):
+        """
+        检测与已知自由空间相邻的未观测区域（射线从未到达的体素）
+        """
+        try:
+            # 体素中心坐标
+            origin = log_odds_grid.origin + 0.5 * log_odds_grid.resolution
+            return self._label_clusters(log_odds_grid.frontier_mask(), origin, log_odds_grid.resolution,
+                                        min_size, connectivity)
+            
+        except Exception as e:
+            self.logger.error(f"Unknown region detection failed: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _label_clusters(mask, origin, resolution, min_size=3, connectivity=1):
+        """
+        对体素掩码做连通域标记并统计每个连通域的质心、范围、体积和边界面积
+        """
+        if not np.any(mask):
+            return []
+        
+        from scipy.ndimage import label, generate_binary_structure
+        
+        # 连通域标记
+        structure = generate_binary_structure(3, connectivity)
+        labels, n_labels = label(mask, structure=structure)
+        
+        indices = np.argwhere(mask)
+        mask_labels = labels[mask]
+        sizes = np.bincount(mask_labels, minlength=n_labels + 1)
+        centers = np.column_stack([
+            np.bincount(mask_labels, weights=indices[:, i], minlength=n_labels + 1) for i in range(3)
+        ]) / np.maximum(sizes, 1)[:, None]
+        
+        # 每个连通域的体素范围
+        lower = np.full((n_labels + 1, 3), np.iinfo(np.int64).max)
+        upper = np.full((n_labels + 1, 3), -1)
+        np.minimum.at(lower, mask_labels, indices)
+        np.maximum.at(upper, mask_labels, indices)
+        
+        # 边界面积：统计掩码内体素与掩码外体素（或网格外）之间的面
+        faces = np.zeros(n_labels + 1, dtype=np.int64)
+        padded = np.pad(labels, 1)
+        for axis in range(3):
+            for shift in (1, -1):
+                neighbour = np.roll(padded, shift, axis=axis)[1:-1, 1:-1, 1:-1]
+                boundary = mask & (neighbour != labels)
+                faces += np.bincount(labels[boundary], minlength=n_labels + 1)
+        
+        return CoverageDetector._cluster_dicts(sizes, centers, lower, upper, faces, origin, resolution, min_size)
+    
+    @staticmethod
+    def _cluster_dicts(sizes, centers, lower, upper, faces, origin, resolution, min_size):
+        """
+        将逐连通域的统计量（下标0为背景）转换为空洞字典列表
+        """
+        clusters = []
+        for k in np.flatnonzero(sizes >= min_size):
+            if k == 0:
+                continue
+            clusters.append({
+                'center': origin + centers[k] * resolution,
+                'size': int(sizes[k]),
+                'extent': (origin + lower[k] * resolution,
+                           origin + upper[k] * resolution),
+                'volume': float(sizes[k] * resolution ** 3),
+                'surface_area': float(faces[k] * resolution ** 2)
+            })
+        
+        return clusters
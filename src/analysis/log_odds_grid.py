@@ -0,0 +1,120 @@
+"""
+Log-odds occupancy grid with ray-cast free-space carving
+对数几率占据栅格：沿超声波测量射线标记自由空间，在命中处标记占据
+"""
+import numpy as np
+import logging
+from config import *
+
+class LogOddsGrid:
+    def __init__(self, bounds_min, bounds_max, resolution=FREE_SPACE_RESOLUTION):
+        self.logger = logging.getLogger(__name__)
+        self.origin = np.asarray(bounds_min, dtype=float)
+        self.resolution = resolution
+        self.shape = tuple(int(n) for n in np.maximum(np.ceil((np.asarray(bounds_max) - self.origin) / resolution), 1))
+        self.log_odds = np.zeros(self.shape, dtype=np.float32)
+        self.rays_integrated = 0
+    
+    def integrate_rays(self, origins, endpoints, hits=None, batch_size=RAY_BATCH_SIZE):
+        """
+        分批积分测量射线：射线经过的体素降低占据概率，命中体素提高占据概率
+        hits: 布尔数组，False表示最大量程读数（无命中），默认全部命中
+        """
+        try:
+            origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+            endpoints = np.asarray(endpoints, dtype=float).reshape(-1, 3)
+            hits = np.ones(len(origins), dtype=bool) if hits is None else np.asarray(hits, dtype=bool)
+            
+            flat = self.log_odds.reshape(-1)
+            for start in range(0, len(origins), batch_size):
+                batch = slice(start, start + batch_size)
+                free_cells, end_cells = self._traverse(origins[batch], endpoints[batch])
+                
+                # 同一体素被多条射线经过时累加更新
+                free_index = self._flat_index(free_cells)
+                cells, counts = np.unique(free_index, return_counts=True)
+                flat[cells] += LOG_ODDS_MISS * counts
+                
+                hit_index = self._flat_index(end_cells[hits[batch]])
+                cells, counts = np.unique(hit_index, return_counts=True)
+                flat[cells] += LOG_ODDS_HIT * counts
+            
+            np.clip(self.log_odds, LOG_ODDS_MIN, LOG_ODDS_MAX, out=self.log_odds)
+            self.rays_integrated += len(origins)
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Ray integration failed: {str(e)}")
+            return False
+    
+    def _traverse(self, origins, endpoints):
+        """
+        向量化的三维DDA（Amanatides-Woo）遍历：所有射线同步逐体素前进
+        返回射线经过的体素（不含终点）和终点体素的网格坐标
+        """
+        start = (origins - self.origin) / self.resolution
+        end = (endpoints - self.origin) / self.resolution
+        direction = end - start
+        
+        cell = np.floor(start).astype(np.int64)
+        end_cells = np.floor(end).astype(np.int64)
+        step = np.sign(direction).astype(np.int64)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_delta = np.where(direction != 0, np.abs(1.0 / direction), np.inf)
+            boundary = np.where(step > 0, cell + 1, cell)
+            t_max = np.where(direction != 0, (boundary - start) / direction, np.inf)
+        
+        n_steps = np.abs(end_cells - cell).sum(axis=1)
+        free = []
+        for s in range(int(n_steps.max(initial=0))):
+            active = np.flatnonzero(n_steps > s)
+            free.append(cell[active].copy())
+            
+            # 沿最先到达体素边界的轴前进一步
+            axis = np.argmin(t_max[active], axis=1)
+            cell[active, axis] += step[active, axis]
+            t_max[active, axis] += t_delta[active, axis]
+        
+        free_cells = np.concatenate(free) if free else np.empty((0, 3), dtype=np.int64)
+        return free_cells, end_cells
+    
+    def _flat_index(self, cells):
+        """
+        网格坐标转换为展平索引，丢弃网格外的体素
+        """
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        return np.ravel_multi_index(cells[inside].T, self.shape)
+    
+    def values_at(self, points):
+        """
+        查询点所在体素的对数几率，网格外返回0（未知）
+        """
+        cells = np.floor((np.asarray(points, dtype=float).reshape(-1, 3) - self.origin) / self.resolution).astype(np.int64)
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        values = np.zeros(len(cells), dtype=np.float32)
+        values[inside] = self.log_odds[tuple(cells[inside].T)]
+        return values
+    
+    def is_free(self, point):
+        return bool(self.values_at(point)[0] < FREE_SPACE_THRESHOLD)
+    
+    @property
+    def free_mask(self):
+        return self.log_odds < FREE_SPACE_THRESHOLD
+    
+    @property
+    def occupied_mask(self):
+        return self.log_odds > OCCUPIED_SPACE_THRESHOLD
+    
+    @property
+    def unknown_mask(self):
+        return ~(self.free_mask | self.occupied_mask)
+    
+    def frontier_mask(self):
+        """
+        与已知自由空间相邻的未知体素，即值得观测的目标
+        """
+        from scipy.ndimage import binary_dilation
+        
+        return self.unknown_mask & binary_dilation(self.free_mask)
@@ -0,0 +1,113 @@
+"""
+Incrementally maintained sparse occupancy map
+增量维护的稀疏占据地图，用于快速估计扫描完成度
+"""
+import itertools
+import numpy as np
+import logging
+from config import *
+from global_map import as_coords, voxel_keys
+
+# 网格点及其26个相邻网格点的偏移
+_NEIGHBOURS = np.array(list(itertools.product((-1, 0, 1), repeat=3)), dtype=np.int64)
+
+class OccupancyMap:
+    """
+    与可见性地图定义相同的覆盖统计：网格点 3x3x3 邻域内有点即为已覆盖，完成度为包围盒内已覆盖网格点的比例
+    只处理新增的点；分辨率与 CoverageDetector 相同，包围盒扩大使其变粗超过容差时 stale 为真，需用全部点重建
+    """
+    def __init__(self, resolution=VISIBILITY_RESOLUTION, max_voxels=VISIBILITY_MAX_VOXELS,
+                 tolerance=OCCUPANCY_RESOLUTION_TOLERANCE):
+        self.logger = logging.getLogger(__name__)
+        self.base_resolution = resolution
+        self.max_voxels = max_voxels
+        self.tolerance = tolerance
+        self.reset()
+    
+    def reset(self):
+        """
+        清空地图及所有累计统计
+        """
+        self.resolution = None
+        self.min_bound = None
+        self.max_bound = None
+        self.total_points = 0
+        # 已覆盖网格点的键(有序)及其网格坐标
+        self._keys = np.empty(0, dtype=np.int64)
+        self._cells = np.empty((0, 3), dtype=np.int64)
+    
+    def target_resolution(self):
+        """
+        当前包围盒下可见性地图使用的分辨率(与 CoverageDetector._quantize 相同)
+        """
+        extent = self.max_bound - self.min_bound
+        resolution = self.base_resolution
+        if np.prod(np.maximum(np.ceil(extent / resolution), 1)) > self.max_voxels:
+            resolution = float(np.cbrt(np.prod(np.maximum(extent, resolution)) / self.max_voxels))
+        return resolution
+    
+    @property
+    def stale(self):
+        """
+        包围盒扩大后可见性地图的分辨率比当前分辨率粗出容差以上
+        """
+        return self.resolution is not None and self.target_resolution() > self.resolution * (1 + self.tolerance)
+    
+    def update(self, coords):
+        """
+        只用新增的点更新包围盒和已覆盖网格点，返回新覆盖的网格点数
+        """
+        try:
+            coords = as_coords(coords)
+            if len(coords) == 0:
+                return 0
+            
+            low, high = coords.min(axis=0), coords.max(axis=0)
+            self.min_bound = low if self.min_bound is None else np.minimum(self.min_bound, low)
+            self.max_bound = high if self.max_bound is None else np.maximum(self.max_bound, high)
+            if self.resolution is None:
+                self.resolution = self.target_resolution()
+            self.total_points += len(coords)
+            
+            # 点量化到最近的网格点，该网格点及其相邻网格点都被覆盖
+            cells = np.floor(coords / self.resolution + 0.5).astype(np.int64)
+            _, first = np.unique(voxel_keys(cells + 0.5, 1.0), return_index=True)
+            neighbours = (cells[first][:, None, :] + _NEIGHBOURS).reshape(-1, 3)
+            keys, first = np.unique(voxel_keys(neighbours + 0.5, 1.0), return_index=True)
+            fresh = ~np.isin(keys, self._keys, assume_unique=True)
+            
+            self._keys = np.union1d(self._keys, keys[fresh])
+            self._cells = np.concatenate([self._cells, neighbours[first[fresh]]])
+            return int(np.count_nonzero(fresh))
+        
+        except Exception as e:
+            self.logger.error(f"Occupancy map update failed: {str(e)}")
+            return 0
+    
+    def _grid_bounds(self):
+        return (np.floor(self.min_bound / self.resolution + 0.5).astype(np.int64),
+                np.floor(self.max_bound / self.resolution + 0.5).astype(np.int64))
+    
+    @property
+    def covered_voxels(self):
+        """
+        包围盒内已覆盖的网格点数
+        """
+        if self.resolution is None:
+            return 0
+        low, high = self._grid_bounds()
+        return int(np.count_nonzero(np.all((self._cells >= low) & (self._cells <= high), axis=1)))
+    
+    @property
+    def total_voxels(self):
+        if self.resolution is None:
+            return 0
+        low, high = self._grid_bounds()
+        return int(np.prod(high - low + 1))
+    
+    def completion(self):
+        """
+        已覆盖网格点占包围盒网格点的比例
+        """
+        total = self.total_voxels
+        return self.covered_voxels / total if total else 0.0
@@ -1,14 +1,41 @@
 """
 Scanning path planning and optimization
 """
+import time
+import heapq
 import numpy as np
-from scipy.optimize import minimize
+from concurrent.futures import ProcessPoolExecutor
 import logging
 from config import *
 
+
+def _optimize_hole_chunk(task):
+    """
+    在工作进程中优化一组空洞的视点（模块级函数以便进程池序列化）
+    每个空洞使用由 (种子, 空洞编号) 派生的独立随机数生成器，结果与工作进程数无关
+    """
+    chunk, constraints, seed = task
+    planner = PathPlanner()
+    results = []
+    for index, target, normal in chunk:
+        start = time.perf_counter()
+        rng = np.random.default_rng([seed, index])
+        viewpoint, score = planner.optimize_viewpoint(target, constraints, normal, rng=rng)
+        results.append((index, viewpoint, score, time.perf_counter() - start))
+    return results
+
+
 class PathPlanner:
-    def __init__(self):
+    def __init__(self, cost_model=None):
         self.logger = logging.getLogger(__name__)
+        # 视点间转动与采集时间的预测模型(ScanCostModel)，扫描优化器设置为其共享的标定模型
+        self.cost_model = cost_model
+        # 按约束缓存的候选视点网格
+        self._lattice_cache = {}
+        # 最近一次逐空洞优化的耗时与成功率统计
+        self.last_planning_stats = {}
+        # 最近一次扫描序列的预测转动时间与贪心基准对比
+        self.last_sequence_stats = {}
         
     def calculate_view_score(self, viewpoint, target, normal=None):
         """
@@ -35,9 +62,10 @@ class PathPlanner:
             self.logger.error(f"View score calculation failed: {str(e)}")
             return 0.0
     
-    def optimize_viewpoint(self, target, constraints, normal=None):
+    def optimize_viewpoint(self, target, constraints, normal=None, rng=None):
         """
         优化单个目标点的观测视点
+        rng: 随机初始点使用的随机数生成器，None时使用全局 np.random
         """
         try:
             # 定义目标函数（最大化观测分数）
@@ -51,12 +79,14 @@ class PathPlanner:
                 (constraints['z_min'], constraints['z_max'])
             ]
             
+            from scipy.optimize import minimize
+            
             # 从多个初始点开始优化
             best_score = float('-inf')
             best_viewpoint = None
             
             for _ in range(5):  # 尝试多个随机初始点
-                x0 = np.random.uniform(
+                x0 = (rng or np.random).uniform(
                     [b[0] for b in bounds],
                     [b[1] for b in bounds]
                 )
@@ -68,9 +98,17 @@ class PathPlanner:
                     method='L-BFGS-B'
                 )
                 
-                if result.success and -result.fun > best_score:
-                    best_score = -result.fun
-                    best_viewpoint = result.x
+                if not result.success:
+                    continue
+                
+                # 分数随距离单调增大，最优点会落到目标上；投影回传感器量程内再评分
+                viewpoint = self.standoff_projection(result.x, target)
+                if np.any(viewpoint < [b[0] for b in bounds]) or np.any(viewpoint > [b[1] for b in bounds]):
+                    continue
+                score = self.calculate_view_score(viewpoint, target, normal)
+                if score > best_score:
+                    best_score = score
+                    best_viewpoint = viewpoint
             
             return best_viewpoint, best_score
             
@@ -78,29 +116,114 @@ class PathPlanner:
             self.logger.error(f"Viewpoint optimization failed: {str(e)}")
             return None, None
     
-    def plan_scanning_path(self, holes, robot_constraints):
+    def generate_candidate_lattice(self, constraints, spacing=VIEWPOINT_LATTICE_SPACING):
+        """
+        生成机器人工作空间内的候选视点网格（按约束缓存）
+        """
+        key = (tuple(sorted(constraints.items())), spacing)
+        if key not in self._lattice_cache:
+            axes = [
+                np.arange(constraints[f'{axis}_min'], constraints[f'{axis}_max'] + spacing / 2, spacing)
+                for axis in 'xyz'
+            ]
+            grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+            self._lattice_cache[key] = np.minimum(grid, [constraints[f'{axis}_max'] for axis in 'xyz'])
+        return self._lattice_cache[key]
+    
+    def score_matrix(self, candidates, targets, normals=None):
+        """
+        批量计算 (候选视点 × 目标点) 的观测分数矩阵，与 calculate_view_score 的定义一致
+        """
+        view_dirs = targets[None, :, :] - candidates[:, None, :]
+        distances = np.maximum(np.linalg.norm(view_dirs, axis=2), 1e-12)
+        scores = 1.0 / (1.0 + distances)
+        
+        if normals is not None:
+            cosines = np.einsum('mtk,tk->mt', view_dirs, normals) / distances
+            scores *= np.clip(cosines, 0.0, None)
+        
+        return scores
+    
+    @staticmethod
+    def standoff_projection(points, targets):
+        """
+        沿目标到视点的方向把视点投影到传感器量程 [MIN_SCAN_DISTANCE, MAX_SCAN_DISTANCE] 内
+        与目标重合的视点沿 +z 方向后退
+        """
+        points = np.asarray(points, dtype=float)
+        targets = np.asarray(targets, dtype=float)
+        offsets = points - targets
+        distances = np.linalg.norm(offsets, axis=-1, keepdims=True)
+        units = np.where(distances > 1e-9, offsets / np.maximum(distances, 1e-9), [0.0, 0.0, 1.0])
+        return targets + units * np.clip(distances, MIN_SCAN_DISTANCE, MAX_SCAN_DISTANCE)
+    
+    def refine_viewpoints(self, viewpoints, targets, constraints, normals=None,
+                          step=VIEWPOINT_LATTICE_SPACING, iterations=VIEWPOINT_REFINE_ITERATIONS):
+        """
+        对一批视点同时做局部细化：沿分数梯度方向试探步长，改善则接受，否则步长减半
+        视点始终保持在目标的传感器量程内，且对准目标(目标位于声波锥的轴线上)；
+        投影后超出工作空间的视点分数为0
+        """
+        lower = np.array([constraints[f'{axis}_min'] for axis in 'xyz'], dtype=float)
+        upper = np.array([constraints[f'{axis}_max'] for axis in 'xyz'], dtype=float)
+        
+        def scores_of(points):
+            view_dirs = targets - points
+            distances = np.maximum(np.linalg.norm(view_dirs, axis=1), 1e-12)
+            scores = 1.0 / (1.0 + distances)
+            if normals is not None:
+                scores *= np.clip(np.einsum('ij,ij->i', view_dirs, normals) / distances, 0.0, None)
+            inside = np.all((points >= lower) & (points <= upper), axis=1)
+            return np.where(inside, scores, 0.0)
+        
+        points = self.standoff_projection(viewpoints, targets)
+        scores = scores_of(points)
+        steps = np.full(len(points), float(step))
+        
+        for _ in range(iterations):
+            view_dirs = targets - points
+            distances = np.maximum(np.linalg.norm(view_dirs, axis=1), 1e-12)
+            units = view_dirs / distances[:, None]
+            
+            # 分数对视点位置的解析梯度
+            if normals is None:
+                gradient = units / (1.0 + distances[:, None]) ** 2
+            else:
+                cosines = np.einsum('ij,ij->i', units, normals)
+                tangent = normals - cosines[:, None] * units
+                gradient = (-tangent / distances[:, None] / (1.0 + distances[:, None])
+                            + cosines[:, None] * units / (1.0 + distances[:, None]) ** 2)
+            norms = np.linalg.norm(gradient, axis=1)
+            direction = np.where(norms[:, None] > 0, gradient / np.maximum(norms, 1e-12)[:, None], 0.0)
+            
+            trial = self.standoff_projection(points + steps[:, None] * direction, targets)
+            trial_scores = scores_of(trial)
+            improved = trial_scores > scores
+            points[improved] = trial[improved]
+            scores[improved] = trial_scores[improved]
+            steps[~improved] *= 0.5
+        
+        return points, scores
+    
+    def plan_scanning_path(self, holes, robot_constraints, method='lattice',
+                           top_k=VIEWPOINT_REFINE_TOP_K, min_score=0.0, workers=1, seed=PLANNING_SEED):
         """
         规划扫描路径以覆盖检测到的空洞区域
+        method: 'lattice' 在候选视点网格上批量评分并细化前top_k个候选，'optimize' 逐个空洞做L-BFGS-B优化
+        workers: 'optimize' 方法使用的进程数，seed: 各空洞随机初始点的基础种子
+        min_score: 最小分数阈值；视点保持在传感器量程内，分数不超过 1/(1+MIN_SCAN_DISTANCE)，
+        默认只丢弃分数为0(超出工作空间或背对空洞)的视点
         """
         try:
             viewpoints = []
             
-            # 对每个空洞区域规划观测点
-            for hole in holes:
-                target = np.array(hole['center'])
-                
-                # 优化视点位置
-                viewpoint, score = self.optimize_viewpoint(
-                    target,
-                    robot_constraints
-                )
-                
-                if viewpoint is not None and score > 0.1:  # 设置最小分数阈值
-                    viewpoints.append({
-                        'position': viewpoint.tolist(),
-                        'target': target.tolist(),
-                        'score': score
-                    })
+            if method == 'lattice':
+                viewpoints = self._plan_on_lattice(holes, robot_constraints, top_k)
+            else:
+                viewpoints = self._plan_per_hole(holes, robot_constraints, workers, seed)
+            
+            # 设置最小分数阈值
+            viewpoints = [vp for vp in viewpoints if vp['score'] > min_score]
             
             # 对视点进行排序和优化
             if viewpoints:
@@ -125,40 +248,440 @@ class PathPlanner:
             self.logger.error(f"Path planning failed: {str(e)}")
             return None
 
-    def generate_scanning_sequence(self, viewpoints):
+    def _plan_per_hole(self, holes, robot_constraints, workers=1, seed=PLANNING_SEED):
+        """
+        逐个空洞优化视点，可分块分发到进程池并行执行
+        """
+        start = time.perf_counter()
+        tasks = [
+            (i, np.array(hole['center'], dtype=float),
+             np.array(hole['normal'], dtype=float) if 'normal' in hole else None)
+            for i, hole in enumerate(holes)
+        ]
+        
+        # 分块提交以减少进程间通信开销
+        workers = max(1, workers or 1)
+        chunk_size = max(1, int(np.ceil(len(tasks) / (workers * PLANNING_CHUNKS_PER_WORKER))))
+        chunks = [(tasks[i:i + chunk_size], robot_constraints, seed)
+                  for i in range(0, len(tasks), chunk_size)]
+        
+        if workers == 1 or len(chunks) <= 1:
+            results = [r for chunk in chunks for r in _optimize_hole_chunk(chunk)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = [r for part in executor.map(_optimize_hole_chunk, chunks) for r in part]
+        
+        viewpoints, per_hole = [], []
+        for index, viewpoint, score, elapsed in sorted(results, key=lambda r: r[0]):
+            success = viewpoint is not None
+            per_hole.append({'index': index, 'time': elapsed, 'success': success, 'score': score})
+            if success:
+                viewpoints.append({
+                    'position': viewpoint.tolist(),
+                    'target': tasks[index][1].tolist(),
+                    'score': score
+                })
+        
+        wall_time = time.perf_counter() - start
+        self.last_planning_stats = {
+            'holes': len(tasks),
+            'succeeded': len(viewpoints),
+            'workers': workers,
+            'wall_time': wall_time,
+            'holes_per_second': len(tasks) / wall_time if wall_time > 0 else 0.0,
+            'per_hole': per_hole
+        }
+        return viewpoints
+    
+    def _plan_on_lattice(self, holes, robot_constraints, top_k):
+        """
+        用分数矩阵为所有空洞一次选出最佳的候选视点，并只对前top_k个候选做局部细化
         """
-        生成优化的扫描序列，考虑机器人运动成本
+        if not holes:
+            return []
+        
+        targets = np.array([hole['center'] for hole in holes], dtype=float)
+        normals = None
+        if all('normal' in hole for hole in holes):
+            normals = np.array([hole['normal'] for hole in holes], dtype=float)
+        
+        candidates = self.generate_candidate_lattice(robot_constraints)
+        top_k = max(1, min(top_k, len(candidates)))
+        
+        # 按目标分块计算分数矩阵以限制内存
+        chunk = max(1, VIEWPOINT_SCORE_CHUNK // len(candidates))
+        best = np.empty((len(targets), top_k), dtype=np.int64)
+        for start in range(0, len(targets), chunk):
+            part = slice(start, start + chunk)
+            scores = self.score_matrix(candidates, targets[part],
+                                       normals[part] if normals is not None else None)
+            best[part] = np.argpartition(-scores, top_k - 1, axis=0)[:top_k].T
+        
+        # 同时细化所有 (目标, 候选) 对，再为每个目标选出分数最高的一个
+        starts = candidates[best.reshape(-1)]
+        repeated_targets = np.repeat(targets, top_k, axis=0)
+        repeated_normals = np.repeat(normals, top_k, axis=0) if normals is not None else None
+        points, scores = self.refine_viewpoints(starts, repeated_targets, robot_constraints,
+                                                repeated_normals)
+        points = points.reshape(len(targets), top_k, 3)
+        scores = scores.reshape(len(targets), top_k)
+        choice = np.argmax(scores, axis=1)
+        
+        return [
+            {'position': points[i, choice[i]].tolist(),
+             'target': targets[i].tolist(),
+             'score': float(scores[i, choice[i]])}
+            for i in range(len(targets))
+        ]
+    
+    @staticmethod
+    def viewpoint_angles(position, target):
+        """
+        视点对准目标所需的水平/垂直电机绝对角度(度)
+        execute_scanning_sequence 按目标角度与当前编码器读数之差转动电机，序列代价即实际转动量
+        """
+        position = np.asarray(position, dtype=float)
+        target = np.asarray(target, dtype=float)
+        delta = target - position
+        h_angle = np.degrees(np.arctan2(delta[..., 1], delta[..., 0]))
+        v_angle = np.degrees(np.arctan2(delta[..., 2], np.hypot(delta[..., 0], delta[..., 1])))
+        return h_angle, v_angle
+    
+    @property
+    def motion_model(self):
+        """
+        时间预测模型，未设置时使用默认参数的 ScanCostModel
+        """
+        if self.cost_model is None:
+            # scan_cost_model 依赖本模块的 viewpoint_angles，在此处导入以避免循环导入
+            from scan_cost_model import ScanCostModel
+            self.cost_model = ScanCostModel()
+        return self.cost_model
+    
+    def estimate_view_time(self, from_angles, to_angles):
+        """
+        估计从当前电机角度转到目标视点并完成采集所需的时间(秒)：转动时间加稳定等待和传感器读取
+        """
+        model = self.motion_model
+        return model.motion_time(from_angles, to_angles) + model.params['settle_time'] + model.params['read_time']
+    
+    def select_next_best_views(self, holes, robot_constraints, current_angles=(0.0, 0.0),
+                               target_coverage=0.9, max_views=None,
+                               candidates_per_hole=NBV_CANDIDATES_PER_HOLE):
+        """
+        按“预期揭示的空洞量 / 运动加采集时间”贪心选择视点（带惰性重评估的子模集合覆盖）
+        空洞权重依次取 surface_area、volume、size，视点能看到位于量程内且在声波锥角内的空洞
+        返回按访问顺序排列的视点及达到的覆盖率和预计总时间
         """
         try:
-            if not viewpoints:
-                return []
+            if not holes:
+                return {'viewpoints': [], 'coverage': 1.0, 'total_time': 0.0}
+            
+            targets, weights, positions, aims, visible = self.next_best_view_candidates(
+                holes, robot_constraints, candidates_per_hole)
+            total_weight = weights.sum()
+            if len(positions) == 0:
+                return {'viewpoints': [], 'coverage': 0.0, 'total_time': 0.0}
             
-            # 使用简单的贪心算法
-            sequence = [0]  # 从第一个视点开始
-            unvisited = set(range(1, len(viewpoints)))
-            current = 0
+            h_angles, v_angles = self.viewpoint_angles(positions, targets[aims])
+            min_time = self.motion_model.params['settle_time'] + self.motion_model.params['read_time']
             
-            while unvisited:
-                # 找到距离当前位置最近的未访问视点
-                current_pos = np.array(viewpoints[current]['position'])
-                min_dist = float('inf')
-                next_point = None
+            # 惰性贪心：堆中的键为 增益/最小时间 的上界（增益只会随已揭示空洞增加而减小）
+            revealed = np.zeros(len(targets), dtype=bool)
+            gains = visible @ weights
+            heap = [(-gains[p] / min_time, p) for p in range(len(positions)) if gains[p] > 0]
+            heapq.heapify(heap)
+            
+            current = tuple(current_angles)
+            plan, total_time = [], 0.0
+            while heap and weights[revealed].sum() < target_coverage * total_weight:
+                if max_views is not None and len(plan) >= max_views:
+                    break
+                
+                # 只重评估上界超过当前最佳真实比值的候选
+                best, evaluated = None, []
+                while heap and (best is None or -heap[0][0] > best[0]):
+                    _, p = heapq.heappop(heap)
+                    gain = weights[visible[p] & ~revealed].sum()
+                    if gain <= 0:
+                        continue
+                    view_time = float(self.estimate_view_time(current, (h_angles[p], v_angles[p])))
+                    evaluated.append((gain, p))
+                    if best is None or gain / view_time > best[0]:
+                        best = (gain / view_time, p, gain, view_time)
                 
-                for i in unvisited:
-                    pos = np.array(viewpoints[i]['position'])
-                    dist = np.linalg.norm(pos - current_pos)
-                    
-                    if dist < min_dist:
-                        min_dist = dist
-                        next_point = i
+                if best is None:
+                    break
+                ratio, p, gain, view_time = best
+                for other_gain, other in evaluated:
+                    if other != p:
+                        heapq.heappush(heap, (-other_gain / min_time, other))
                 
-                sequence.append(next_point)
-                unvisited.remove(next_point)
-                current = next_point
+                plan.append({
+                    'position': positions[p].tolist(),
+                    'target': targets[aims[p]].tolist(),
+                    'score': float(ratio),
+                    'gain': float(gain),
+                    'time': view_time
+                })
+                revealed |= visible[p]
+                total_time += view_time
+                current = (h_angles[p], v_angles[p])
+            
+            return {
+                'viewpoints': plan,
+                'coverage': float(weights[revealed].sum() / total_weight) if total_weight else 1.0,
+                'total_time': total_time
+            }
+            
+        except Exception as e:
+            self.logger.error(f"Next-best-view selection failed: {str(e)}")
+            return None
+    
+    def next_best_view_candidates(self, holes, robot_constraints, candidates_per_hole=NBV_CANDIDATES_PER_HOLE):
+        """
+        下一最佳视点的候选集合：每个空洞选取量程内最近的若干网格位置，视点对准该空洞
+        返回空洞中心、权重、候选位置、候选对准的空洞编号及 (候选 × 空洞) 的布尔可见性矩阵
+        """
+        targets = np.array([hole['center'] for hole in holes], dtype=float)
+        weights = np.array([
+            hole.get('surface_area', hole.get('volume', hole.get('size', 1.0))) for hole in holes
+        ], dtype=float)
+        
+        lattice = self.generate_candidate_lattice(robot_constraints)
+        positions, aims = [np.empty((0, 3))], []
+        for i, target in enumerate(targets):
+            distances = np.linalg.norm(lattice - target, axis=1)
+            in_range = np.flatnonzero((distances >= MIN_SCAN_DISTANCE) & (distances <= MAX_SCAN_DISTANCE))
+            chosen = in_range[np.argsort(distances[in_range])[:candidates_per_hole]]
+            positions.append(lattice[chosen])
+            aims.extend([i] * len(chosen))
+        positions = np.concatenate(positions)
+        aims = np.array(aims, dtype=np.int64)
+        
+        # 可见性矩阵：空洞位于量程内且与视线夹角不超过半锥角
+        # 按候选分块计算，射线等中间数组不超过 VIEWPOINT_SCORE_CHUNK 个元素，只保留布尔结果
+        visible = np.zeros((len(positions), len(targets)), dtype=bool)
+        min_cosine = np.cos(np.radians(SENSOR_BEAM_ANGLE / 2))
+        chunk = max(1, VIEWPOINT_SCORE_CHUNK // max(len(targets), 1))
+        for start in range(0, len(positions), chunk):
+            part = slice(start, start + chunk)
+            axes = targets[aims[part]] - positions[part]
+            axes /= np.linalg.norm(axes, axis=1)[:, None]
+            rays = targets[None, :, :] - positions[part, None, :]
+            ranges = np.linalg.norm(rays, axis=2)
+            cosines = np.einsum('ptk,pk->pt', rays, axes) / np.maximum(ranges, 1e-12)
+            visible[part] = ((ranges >= MIN_SCAN_DISTANCE) & (ranges <= MAX_SCAN_DISTANCE)
+                             & (cosines >= min_cosine))
+        
+        return targets, weights, positions, aims, visible
+    
+    def _joint_cost_matrix(self, cost):
+        """
+        解析关节空间代价，返回由节点角度(Nx2)计算NxN代价矩阵的函数及最近邻初始路径所用的 Minkowski 距离阶数
+        'sequential'/'concurrent' 用时间预测模型向量化计算转动时间，'sequential' 两轴依次转动，'concurrent' 两轴同时转动
+        自定义函数 f(from_angles, to_angles) 按约定逐对调用，参数为 (水平角, 垂直角) 元组，且假定对称
+        """
+        if callable(cost):
+            def pairwise(nodes):
+                matrix = np.zeros((len(nodes), len(nodes)))
+                for i, j in zip(*np.triu_indices(len(nodes), 1)):
+                    matrix[i, j] = matrix[j, i] = float(cost(tuple(nodes[i]), tuple(nodes[j])))
+                return matrix
+            return pairwise, 2
+        if cost not in ('sequential', 'concurrent'):
+            raise ValueError(f"Unknown joint cost: {cost}")
+        p = np.inf if cost == 'concurrent' else 1
+        return (lambda nodes: self.motion_model.motion_time(nodes[:, None, :], nodes[None, :, :], axis_mode=cost)), p
+    
+    def generate_scanning_sequence(self, viewpoints, start_angles=(0.0, 0.0), cost=SEQUENCE_AXIS_MODE,
+                                   time_budget=SEQUENCE_TIME_BUDGET):
+        """
+        生成优化的扫描序列，按电机转动时间而非笛卡尔距离排序
+        从当前电机角度出发，先用KD树构建最近邻初始路径，再在时间预算内做2-opt/Or-opt改进
+        cost: 'sequential'、'concurrent' 或自定义的对称代价函数 f(from_angles, to_angles)，后者对每对视点调用一次
+        预测转动时间及与原贪心序列的对比记录在 last_sequence_stats 中
+        """
+        try:
+            if not viewpoints:
+                self.last_sequence_stats = {}
+                return []
+            
+            start = time.perf_counter()
+            cost_matrix, p = self._joint_cost_matrix(cost)
+            
+            # 节点0为当前电机姿态，其余为各视点对应的电机角度
+            positions = np.array([vp['position'] for vp in viewpoints], dtype=float)
+            targets = np.array([vp['target'] for vp in viewpoints], dtype=float)
+            angles = np.column_stack(self.viewpoint_angles(positions, targets))
+            nodes = np.vstack([np.asarray(start_angles, dtype=float), angles])
+            matrix = cost_matrix(nodes)
+            
+            tour = self._nearest_neighbour_tour(nodes, p)
+            initial_time = self._tour_cost(tour, matrix)
+            tour, moves = self._improve_tour(tour, matrix, start + time_budget)
+            
+            # 原贪心序列(笛卡尔最近邻、从第一个视点开始)作为对比基准
+            baseline = np.concatenate([[0], self._greedy_order(positions) + 1])
+            baseline_time = self._tour_cost(baseline, matrix)
+            optimized_time = self._tour_cost(tour, matrix)
+            
+            self.last_sequence_stats = {
+                'viewpoints': len(viewpoints),
+                'cost': cost if isinstance(cost, str) else getattr(cost, '__name__', 'custom'),
+                'baseline_time': baseline_time,
+                'initial_time': initial_time,
+                'optimized_time': optimized_time,
+                'improvement': 1.0 - optimized_time / baseline_time if baseline_time > 0 else 0.0,
+                'moves': moves,
+                'planning_time': time.perf_counter() - start
+            }
+            self.logger.info(
+                f"Scan sequence: {len(viewpoints)} views, predicted travel {optimized_time:.1f}s "
+                f"(greedy baseline {baseline_time:.1f}s)"
+            )
             
             # 返回优化后的视点序列
-            return [viewpoints[i] for i in sequence]
+            return [viewpoints[i - 1] for i in tour[1:]]
             
         except Exception as e:
             self.logger.error(f"Sequence generation failed: {str(e)}")
             return None
+    
+    @staticmethod
+    def _greedy_order(positions):
+        """
+        原有的笛卡尔最近邻贪心序列，从第一个视点开始
+        """
+        order = [0]
+        unvisited = np.ones(len(positions), dtype=bool)
+        unvisited[0] = False
+        for _ in range(len(positions) - 1):
+            dist = np.linalg.norm(positions - positions[order[-1]], axis=1)
+            dist[~unvisited] = np.inf
+            next_point = int(np.argmin(dist))
+            order.append(next_point)
+            unvisited[next_point] = False
+        return np.array(order, dtype=int)
+    
+    @staticmethod
+    def _nearest_neighbour_tour(nodes, p):
+        """
+        从节点0出发，借助KD树逐步访问关节空间中最近的未访问视点
+        """
+        from scipy.spatial import cKDTree
+        
+        n = len(nodes) - 1
+        tree = cKDTree(nodes[1:])
+        visited = np.zeros(n, dtype=bool)
+        tour = [0]
+        current = nodes[0]
+        for _ in range(n):
+            k = min(8, n)
+            while True:
+                _, indices = tree.query(current, k=k, p=p)
+                indices = np.atleast_1d(indices)
+                candidates = indices[~visited[indices]]
+                if len(candidates) or k == n:
+                    break
+                k = min(k * 2, n)
+            next_point = int(candidates[0])
+            visited[next_point] = True
+            tour.append(next_point + 1)
+            current = nodes[next_point + 1]
+        return np.array(tour, dtype=int)
+    
+    @staticmethod
+    def _tour_cost(tour, matrix):
+        """
+        开放路径(不返回起点)的总代价
+        """
+        return float(matrix[tour[:-1], tour[1:]].sum())
+    
+    def _improve_tour(self, tour, matrix, deadline, max_segment=SEQUENCE_OROPT_MAX_SEGMENT):
+        """
+        在截止时间前交替执行2-opt与Or-opt局部改进，起点固定、终点自由
+        返回改进后的路径及接受的移动次数
+        """
+        tour = np.array(tour, dtype=int)
+        moves = 0
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for step in (self._two_opt_pass, self._or_opt_pass):
+                tour, accepted = step(tour, matrix, deadline, max_segment)
+                if accepted:
+                    moves += accepted
+                    improved = True
+        return tour, moves
+    
+    @staticmethod
+    def _two_opt_pass(tour, matrix, deadline, max_segment=None):
+        """
+        2-opt：翻转 tour[i..j]，对每个 i 向量化地评估所有 j 并接受最优改进
+        """
+        m = len(tour)
+        accepted = 0
+        for i in range(1, m - 1):
+            if time.perf_counter() >= deadline:
+                break
+            j = np.arange(i + 1, m)
+            a, b = tour[i - 1], tour[i]
+            c = tour[j]
+            # 路径末端没有后继边
+            d = tour[np.minimum(j + 1, m - 1)]
+            has_next = j < m - 1
+            delta = (matrix[a, c] - matrix[a, b]
+                     + np.where(has_next, matrix[b, d] - matrix[c, d], 0.0))
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                tour[i:j[best] + 1] = tour[i:j[best] + 1][::-1].copy()
+                accepted += 1
+        return tour, accepted
+    
+    @staticmethod
+    def _or_opt_pass(tour, matrix, deadline, max_segment=SEQUENCE_OROPT_MAX_SEGMENT):
+        """
+        Or-opt：把长度1..max_segment的连续视点段(可翻转)移到路径中的其他位置
+        """
+        accepted = 0
+        for length in range(1, max_segment + 1):
+            s = 1
+            while s + length <= len(tour):
+                if time.perf_counter() >= deadline:
+                    return tour, accepted
+                m = len(tour)
+                first, last = tour[s], tour[s + length - 1]
+                prev = tour[s - 1]
+                after = tour[s + length] if s + length < m else None
+                
+                # 移除该段节省的代价
+                gain = matrix[prev, first]
+                if after is not None:
+                    gain += matrix[last, after] - matrix[prev, after]
+                
+                rest = np.concatenate([tour[:s], tour[s + length:]])
+                u = rest
+                v = np.append(rest[1:], -1)
+                has_next = v >= 0
+                v_safe = np.where(has_next, v, 0)
+                # 正向与翻转两种插入方式，插入到 rest[q] 之后
+                forward = matrix[u, first] + np.where(has_next, matrix[last, v_safe] - matrix[u, v_safe], 0.0)
+                backward = matrix[u, last] + np.where(has_next, matrix[first, v_safe] - matrix[u, v_safe], 0.0)
+                # 原位置不算移动
+                forward[s - 1] = backward[s - 1] = np.inf
+                
+                q_f, q_b = int(np.argmin(forward)), int(np.argmin(backward))
+                reverse = backward[q_b] < forward[q_f]
+                q = q_b if reverse else q_f
+                insert_cost = backward[q_b] if reverse else forward[q_f]
+                
+                if insert_cost < gain - 1e-9:
+                    segment = tour[s:s + length]
+                    if reverse:
+                        segment = segment[::-1]
+                    tour = np.concatenate([rest[:q + 1], segment, rest[q + 1:]])
+                    accepted += 1
+                else:
+                    s += 1
+        return tour, accepted
@@ -0,0 +1,260 @@
+"""
+Persistent viewpoint plan cache for repeat scans of similar objects
+相似物体重复扫描的持久化视点计划缓存
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import numpy as np
+from config import *
+
+class PlanCache:
+    """
+    以物体坐标系下量化的空洞中心集合为键，在磁盘上保存有序视点序列
+    精确匹配或在容差内的近似匹配经可达性与覆盖检查后复用，超出容量时按最近最少使用淘汰
+    """
+    def __init__(self, directory=PLAN_CACHE_DIR, max_bytes=PLAN_CACHE_MAX_BYTES,
+                 quantum=PLAN_CACHE_QUANTUM, match_tolerance=PLAN_CACHE_MATCH_TOLERANCE,
+                 min_coverage=PLAN_CACHE_MIN_COVERAGE):
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.quantum = quantum
+        self.match_tolerance = match_tolerance
+        self.min_coverage = min_coverage
+        
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.time_saved = 0.0
+        
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, 'index.json')
+        self.index = self._load_index()
+    
+    @staticmethod
+    def object_frame(coords):
+        """
+        由点云的质心和主轴构建物体坐标系(4x4，物体->世界)
+        主轴方向按三阶矩的符号确定，并保证右手系
+        """
+        coords = np.asarray(coords, dtype=float)
+        frame = np.eye(4)
+        if len(coords) < 3:
+            return frame
+        centroid = coords.mean(axis=0)
+        centered = coords - centroid
+        _, eigvecs = np.linalg.eigh(centered.T @ centered)
+        axes = eigvecs[:, ::-1]
+        for i in range(2):
+            if np.sum((centered @ axes[:, i]) ** 3) < 0:
+                axes[:, i] = -axes[:, i]
+        axes[:, 2] = np.cross(axes[:, 0], axes[:, 1])
+        frame[:3, :3] = axes
+        frame[:3, 3] = centroid
+        return frame
+    
+    @staticmethod
+    def _apply(transform, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        return points @ transform[:3, :3].T + transform[:3, 3]
+    
+    def signature(self, centers):
+        """
+        物体坐标系下空洞中心的量化签名及其键
+        """
+        cells = np.unique(np.floor(np.asarray(centers) / self.quantum).astype(np.int64), axis=0)
+        key = hashlib.blake2b(cells.tobytes(), digest_size=16).hexdigest()
+        return key, cells
+    
+    def lookup(self, holes, coords, robot_constraints):
+        """
+        查找可复用的计划；返回变换到当前世界坐标系的有序视点列表，未命中返回None
+        """
+        try:
+            if not holes:
+                return None
+            start = time.perf_counter()
+            frame = self.object_frame(coords)
+            centers = np.array([hole['center'] for hole in holes], dtype=float)
+            local_centers = self._apply(np.linalg.inv(frame), centers)
+            key, _ = self.signature(local_centers)
+            
+            exact = key in self.index
+            candidate = key if exact else self._nearest_entry(local_centers)
+            if candidate is None:
+                self.misses += 1
+                return None
+            
+            entry = self._read_entry(candidate)
+            viewpoints = self._validate(entry, frame, centers, holes, robot_constraints) if entry else None
+            if viewpoints is None:
+                self.rejected += 1
+                self.misses += 1
+                return None
+            
+            if exact:
+                self.hits += 1
+            else:
+                self.near_hits += 1
+            self.time_saved += entry['planning_time'] - (time.perf_counter() - start)
+            self.index[candidate]['last_used'] = time.time()
+            self.index[candidate]['uses'] += 1
+            self._save_index()
+            return viewpoints
+        
+        except Exception as e:
+            self.logger.error(f"Plan cache lookup failed: {str(e)}")
+            return None
+    
+    def _nearest_entry(self, local_centers):
+        """
+        在空洞数相近的条目中寻找双向最近距离均在容差内的近似匹配
+        """
+        from scipy.spatial import cKDTree
+        
+        best, best_distance = None, np.inf
+        for key, meta in self.index.items():
+            if abs(meta['holes'] - len(local_centers)) > max(1, len(local_centers) // 10):
+                continue
+            cached = np.array(meta['centers'], dtype=float).reshape(-1, 3)
+            forward, _ = cKDTree(cached).query(local_centers)
+            backward, _ = cKDTree(local_centers).query(cached)
+            distance = max(forward.max(), backward.max())
+            if distance <= self.match_tolerance and distance < best_distance:
+                best, best_distance = key, distance
+        return best
+    
+    def _validate(self, entry, frame, centers, holes, robot_constraints):
+        """
+        检查缓存计划在当前位姿下是否可用：视点位于工作空间内、目标能对应到当前空洞、覆盖足够
+        """
+        from scipy.spatial import cKDTree
+        
+        positions = self._apply(frame, [vp['position'] for vp in entry['viewpoints']])
+        targets = self._apply(frame, [vp['target'] for vp in entry['viewpoints']])
+        
+        low = np.array([robot_constraints['x_min'], robot_constraints['y_min'], robot_constraints['z_min']])
+        high = np.array([robot_constraints['x_max'], robot_constraints['y_max'], robot_constraints['z_max']])
+        if np.any(positions < low) or np.any(positions > high):
+            return None
+        
+        # 目标吸附到容差内最近的当前空洞中心
+        distances, nearest = cKDTree(centers).query(targets)
+        usable = distances <= self.match_tolerance
+        
+        weights = np.array([
+            hole.get('surface_area', hole.get('volume', hole.get('size', 1.0))) for hole in holes
+        ], dtype=float)
+        covered = np.zeros(len(holes), dtype=bool)
+        covered[nearest[usable]] = True
+        if weights.sum() > 0 and weights[covered].sum() / weights.sum() < self.min_coverage:
+            return None
+        
+        return [
+            dict(vp, position=positions[i].tolist(), target=centers[nearest[i]].tolist())
+            for i, vp in enumerate(entry['viewpoints']) if usable[i]
+        ]
+    
+    def store(self, holes, coords, viewpoints, planning_time):
+        """
+        以物体坐标系保存新规划的有序视点序列
+        """
+        try:
+            if not holes or not viewpoints:
+                return False
+            frame = self.object_frame(coords)
+            to_local = np.linalg.inv(frame)
+            local_centers = self._apply(to_local, [hole['center'] for hole in holes])
+            key, _ = self.signature(local_centers)
+            positions = self._apply(to_local, [vp['position'] for vp in viewpoints])
+            targets = self._apply(to_local, [vp['target'] for vp in viewpoints])
+            
+            entry = {
+                'viewpoints': [
+                    dict(vp, position=positions[i].tolist(), target=targets[i].tolist())
+                    for i, vp in enumerate(viewpoints)
+                ],
+                'planning_time': planning_time
+            }
+            path = self._entry_path(key)
+            self._atomic_write(path, entry)
+            # 索引中保留空洞中心，近似匹配时无需读取条目文件
+            self.index[key] = {
+                'holes': len(holes),
+                'centers': np.round(local_centers, 1).tolist(),
+                'bytes': os.path.getsize(path) + local_centers.size * 8,
+                'planning_time': planning_time,
+                'last_used': time.time(),
+                'uses': 0
+            }
+            self._evict()
+            self._save_index()
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Plan cache store failed: {str(e)}")
+            return False
+    
+    def _evict(self):
+        """
+        总大小超出上限时按最近最少使用淘汰条目
+        """
+        total = sum(meta['bytes'] for meta in self.index.values())
+        for key in sorted(self.index, key=lambda k: self.index[k]['last_used']):
+            if total <= self.max_bytes or len(self.index) <= 1:
+                break
+            total -= self.index[key]['bytes']
+            del self.index[key]
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+    
+    def _entry_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+    
+    def _read_entry(self, key):
+        try:
+            with open(self._entry_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # 条目文件缺失或损坏时从索引中移除
+            self.index.pop(key, None)
+            return None
+    
+    @staticmethod
+    def _atomic_write(path, data):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_index(self):
+        self._atomic_write(self.index_path, self.index)
+    
+    def stats(self):
+        """
+        命中率、近似命中数及节省的规划时间
+        """
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'rejected': self.rejected,
+            'hit_rate': (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            'planning_time_saved': self.time_saved,
+            'entries': len(self.index),
+            'bytes': sum(meta['bytes'] for meta in self.index.values())
+        }
@@ -0,0 +1,236 @@
+"""
+Scan time prediction and motion cost model
+扫描时间预测与运动代价模型
+"""
+import os
+import json
+import logging
+from collections import deque
+import numpy as np
+from config import *
+from path_planning import PathPlanner
+
+class ScanCostModel:
+    """
+    预测扫描计划的执行时间：电机运动(梯形速度曲线) + 稳定等待 + 传感器读取 + 逐点处理
+    参数可由实际或仿真运行记录的计时自动标定
+    """
+    def __init__(self, speed=SCAN_SPEED, acceleration=MOTOR_ACCELERATION, axis_mode=SEQUENCE_AXIS_MODE,
+                 path=None, max_samples=COST_MODEL_MAX_SAMPLES):
+        self.logger = logging.getLogger(__name__)
+        self.axis_mode = axis_mode
+        self.path = path
+        self.params = {
+            'speed': float(speed),
+            'acceleration': float(acceleration),
+            'command_overhead': MOTOR_COMMAND_OVERHEAD,
+            'settle_time': VIEWPOINT_SETTLE_TIME,
+            'read_time': SENSOR_READ_TIME,
+            'point_time': POINT_PROCESSING_TIME,
+            'iteration_overhead': ITERATION_OVERHEAD
+        }
+        
+        # 有界的计时样本
+        self.samples = {
+            'move': deque(maxlen=max_samples),
+            'settle': deque(maxlen=max_samples),
+            'read': deque(maxlen=max_samples),
+            'processing': deque(maxlen=max_samples)
+        }
+        # (预测, 实际) 计划耗时，用于报告预测误差
+        self.predictions = deque(maxlen=max_samples)
+        self.calibrated = False
+        
+        if path and os.path.exists(path):
+            self.load(path)
+    
+    def axis_time(self, delta, params=None):
+        """
+        单轴转动 delta 度所需时间：梯形速度曲线，行程过短时为三角形曲线
+        """
+        params = params or self.params
+        speed, accel = params['speed'], params['acceleration']
+        delta = np.abs(np.asarray(delta, dtype=float))
+        ramp = speed * speed / accel
+        moving = np.where(delta >= ramp, delta / speed + speed / accel, 2 * np.sqrt(delta / accel))
+        return np.where(delta > 0, moving + params['command_overhead'], 0.0)
+    
+    def motion_time(self, from_angles, to_angles, params=None, axis_mode=None):
+        """
+        两组电机角度(..., 2)之间的转动时间，按 axis_mode(默认为模型的设置)取两轴之和或最大值
+        """
+        delta = np.asarray(to_angles, dtype=float) - np.asarray(from_angles, dtype=float)
+        times = self.axis_time(delta, params)
+        if (axis_mode or self.axis_mode) == 'concurrent':
+            return times.max(axis=-1)
+        return times.sum(axis=-1)
+    
+    def predict_plan(self, viewpoints, start_angles=(0.0, 0.0), points_per_view=1):
+        """
+        预测按给定顺序执行视点序列及处理所采数据的时间(秒)
+        """
+        n = len(viewpoints)
+        if n == 0:
+            return {'views': 0, 'motion': 0.0, 'settle': 0.0, 'sensing': 0.0,
+                    'processing': 0.0, 'total': 0.0, 'travel': 0.0, 'per_view': []}
+        
+        deltas = self._legs(viewpoints, start_angles)
+        motion = self.motion_time(np.zeros_like(deltas), deltas)
+        per_view = motion + self.params['settle_time'] + self.params['read_time']
+        processing = self.params['iteration_overhead'] + self.params['point_time'] * n * points_per_view
+        
+        return {
+            'views': n,
+            'travel': float(np.abs(deltas).sum()),
+            'motion': float(motion.sum()),
+            'settle': n * self.params['settle_time'],
+            'sensing': n * self.params['read_time'],
+            'processing': float(processing),
+            'total': float(per_view.sum() + processing),
+            'per_view': per_view.tolist()
+        }
+    
+    @staticmethod
+    def _legs(viewpoints, start_angles):
+        """
+        依次访问各视点时每一段的电机角度变化(n, 2)
+        """
+        positions = np.array([vp['position'] for vp in viewpoints], dtype=float).reshape(-1, 3)
+        targets = np.array([vp['target'] for vp in viewpoints], dtype=float).reshape(-1, 3)
+        angles = np.column_stack(PathPlanner.viewpoint_angles(positions, targets))
+        nodes = np.vstack([np.asarray(start_angles, dtype=float), angles])
+        return np.diff(nodes, axis=0)
+    
+    def fit_to_budget(self, viewpoints, start_angles=(0.0, 0.0), time_budget=None, travel_budget=None,
+                      points_per_view=1):
+        """
+        截取有序视点序列中能在剩余时间(秒)和电机行程(度)预算内完成的最长前缀
+        返回前缀及其预测
+        """
+        if not viewpoints:
+            return [], self.predict_plan([])
+        
+        deltas = self._legs(viewpoints, start_angles)
+        per_view = (self.motion_time(np.zeros_like(deltas), deltas)
+                    + self.params['settle_time'] + self.params['read_time']
+                    + self.params['point_time'] * points_per_view)
+        fits = np.ones(len(viewpoints), dtype=bool)
+        if time_budget is not None:
+            fits &= np.cumsum(per_view) + self.params['iteration_overhead'] <= time_budget
+        if travel_budget is not None:
+            fits &= np.cumsum(np.abs(deltas).sum(axis=1)) <= travel_budget
+        
+        count = len(viewpoints) if fits.all() else int(np.argmin(fits))
+        prefix = viewpoints[:count]
+        return prefix, self.predict_plan(prefix, start_angles, points_per_view)
+    
+    def record_move(self, delta_h, delta_v, duration):
+        self.samples['move'].append((abs(delta_h), abs(delta_v), duration))
+    
+    def record_settle(self, duration):
+        self.samples['settle'].append(duration)
+    
+    def record_read(self, duration):
+        self.samples['read'].append(duration)
+    
+    def record_processing(self, n_points, duration):
+        self.samples['processing'].append((n_points, duration))
+    
+    def record_prediction(self, predicted, actual):
+        self.predictions.append((predicted, actual))
+    
+    def calibrate(self, min_samples=COST_MODEL_MIN_SAMPLES):
+        """
+        由记录的计时样本标定模型参数，样本不足的部分保持原值
+        """
+        try:
+            updated = []
+            
+            moves = np.array(self.samples['move'], dtype=float).reshape(-1, 3)
+            moves = moves[moves[:, :2].sum(axis=1) > 0]
+            if len(moves) >= min_samples:
+                from scipy.optimize import least_squares
+                
+                # 非线性最小二乘拟合速度、加速度和指令开销
+                def residuals(x):
+                    params = dict(self.params, speed=x[0], acceleration=x[1], command_overhead=x[2])
+                    return self.motion_time(np.zeros((len(moves), 2)), moves[:, :2], params) - moves[:, 2]
+                
+                x0 = [self.params['speed'], self.params['acceleration'], self.params['command_overhead']]
+                result = least_squares(residuals, x0, bounds=([1e-3, 1e-3, 0.0], [np.inf, np.inf, np.inf]))
+                self.params.update(speed=float(result.x[0]), acceleration=float(result.x[1]),
+                                   command_overhead=float(result.x[2]))
+                updated.append('move')
+            
+            for stage, key in (('settle', 'settle_time'), ('read', 'read_time')):
+                if len(self.samples[stage]) >= min_samples:
+                    self.params[key] = float(np.median(self.samples[stage]))
+                    updated.append(stage)
+            
+            processing = np.array(self.samples['processing'], dtype=float).reshape(-1, 2)
+            if len(processing) >= min_samples:
+                if np.ptp(processing[:, 0]) > 0:
+                    # 线性拟合：固定开销 + 每点耗时
+                    A = np.column_stack([np.ones(len(processing)), processing[:, 0]])
+                    (overhead, point_time), *_ = np.linalg.lstsq(A, processing[:, 1], rcond=None)
+                    point_time = max(float(point_time), 0.0)
+                else:
+                    point_time = self.params['point_time']
+                overhead = float(np.mean(processing[:, 1] - point_time * processing[:, 0]))
+                self.params.update(iteration_overhead=max(overhead, 0.0), point_time=point_time)
+                updated.append('processing')
+            
+            if updated:
+                self.calibrated = True
+                self.logger.info(f"Cost model calibrated: {', '.join(updated)}")
+            return updated
+        
+        except Exception as e:
+            self.logger.error(f"Cost model calibration failed: {str(e)}")
+            return []
+    
+    def save(self, path=None):
+        """
+        保存标定后的参数
+        """
+        path = path or self.path
+        if not path:
+            return False
+        try:
+            with open(path, 'w') as f:
+                json.dump({'axis_mode': self.axis_mode, 'calibrated': self.calibrated,
+                           'params': self.params}, f, indent=4)
+            return True
+        except Exception as e:
+            self.logger.error(f"Failed to save cost model: {str(e)}")
+            return False
+    
+    def load(self, path):
+        """
+        加载之前保存的标定参数
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            self.params.update(data.get('params', {}))
+            self.calibrated = data.get('calibrated', False)
+            return True
+        except Exception as e:
+            self.logger.error(f"Failed to load cost model: {str(e)}")
+            return False
+    
+    def stats(self):
+        """
+        标定参数、样本数量及计划耗时的预测误差
+        """
+        report = {
+            'calibrated': self.calibrated,
+            'params': dict(self.params),
+            'samples': {stage: len(samples) for stage, samples in self.samples.items()}
+        }
+        if self.predictions:
+            predicted, actual = np.array(self.predictions, dtype=float).T
+            errors = np.abs(predicted - actual) / np.maximum(actual, 1e-9)
+            report['mean_relative_error'] = float(errors.mean())
+            report['last_relative_error'] = float(errors[-1])
+        return report
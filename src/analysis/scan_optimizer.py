@@ -1,92 +1,304 @@
-以下是 scan_optimizer.py 文件的原内容：
-Python复制
 """
 Optimization of scanning process
 """
+import time
+import hashlib
 import numpy as np
 import logging
+from collections import OrderedDict
 from config import *
+from performance_monitor import traced, count_argument
+from global_map import GlobalMap, as_coords
+from occupancy_map import OccupancyMap
+from scan_cost_model import ScanCostModel
+
+class CoverageCache:
+    """
+    有界的覆盖分析结果缓存（LRU淘汰）
+    """
+    def __init__(self, max_entries=COVERAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def fingerprint(points):
+        """
+        由点坐标计算点云指纹
+        """
+        coords = np.ascontiguousarray(as_coords(points))
+        return hashlib.blake2b(coords.tobytes(), digest_size=16).hexdigest()
+    
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+    
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def peek(self, key):
+        """
+        读取缓存但不计入命中统计、不调整淘汰顺序
+        """
+        return self.entries.get(key)
+    
+    def invalidate(self):
+        self.entries.clear()
+    
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self.entries)
+        }
+
 
 class ScanOptimizer:
-    def __init__(self, coverage_detector, path_planner):
+    def __init__(self, coverage_detector, path_planner, planning_mode='per_hole',
+                 planner_options=None, cost_model=None, plan_cache=None, hierarchical_coverage=True):
         self.logger = logging.getLogger(__name__)
         self.coverage_detector = coverage_detector
         self.path_planner = path_planner
+        # 'per_hole' 每个空洞一个视点，'nbv' 按信息增益/时间贪心选择视点，
+        # 'auto' 两种都规划并选择预测单位时间覆盖最多的计划
+        self.planning_mode = planning_mode
+        # 传给 plan_scanning_path 的额外参数，如 {'method': 'optimize', 'workers': 4}
+        self.planner_options = planner_options or {}
+        # 使用由粗到精的分层空洞检测（结果与稠密可见性地图相同），为False时构建完整的稠密可见性地图
+        self.hierarchical_coverage = hierarchical_coverage
+        
+        # 由优化器持有的增量占据地图及其对应的全局地图版本，完成度由它增量维护
+        self.occupancy = OccupancyMap()
+        self._occupancy_source = None
+        self._occupancy_version = None
+        
+        # 射线更新的自由空间栅格，由系统控制器设置
+        self.free_space = None
+        
+        # 覆盖分析结果缓存，以点云版本号或指纹为键
+        self.coverage_cache = CoverageCache()
+        # 最近一次完成度估计，供进度统计读取
+        self.last_completion = 0.0
+        
+        # 扫描时间预测模型，用于比较计划和估计剩余时间；路径规划共用同一模型
+        # 标定参数只在传入带 path 的模型时持久化
+        self.cost_model = cost_model or ScanCostModel()
+        self.path_planner.cost_model = self.cost_model
+        self.last_plan_comparison = []
         
-    def analyze_coverage(self, points):
+        # 可选的持久化视点计划缓存(PlanCache)，用于相似物体的重复扫描
+        self.plan_cache = plan_cache
+        
+    @traced('coverage', count=count_argument(1, 'points'))
+    def analyze_coverage(self, points, version=None):
         """
         分析当前扫描的覆盖情况
+        points: 点字典列表或Nx3坐标数组，系统控制器传入全局地图的坐标数组
+        version: 点云版本号（如系统控制器的计数器），未提供时使用点云指纹作为缓存键
         """
         try:
-            # 创建可见性地图
-            visibility_map = self.coverage_detector.create_visibility_map(points)
+            key = ('version', version) if version is not None else ('fingerprint', CoverageCache.fingerprint(points))
+            cached = self.coverage_cache.get(key)
+            if cached is not None:
+                return cached
             
-            # 检测空洞
-            holes = self.coverage_detector.detect_holes(visibility_map)
+            if self.hierarchical_coverage:
+                # 分层检测不构建稠密可见性地图，逐层代价见 level_stats
+                visibility_map = None
+                holes = self.coverage_detector.detect_holes_hierarchical(points)
+                level_stats = self.coverage_detector.last_level_stats
+            else:
+                # 创建可见性地图
+                visibility_map = self.coverage_detector.create_visibility_map(points)
+                
+                # 检测空洞
+                holes = self.coverage_detector.detect_holes(visibility_map)
+                level_stats = None
             
-            return {
+            coverage_info = {
                 'visibility_map': visibility_map,
-                'holes': holes
+                'holes': holes,
+                'level_stats': level_stats
             }
+            if holes is not None:
+                self.coverage_cache.put(key, coverage_info)
+            return coverage_info
             
         except Exception as e:
             self.logger.error(f"Coverage analysis failed: {str(e)}")
             return None
     
-    def generate_next_scan(self, current_points, robot_constraints):
+    @traced('planning', count=count_argument(1, 'current_points'))
+    def generate_next_scan(self, current_points, robot_constraints, version=None,
+                           current_angles=(0.0, 0.0), target_coverage=0.9):
         """
         生成下一次扫描的计划
+        current_angles: 当前水平/垂直电机角度，用于下一最佳视点模式估计运动时间
         """
         try:
             # 分析当前覆盖情况
-            coverage_info = self.analyze_coverage(current_points)
+            coverage_info = self.analyze_coverage(current_points, version)
             
-            if not coverage_info or not coverage_info['holes']:
+            if not coverage_info:
                 return None
             
-            # 规划扫描路径
-            viewpoints = self.path_planner.plan_scanning_path(
-                coverage_info['holes'],
-                robot_constraints
-            )
+            holes = coverage_info['holes'] or []
+            if self.free_space is not None and self.free_space.rays_integrated:
+                # 丢弃已被射线确认为空的区域，并加入与自由空间相邻的未观测区域
+                holes = [h for h in holes if not self.free_space.is_free(h['center'])]
+                holes += self.coverage_detector.detect_unknown_regions(self.free_space) or []
             
-            if not viewpoints:
+            if not holes:
                 return None
             
-            # 生成扫描序列
-            scan_sequence = self.path_planner.generate_scanning_sequence(viewpoints)
+            plans = []
+            coords = None
+            if self.plan_cache is not None:
+                # 先尝试复用之前为相似空洞集合规划的视点序列
+                coords = as_coords(current_points)
+                cached = self.plan_cache.lookup(holes, coords, robot_constraints)
+                if cached:
+                    plans.append(('cached', cached, self.plan_coverage(holes, cached)))
+            
+            reuse = bool(plans)
+            planning_start = time.perf_counter()
+            if not reuse and self.planning_mode in ('nbv', 'auto'):
+                # 贪心选出的视点已按访问顺序排列
+                selection = self.path_planner.select_next_best_views(
+                    holes,
+                    robot_constraints,
+                    current_angles=current_angles,
+                    target_coverage=target_coverage
+                )
+                if selection and selection['viewpoints']:
+                    plans.append(('nbv', selection['viewpoints'], selection['coverage']))
             
+            if not reuse and self.planning_mode != 'nbv':
+                # 规划扫描路径
+                viewpoints = self.path_planner.plan_scanning_path(
+                    holes,
+                    robot_constraints,
+                    **self.planner_options
+                )
+                
+                # 生成扫描序列
+                scan_sequence = self.path_planner.generate_scanning_sequence(
+                    viewpoints, start_angles=current_angles
+                ) if viewpoints else None
+                if scan_sequence:
+                    plans.append(('path', scan_sequence, self.plan_coverage(holes, scan_sequence)))
+            
+            if not plans:
+                return None
+            
+            best = self.compare_plans(plans, current_angles)[0]
+            if self.plan_cache is not None and not reuse:
+                self.plan_cache.store(holes, coords, best['viewpoints'], time.perf_counter() - planning_start)
             return {
-                'viewpoints': scan_sequence,
-                'holes': coverage_info['holes']
+                'viewpoints': best['viewpoints'],
+                'holes': holes,
+                'strategy': best['strategy'],
+                'prediction': best['prediction']
             }
             
         except Exception as e:
             self.logger.error(f"Scan generation failed: {str(e)}")
             return None
     
-    def estimate_completion(self, points, threshold=0.9):
+    @staticmethod
+    def plan_coverage(holes, viewpoints):
+        """
+        计划中视点对准的空洞所占的权重比例(权重依次取 surface_area、volume、size)
+        """
+        weights = np.array([
+            hole.get('surface_area', hole.get('volume', hole.get('size', 1.0))) for hole in holes
+        ], dtype=float)
+        aimed = {tuple(np.round(vp['target'], 3)) for vp in viewpoints}
+        covered = np.array([tuple(np.round(hole['center'], 3)) in aimed for hole in holes], dtype=bool)
+        total = weights.sum()
+        return float(weights[covered].sum() / total) if total else 1.0
+    
+    def compare_plans(self, plans, current_angles=(0.0, 0.0)):
+        """
+        用代价模型预测各计划的执行时间，按单位预测时间的覆盖率从高到低排序
+        plans: (策略名, 有序视点列表, 覆盖率) 的列表
+        """
+        ranked = []
+        for strategy, viewpoints, coverage in plans:
+            prediction = self.cost_model.predict_plan(viewpoints, current_angles)
+            ranked.append({
+                'strategy': strategy,
+                'viewpoints': viewpoints,
+                'coverage': coverage,
+                'prediction': prediction,
+                'coverage_rate': coverage / prediction['total'] if prediction['total'] > 0 else 0.0
+            })
+        ranked.sort(key=lambda plan: plan['coverage_rate'], reverse=True)
+        
+        self.last_plan_comparison = [
+            {k: v for k, v in plan.items() if k != 'viewpoints'} for plan in ranked
+        ]
+        for plan in ranked:
+            self.logger.info(
+                f"Plan '{plan['strategy']}': {len(plan['viewpoints'])} views, "
+                f"coverage {plan['coverage']:.1%}, predicted {plan['prediction']['total']:.1f}s"
+            )
+        return ranked
+    
+    def update_occupancy(self, global_map):
         """
-        估计扫描完成度
+        根据全局地图的版本增量更新占据地图：只追加上次同步后新增的点；
+        地图被重建，或包围盒扩大使可见性地图分辨率变粗超过容差时才全部重算
+        """
+        if global_map is self._occupancy_source and global_map.version == self._occupancy_version:
+            return
+        
+        if global_map is self._occupancy_source and global_map.version == self._occupancy_version + 1:
+            self.occupancy.update(global_map.last_added)
+        else:
+            self.occupancy.reset()
+            self.occupancy.update(global_map.coords)
+        
+        if self.occupancy.stale:
+            self.logger.debug(f"Rebuilding occupancy map at resolution {self.occupancy.target_resolution():.4f}")
+            self.occupancy.reset()
+            self.occupancy.update(global_map.coords)
+        
+        self._occupancy_source = global_map
+        self._occupancy_version = global_map.version
+    
+    def estimate_completion(self, points, threshold=0.9, version=None):
+        """
+        估计扫描完成度：可见性地图中被覆盖的体素比例，由占据地图按相同定义统计，不构建可见性地图
+        points 为 GlobalMap 时只用上次同步后新增的点增量更新；为点列表或坐标数组时单独统计一次
+        uncovered_regions 取自同一版本已缓存的覆盖分析，没有时为None
         """
         try:
-            # 分析覆盖情况
-            coverage_info = self.analyze_coverage(points)
-            
-            if not coverage_info:
-                return None
-            
-            # 计算完成度
-            total_voxels = len(coverage_info['visibility_map'])
-            covered_voxels = sum(1 for count in coverage_info['visibility_map'].values() 
-                               if count > 0)
+            if isinstance(points, GlobalMap):
+                self.update_occupancy(points)
+                occupancy = self.occupancy
+            else:
+                occupancy = OccupancyMap()
+                occupancy.update(points)
             
-            completion = covered_voxels / total_voxels
+            completion = occupancy.completion()
+            self.last_completion = completion
             
+            coverage_info = self.coverage_cache.peek(('version', version)) if version is not None else None
             return {
                 'completion_rate': completion,
                 'is_complete': completion >= threshold,
-                'uncovered_regions': len(coverage_info['holes']) if coverage_info['holes'] else 0
+                'uncovered_regions': len(coverage_info['holes'] or []) if coverage_info else None
             }
             
         except Exception as e:
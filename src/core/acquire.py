@@ -0,0 +1,90 @@
+"""
+Acquisition-only entry point: record raw scans without loading the analysis stack
+仅采集入口：记录原始扫描数据，不加载分析相关依赖
+
+用法: python src/core/acquire.py <会话目录> [--h-range 0 180] [--v-range 30 150] [--simulate]
+每次运行向会话追加一次扫描，之后用 batch_reprocess.py 离线处理
+"""
+import sys
+import time
+import logging
+import argparse
+from config import *
+from data_acquisition import DataAcquisition
+from scan_checkpoint import ScanCheckpoint
+
+def sweep_angles(start, end, step):
+    angles = []
+    angle = start
+    while angle <= end:
+        angles.append(angle)
+        angle += step
+    return angles
+
+def record_sweep(motor_ctrl, data_acq, h_angles, v_angles, settle_time=VIEWPOINT_SETTLE_TIME):
+    """
+    按水平/垂直角度网格逐点采集原始数据，每个垂直角度往返扫描以减少水平回转
+    """
+    raw_data = []
+    for row, v_angle in enumerate(v_angles):
+        motor_ctrl.rotate_vertical(v_angle - motor_ctrl.vertical_motor.position)
+        for h_angle in (h_angles if row % 2 == 0 else h_angles[::-1]):
+            motor_ctrl.rotate_horizontal(h_angle - motor_ctrl.horizontal_motor.position)
+            time.sleep(settle_time)
+            point_data = data_acq.single_point_scan()
+            if point_data:
+                raw_data.append(point_data)
+    return raw_data
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Record raw scans without processing")
+    parser.add_argument('session', help="session directory the scan is appended to")
+    parser.add_argument('--h-range', type=float, nargs=2, default=(0, 180), metavar=('START', 'END'))
+    parser.add_argument('--v-range', type=float, nargs=2, default=(30, 150), metavar=('START', 'END'))
+    parser.add_argument('--h-step', type=float, default=HORIZONTAL_STEP)
+    parser.add_argument('--v-step', type=float, default=VERTICAL_STEP)
+    parser.add_argument('--settle-time', type=float, default=VIEWPOINT_SETTLE_TIME)
+    parser.add_argument('--simulate', action='store_true', help="use simulated sensor and motors")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        if args.simulate:
+            from simulated_rig import SimulatedMotorController, SimulatedSensorController
+            motor_ctrl = SimulatedMotorController(time_scale=0.0)
+            sensor_ctrl = SimulatedSensorController(motor_ctrl)
+        else:
+            from motor_control import MotorController
+            from sensor_init import SensorController
+            motor_ctrl = MotorController()
+            sensor_ctrl = SensorController()
+        data_acq = DataAcquisition(sensor_ctrl, motor_ctrl)
+        checkpoint = ScanCheckpoint(args.session)
+        
+        motor_ctrl.reset_motors()
+        sensor_ctrl.reset_gyro()
+        
+        start = time.time()
+        raw_data = record_sweep(
+            motor_ctrl, data_acq,
+            sweep_angles(args.h_range[0], args.h_range[1], args.h_step),
+            sweep_angles(args.v_range[0], args.v_range[1], args.v_step),
+            args.settle_time
+        )
+        motor_ctrl.reset_motors()
+        
+        if not raw_data or not checkpoint.save_raw(raw_data):
+            logging.error("No scan data recorded")
+            return 1
+        logging.info(f"Recorded {len(raw_data)} points in {time.time() - start:.1f}s "
+                     f"as scan {len(checkpoint.manifest['scans'])} of {args.session}")
+        return 0
+    
+    except Exception as e:
+        logging.error(f"Acquisition failed: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,371 @@
+"""
+Offline batch reprocessing of recorded scan sessions
+离线批量重新处理已记录的扫描会话
+
+用法: python src/core/batch_reprocess.py <会话目录> [--output DIR] [--limit-cores N] [--max-memory-mb MB|auto]
+每个会话是一个 ScanCheckpoint 目录(含 manifest.json)，各会话在独立的工作进程中处理
+"""
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+import multiprocessing.connection
+from collections import deque
+import numpy as np
+from config import *
+
+# 处理各阶段按需导入的重量级依赖，工作进程在设置内存上限之前预先导入
+STAGE_DEPENDENCIES = (
+    'scipy.signal', 'scipy.optimize', 'scipy.sparse', 'scipy.spatial',
+    'scipy.spatial.transform', 'scipy.spatial.distance', 'scipy.ndimage', 'sklearn.neighbors'
+)
+
+SUMMARY_FIELDS = (
+    'session', 'status', 'scans', 'raw_points', 'points', 'features', 'coverage',
+    'hausdorff_distance', 'mean_distance', 'processing_time', 'fusion_time',
+    'reconstruction_time', 'validation_time', 'total_time', 'peak_memory_mb', 'error'
+)
+
+def find_sessions(root):
+    """
+    查找根目录下所有包含 manifest.json 的会话目录(根目录本身也可以是一个会话)
+    """
+    sessions = []
+    for path, dirs, files in os.walk(root):
+        if 'manifest.json' in files:
+            sessions.append(path)
+            # 会话内部的 scans 子目录不再继续查找
+            dirs[:] = []
+        dirs.sort()
+    return sorted(sessions)
+
+def session_name(root, session_dir):
+    name = os.path.relpath(session_dir, root)
+    return os.path.basename(os.path.abspath(root)) if name == '.' else name.replace(os.sep, '__')
+
+def _available_memory_mb():
+    """
+    当前可用的物理内存(MB)，无法获取时返回None
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def _address_space_mb():
+    """
+    本进程当前的虚拟地址空间大小(MB)，无法获取时返回0
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmSize:'):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError):
+        pass
+    return 0.0
+
+def worker_memory_budget(max_memory_mb, workers):
+    """
+    每个工作进程的内存预算(MB)：'auto' 为可用内存按工作进程数均分，0或None表示不限制
+    """
+    if max_memory_mb == 'auto':
+        available = _available_memory_mb()
+        return int(available / max(workers, 1)) if available else None
+    return int(max_memory_mb) if max_memory_mb else None
+
+def _init_worker(memory_budget_mb):
+    """
+    工作进程初始化：先导入处理模块，再把地址空间上限设为当前映射加上内存预算，
+    已映射的共享库和 numpy/BLAS 的初始保留不占用预算；超出时分配失败抛出 MemoryError 而不是拖垮整机
+    """
+    import importlib
+    _build_controller()
+    for module in STAGE_DEPENDENCIES + ('validation',):
+        importlib.import_module(module)
+    if memory_budget_mb:
+        try:
+            import resource
+            limit = int((_address_space_mb() + memory_budget_mb) * 1024 * 1024)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            logging.getLogger(__name__).warning(f"Worker memory limit not applied: {str(e)}")
+
+def _peak_memory_mb():
+    try:
+        import resource
+        # Linux 上 ru_maxrss 单位为KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    except ImportError:
+        return None
+
+def _atomic_json(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def _build_controller():
+    """
+    不连接硬件的系统控制器，只使用处理、融合和重建组件
+    """
+    from system_controller import SystemController
+    from data_preprocessing import DataPreprocessor
+    from static_reconstruction import StaticReconstructor
+    from coverage_detection import CoverageDetector
+    from path_planning import PathPlanner
+    from scan_optimizer import ScanOptimizer
+    from data_fusion import DataFusion
+    
+    coverage_detector = CoverageDetector()
+    path_planner = PathPlanner()
+    return SystemController(
+        None, None, None,
+        DataPreprocessor(), StaticReconstructor(), coverage_detector,
+        path_planner, ScanOptimizer(coverage_detector, path_planner), DataFusion()
+    )
+
+def reprocess_session(session_dir, output_dir):
+    """
+    重新处理一个会话：预处理与配准融合每次扫描，重建并与原记录的点云比较
+    结果写入 output_dir，result.json 最后原子写入，作为该会话已完成的标记
+    """
+    logger = logging.getLogger(__name__)
+    start = time.perf_counter()
+    result = {'session': os.path.basename(output_dir), 'status': 'failed'}
+    try:
+        from scan_checkpoint import ScanCheckpoint
+        from global_map import GlobalMap
+        from validation import ValidationUtils
+        
+        os.makedirs(output_dir, exist_ok=True)
+        state = ScanCheckpoint(session_dir).load()
+        if state is None:
+            raise ValueError(f"No usable checkpoint in {session_dir}")
+        controller = _build_controller()
+        mode = state['registration_mode']
+        
+        # 预处理与融合分别计时
+        processing_time = fusion_time = 0.0
+        for raw_data in state['raw_scans']:
+            stage_start = time.perf_counter()
+            processed = controller.process_scan_data(raw_data)
+            processing_time += time.perf_counter() - stage_start
+            if not processed:
+                continue
+            stage_start = time.perf_counter()
+            controller.register_scan(raw_data, processed, mode)
+            fusion_time += time.perf_counter() - stage_start
+        points = controller.current_scan_data
+        if not points:
+            raise ValueError("Reprocessing produced no points")
+        
+        # 重建：法向量与特征点
+        stage_start = time.perf_counter()
+        reconstructor = controller.reconstructor
+        reconstructor.set_point_cloud(points)
+        normals = reconstructor.estimate_normals()
+        features = reconstructor.detect_features() or []
+        reconstruction_time = time.perf_counter() - stage_start
+        
+        # 验证：覆盖率及与原记录点云的差异
+        stage_start = time.perf_counter()
+        validator = ValidationUtils()
+        coords = controller.global_map.coords
+        coverage = validator.compute_coverage(points, coords.min(axis=0), coords.max(axis=0))
+        recorded = GlobalMap()
+        for scan, transform in zip(state['all_scans'], state['transformations']):
+            recorded.add_scan(scan, transform)
+        metrics = validator.compute_point_cloud_metrics(points, recorded.to_points()) if len(recorded) else None
+        validation_time = time.perf_counter() - stage_start
+        
+        with open(os.path.join(output_dir, 'points.txt'), 'w') as f:
+            for point in points:
+                f.write(f"{point['x']},{point['y']},{point['z']}\n")
+        if normals is not None:
+            np.save(os.path.join(output_dir, 'normals.npy'), normals)
+        
+        result.update(
+            status='ok',
+            scans=len(controller.all_scans),
+            raw_points=sum(len(raw_data) for raw_data in state['raw_scans']),
+            points=len(points),
+            features=len(features),
+            coverage=coverage,
+            hausdorff_distance=metrics['hausdorff_distance'] if metrics else None,
+            mean_distance=metrics['mean_distance'] if metrics else None,
+            processing_time=processing_time,
+            fusion_time=fusion_time,
+            reconstruction_time=reconstruction_time,
+            validation_time=validation_time
+        )
+    
+    except MemoryError:
+        logger.error(f"Session {session_dir} exceeded the worker memory limit")
+        result['error'] = 'MemoryError'
+    except Exception as e:
+        logger.error(f"Session {session_dir} reprocessing failed: {str(e)}")
+        result['error'] = str(e)
+    
+    result['total_time'] = time.perf_counter() - start
+    result['peak_memory_mb'] = _peak_memory_mb()
+    try:
+        _atomic_json(os.path.join(output_dir, 'result.json'), result)
+    except OSError as e:
+        logger.error(f"Failed to write result for {session_dir}: {str(e)}")
+    return result
+
+def _worker_main(session_dir, output_dir, memory_budget_mb):
+    """
+    工作进程入口：每个进程只处理一个会话，结果由 reprocess_session 写入 result.json
+    """
+    _init_worker(memory_budget_mb)
+    reprocess_session(session_dir, output_dir)
+
+def _start_worker(context, session_dir, output_dir, memory_budget_mb):
+    # 删除旧结果，进程退出后没有 result.json 即说明工作进程异常终止
+    try:
+        os.remove(os.path.join(output_dir, 'result.json'))
+    except OSError:
+        pass
+    process = context.Process(target=_worker_main, args=(session_dir, output_dir, memory_budget_mb),
+                              name=f"reprocess-{os.path.basename(output_dir)}", daemon=True)
+    process.start()
+    return process
+
+def _finish_worker(process, session_dir, output_dir, memory_budget_mb):
+    """
+    回收已退出的工作进程并读取其结果；进程异常终止(如超出内存上限被终止)时记录失败结果
+    """
+    logger = logging.getLogger(__name__)
+    process.join()
+    result = load_result(output_dir)
+    limit_note = f" (worker memory limit {memory_budget_mb} MB)" if memory_budget_mb else ""
+    if result is None:
+        logger.error(f"Worker for session {session_dir} died with exit code {process.exitcode}{limit_note}")
+        result = {
+            'session': os.path.basename(output_dir),
+            'status': 'failed',
+            'error': f"worker died with exit code {process.exitcode}{limit_note}"
+        }
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            _atomic_json(os.path.join(output_dir, 'result.json'), result)
+        except OSError as e:
+            logger.error(f"Failed to write result for {session_dir}: {str(e)}")
+    elif result.get('error') == 'MemoryError':
+        logger.error(f"Session {session_dir} ran out of memory{limit_note}")
+    return result
+
+def load_result(output_dir):
+    try:
+        with open(os.path.join(output_dir, 'result.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_summary(path, results):
+    """
+    按会话名排序写出每个会话的计时与质量汇总表
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for result in sorted(results, key=lambda r: r['session']):
+            writer.writerow({field: result.get(field, '') for field in SUMMARY_FIELDS})
+    os.replace(temp_path, path)
+
+def run_batch(root, output=BATCH_OUTPUT_DIR, limit_cores=None, max_memory_mb=BATCH_MAX_MEMORY_MB,
+              resume=True, retry_failed=False):
+    """
+    用最多 limit_cores 个工作进程重新处理 root 下的所有会话；resume 时跳过已有成功结果的会话
+    每个会话在独立进程中处理后退出，内存随进程一起释放；单个进程异常终止只影响该会话
+    max_memory_mb: 每个工作进程的内存预算(MB)，'auto' 为可用内存按工作进程数均分，0表示不限制
+    """
+    logger = logging.getLogger(__name__)
+    sessions = find_sessions(root)
+    os.makedirs(output, exist_ok=True)
+    
+    results, tasks = [], []
+    for session_dir in sessions:
+        output_dir = os.path.join(output, session_name(root, session_dir))
+        previous = load_result(output_dir) if resume else None
+        if previous and (previous['status'] == 'ok' or not retry_failed):
+            results.append(previous)
+        else:
+            tasks.append((session_dir, output_dir))
+    logger.info(f"Found {len(sessions)} sessions, {len(sessions) - len(tasks)} already done, "
+                f"{len(tasks)} to process")
+    
+    summary_path = os.path.join(output, BATCH_SUMMARY_FILE)
+    if tasks:
+        workers = max(1, min(limit_cores or os.cpu_count() or 1, len(tasks)))
+        memory_budget = worker_memory_budget(max_memory_mb, workers)
+        if memory_budget:
+            logger.info(f"Worker memory budget: {memory_budget} MB")
+        # spawn 启动干净的工作进程，不继承父进程的线程和内存
+        context = multiprocessing.get_context('spawn')
+        start = time.perf_counter()
+        queued, running = deque(tasks), {}
+        done = 0
+        while queued or running:
+            while queued and len(running) < workers:
+                session_dir, output_dir = queued.popleft()
+                process = _start_worker(context, session_dir, output_dir, memory_budget)
+                running[process.sentinel] = (process, session_dir, output_dir)
+            for sentinel in multiprocessing.connection.wait(list(running)):
+                process, session_dir, output_dir = running.pop(sentinel)
+                result = _finish_worker(process, session_dir, output_dir, memory_budget)
+                results.append(result)
+                done += 1
+                logger.info(f"[{done}/{len(tasks)}] {result['session']}: {result['status']} "
+                            f"in {result.get('total_time') or 0.0:.1f}s")
+                # 每完成一个会话就刷新汇总表，中断后汇总表仍与已完成结果一致
+                write_summary(summary_path, results)
+        logger.info(f"Reprocessed {len(tasks)} sessions with {workers} workers "
+                    f"in {time.perf_counter() - start:.1f}s")
+    
+    write_summary(summary_path, results)
+    return results
+
+def _memory_argument(value):
+    return 'auto' if value == 'auto' else int(value)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Reprocess recorded scan sessions offline")
+    parser.add_argument('sessions', help="directory containing recorded sessions (checkpoint directories)")
+    parser.add_argument('--output', default=BATCH_OUTPUT_DIR, help="output directory")
+    parser.add_argument('--limit-cores', type=int, default=None, help="maximum number of worker processes")
+    parser.add_argument('--max-memory-mb', type=_memory_argument, default=BATCH_MAX_MEMORY_MB,
+                        help="memory budget per worker in MB on top of its imported libraries, "
+                             "'auto' to share the available memory between workers (0 disables the limit)")
+    parser.add_argument('--no-resume', action='store_true', help="reprocess sessions that already have results")
+    parser.add_argument('--retry-failed', action='store_true', help="reprocess sessions that failed previously")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    results = run_batch(args.sessions, args.output, args.limit_cores, args.max_memory_mb,
+                        resume=not args.no_resume, retry_failed=args.retry_failed)
+    failed = [result['session'] for result in results if result['status'] != 'ok']
+    if failed:
+        logging.error(f"{len(failed)} sessions failed: {', '.join(failed)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,29 @@
 """
 Main program for EV3 3D scanner system - Automated Version
 """
+import os
+import json
 import logging
 import time
-from utils.logger import setup_logger
+import datetime
+import numpy as np
+from logger import setup_logger
+from validation import ValidationUtils
+from performance_monitor import PerformanceMonitor
+from metrics_exporter import MetricsExporter
 from sensor_init import SensorController
 from motor_control import MotorController
 from data_acquisition import DataAcquisition
+from data_preprocessing import DataPreprocessor
+from static_reconstruction import StaticReconstructor
+from data_fusion import DataFusion
+from coverage_detection import CoverageDetector
+from path_planning import PathPlanner
+from scan_optimizer import ScanOptimizer
+from scan_cost_model import ScanCostModel
+from plan_cache import PlanCache
+from system_controller import SystemController
+from system_test import SystemTester
 from config import *
 
 class ScannerSystem:
@@ -99,10 +116,12 @@ class ScannerSystem:
             logging.error(f"Shutdown failed: {str(e)}")
 
 def main():
+    # 初始化性能监控；导出服务和后台采样线程在 finally 中停止，失败时也不会遗留
+    performance_monitor = PerformanceMonitor()
+    metrics_exporter = None
     try:
-        # 初始化性能监控
-        performance_monitor = PerformanceMonitor()
         performance_monitor.start_monitoring()
+        performance_monitor.start_sampling(low_overhead=METRICS_LOW_OVERHEAD)
         
         # 创建所有必要的组件
         sensor_ctrl = SensorController()
@@ -112,7 +131,13 @@ def main():
         reconstructor = StaticReconstructor()
         coverage_detector = CoverageDetector()
         path_planner = PathPlanner()
-        scan_optimizer = ScanOptimizer(coverage_detector, path_planner)
+        plan_cache = PlanCache()
+        cost_model = ScanCostModel(path=COST_MODEL_FILE)
+        scan_optimizer = ScanOptimizer(coverage_detector, path_planner, cost_model=cost_model,
+                                       plan_cache=plan_cache)
+        performance_monitor.register_stats_provider('coverage_cache', scan_optimizer.coverage_cache.stats)
+        performance_monitor.register_stats_provider('cost_model', scan_optimizer.cost_model.stats)
+        performance_monitor.register_stats_provider('plan_cache', plan_cache.stats)
         data_fusion = DataFusion()
         
         # 创建系统控制器
@@ -121,6 +146,12 @@ def main():
             preprocessor, reconstructor, coverage_detector,
             path_planner, scan_optimizer, data_fusion
         )
+        performance_monitor.register_stats_provider('scan', system_controller.progress_stats)
+        
+        # 扫描期间导出实时指标
+        metrics_exporter = MetricsExporter(performance_monitor)
+        if METRICS_EXPORTER_ENABLED:
+            metrics_exporter.start()
         
         # 运行自动化扫描
         scan_data = system_controller.run_automated_scan()
@@ -131,6 +162,7 @@ def main():
         stability_results = system_tester.run_stability_test(duration=300)  # 5分钟稳定性测试
         
         # 停止性能监控并生成报告
+        metrics_exporter.stop()
         performance_monitor.stop_monitoring()
         performance_report = performance_monitor.generate_report()
         
@@ -152,7 +184,9 @@ def main():
             os.makedirs('reports', exist_ok=True)
             
             with open(report_file, 'w') as f:
-                f.write(performance_report)
+                # 报告是字典，序列化为JSON文本
+                f.write(json.dumps(performance_report, indent=2, default=str) if performance_report
+                        else "No performance data\n")
                 f.write("\nTest Results:\n")
                 f.write(str(test_results))
                 f.write("\nStability Results:\n")
@@ -162,6 +196,11 @@ def main():
         
     except Exception as e:
         logging.error(f"Main program failed: {str(e)}")
+    finally:
+        # 正常结束时已停止，重复调用无副作用
+        if metrics_exporter is not None:
+            metrics_exporter.stop()
+        performance_monitor.stop_monitoring()
 
 if __name__ == "__main__":
     main()
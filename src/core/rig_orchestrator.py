@@ -0,0 +1,206 @@
+"""
+Multi-scanner orchestration around a shared fixture
+围绕同一夹具的多扫描仪协同扫描
+"""
+import time
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from config import *
+from data_acquisition import DataAcquisition
+
+class ScannerRig:
+    """
+    一台扫描仪：传感器与电机控制器、扫描仪到夹具坐标系的外参，以及扫描仪坐标系下的可达工作空间
+    """
+    def __init__(self, name, sensor_ctrl, motor_ctrl, extrinsic=None, constraints=None):
+        self.name = name
+        self.sensor_ctrl = sensor_ctrl
+        self.motor_ctrl = motor_ctrl
+        self.data_acq = DataAcquisition(sensor_ctrl, motor_ctrl)
+        self.extrinsic = np.eye(4) if extrinsic is None else np.asarray(extrinsic, dtype=float)
+        # None 表示不限制视点位置
+        self.constraints = constraints
+    
+    def reachable(self, positions):
+        """
+        扫描仪坐标系下的视点位置是否位于工作空间内
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        if self.constraints is None:
+            return np.ones(len(positions), dtype=bool)
+        low = np.array([self.constraints[f'{axis}_min'] for axis in 'xyz'], dtype=float)
+        high = np.array([self.constraints[f'{axis}_max'] for axis in 'xyz'], dtype=float)
+        return np.all((positions >= low) & (positions <= high), axis=1)
+
+class RigOrchestrator:
+    """
+    把 ScanOptimizer 的视点计划按可达性和预测时间分配给多台扫描仪，并行采集，
+    再用已知外参作为配准初值融合到系统控制器的全局地图
+    """
+    def __init__(self, controller, rigs):
+        self.logger = logging.getLogger(__name__)
+        self.controller = controller
+        self.rigs = list(rigs)
+        self.last_orchestration_stats = {}
+    
+    def _map_to_rig(self, rig):
+        """
+        全局地图坐标系(首次扫描坐标系) -> 扫描仪坐标系的变换
+        """
+        priors = self.controller.scan_priors
+        map_to_fixture = priors[0] if priors else np.eye(4)
+        return np.linalg.inv(rig.extrinsic) @ map_to_fixture
+    
+    def partition(self, viewpoints):
+        """
+        依次把每个视点分给能到达且完成后累计预测时间最短的扫描仪，再在各扫描仪上重新排序
+        返回各扫描仪坐标系下的有序视点列表及无法到达的视点数
+        """
+        cost_model = self.controller.cost_model
+        dwell = cost_model.params['settle_time'] + cost_model.params['read_time']
+        positions = np.array([vp['position'] for vp in viewpoints], dtype=float).reshape(-1, 3)
+        targets = np.array([vp['target'] for vp in viewpoints], dtype=float).reshape(-1, 3)
+        
+        local_viewpoints, reachable, angles = [], [], []
+        for rig in self.rigs:
+            transform = self._map_to_rig(rig)
+            rig_positions = positions @ transform[:3, :3].T + transform[:3, 3]
+            rig_targets = targets @ transform[:3, :3].T + transform[:3, 3]
+            local_viewpoints.append([
+                dict(vp, position=rig_positions[i].tolist(), target=rig_targets[i].tolist())
+                for i, vp in enumerate(viewpoints)
+            ])
+            reachable.append(rig.reachable(rig_positions))
+            angles.append(np.column_stack(self.controller.path_planner.viewpoint_angles(rig_positions, rig_targets)))
+        
+        loads = np.zeros(len(self.rigs))
+        current = [np.asarray(self.controller.motor_angles(rig.motor_ctrl), dtype=float) for rig in self.rigs]
+        assignments = [[] for _ in self.rigs]
+        dropped = 0
+        for i in range(len(viewpoints)):
+            best, best_load = None, np.inf
+            for r in range(len(self.rigs)):
+                if not reachable[r][i]:
+                    continue
+                load = loads[r] + float(cost_model.motion_time(current[r], angles[r][i])) + dwell
+                if load < best_load:
+                    best, best_load = r, load
+            if best is None:
+                dropped += 1
+                continue
+            loads[best] = best_load
+            current[best] = angles[best][i]
+            assignments[best].append(local_viewpoints[best][i])
+        
+        # 每台扫描仪从当前姿态出发重新优化访问顺序
+        sequences = []
+        for rig, assigned in zip(self.rigs, assignments):
+            sequence = self.controller.path_planner.generate_scanning_sequence(
+                assigned, start_angles=self.controller.motor_angles(rig.motor_ctrl)
+            ) if assigned else []
+            sequences.append(sequence or [])
+        return sequences, dropped
+    
+    def _acquire(self, rig, sequence):
+        """
+        在工作线程中执行一台扫描仪的序列；访问视点数和行程记录在本次调用的 progress 中，不写共享计数器
+        """
+        start = time.perf_counter()
+        progress = {}
+        raw_data = self.controller.execute_scanning_sequence(sequence, rig.motor_ctrl, rig.data_acq,
+                                                             progress=progress)
+        return raw_data, time.perf_counter() - start, progress
+    
+    def run(self, completion_threshold=0.9, max_iterations=5, registration_mode='sequential'):
+        """
+        多扫描仪自动扫描：每轮统一规划，按扫描仪分配后并行采集，依次融合
+        """
+        controller = self.controller
+        stats = {rig.name: {'views': 0, 'points': 0, 'busy': 0.0, 'travel': 0.0} for rig in self.rigs}
+        acquisition_time = 0.0
+        iterations = 0
+        try:
+            self.logger.info(f"Starting multi-rig scanning with {len(self.rigs)} rigs...")
+            
+            for rig in self.rigs:
+                rig.motor_ctrl.reset_motors()
+                rig.sensor_ctrl.reset_gyro()
+            robot_constraints = controller.prepare_workspace()
+            
+            with ThreadPoolExecutor(max_workers=len(self.rigs)) as pool:
+                while iterations < max_iterations:
+                    scan_plan = controller.scan_optimizer.generate_next_scan(
+                        controller.global_map.coords,
+                        robot_constraints,
+                        version=controller.cloud_version,
+                        current_angles=controller.motor_angles(self.rigs[0].motor_ctrl),
+                        target_coverage=completion_threshold
+                    )
+                    if not scan_plan:
+                        self.logger.info("No more scanning required")
+                        break
+                    
+                    sequences, dropped = self.partition(scan_plan['viewpoints'])
+                    if dropped:
+                        self.logger.warning(f"{dropped} viewpoints are not reachable by any rig")
+                    if not any(sequences):
+                        break
+                    
+                    # 各扫描仪并行采集
+                    start = time.perf_counter()
+                    futures = [
+                        (rig, pool.submit(self._acquire, rig, sequence))
+                        for rig, sequence in zip(self.rigs, sequences) if sequence
+                    ]
+                    results = [(rig, future.result()) for rig, future in futures]
+                    acquisition_time += time.perf_counter() - start
+                    
+                    # 汇合后在主线程合计各扫描仪的视点数和行程
+                    for rig, (_, busy, progress) in results:
+                        stats[rig.name]['busy'] += busy
+                        stats[rig.name]['views'] += progress['visited']
+                        stats[rig.name]['travel'] += progress['travel']
+                        controller.add_motor_travel(progress['travel'])
+                    controller.last_sequence_visited = sum(progress['visited'] for _, (_, _, progress) in results)
+                    controller.last_sequence_stop = None
+                    
+                    # 以外参和编码器位姿为初值依次配准融合
+                    for rig, (raw_data, _, _) in results:
+                        if not raw_data:
+                            self.logger.warning(f"Rig {rig.name} collected no data")
+                            continue
+                        if not controller.integrate_scan(raw_data, registration_mode, rig.extrinsic):
+                            self.logger.warning(f"Rig {rig.name} data could not be processed")
+                            continue
+                        stats[rig.name]['points'] += len(raw_data)
+                        if controller.checkpoint is not None:
+                            controller.checkpoint.save(controller, registration_mode)
+                    
+                    iterations += 1
+                    controller.iterations_completed += 1
+                    
+                    completion = controller.scan_optimizer.estimate_completion(
+                        controller.global_map,
+                        threshold=completion_threshold,
+                        version=controller.cloud_version
+                    )
+                    if completion and completion['is_complete']:
+                        self.logger.info("Scanning completed successfully")
+                        break
+            
+            return controller.current_scan_data
+        
+        except Exception as e:
+            self.logger.error(f"Multi-rig scanning failed: {str(e)}")
+            return None
+        
+        finally:
+            serial = sum(rig_stats['busy'] for rig_stats in stats.values())
+            self.last_orchestration_stats = {
+                'rigs': stats,
+                'iterations': iterations,
+                'acquisition_time': acquisition_time,
+                'serial_acquisition_time': serial,
+                'parallel_speedup': serial / acquisition_time if acquisition_time > 0 else 0.0
+            }
@@ -0,0 +1,248 @@
+"""
+Pipelined automated scanning: acquisition overlaps processing and replanning
+流水线式自动扫描：采集与处理、重规划并行
+"""
+import time
+import queue
+import logging
+import threading
+from collections import deque
+import numpy as np
+from config import *
+
+class ScanPipeline:
+    """
+    采集线程按批次执行视点，主线程同时处理上一批数据并用更新后的地图重规划剩余视点
+    线程归属：
+    - 主线程(调用 run 的线程)独占全局地图、cloud_version、iterations_completed、扫描优化器
+      (占据地图、覆盖缓存、自由空间)和检查点；_plan、完成度估计和数据合并只在主线程执行，否则抛出 RuntimeError
+    - 采集线程只通过 execute_scanning_sequence 访问电机、传感器和数据采集，写入 last_sequence_* 与
+      加锁的 motor_travel，并向 cost_model 追加计时样本；cost_model 的参数只在采集线程退出后由 calibrate 更新
+    - 两者只通过 pending/in_flight(条件变量保护)和 results 队列交换数据；
+      主线程只在没有批次正在采集时读取编码器
+    """
+    def __init__(self, controller, batch_size=PIPELINE_BATCH_SIZE):
+        self.logger = logging.getLogger(__name__)
+        self.controller = controller
+        self.batch_size = batch_size
+        
+        # 待执行视点及正在采集的批次，由条件变量保护
+        self.pending = deque()
+        self.in_flight = []
+        self.condition = threading.Condition()
+        self.results = queue.Queue()
+        self.stop_event = threading.Event()
+        
+        self._stats_lock = threading.Lock()
+        self.stage_times = {}
+        self.last_pipeline_stats = {}
+        
+        # 运行 run 的主线程，地图与规划状态只能由它访问
+        self._owner = None
+    
+    def _record(self, stage, elapsed, items=1):
+        with self._stats_lock:
+            busy, count = self.stage_times.get(stage, (0.0, 0))
+            self.stage_times[stage] = (busy + elapsed, count + items)
+    
+    def _acquisition_loop(self):
+        """
+        采集线程：取出下一批视点并执行，原始数据交给主线程
+        """
+        while not self.stop_event.is_set():
+            wait_start = time.perf_counter()
+            with self.condition:
+                while not self.pending and not self.stop_event.is_set():
+                    self.condition.wait(timeout=0.1)
+                if self.stop_event.is_set():
+                    break
+                batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+                self.in_flight.append(batch)
+            self._record('acquisition_wait', time.perf_counter() - wait_start, 0)
+            
+            start = time.perf_counter()
+            raw_data = self.controller.execute_scanning_sequence(batch)
+            self._record('acquisition', time.perf_counter() - start, len(batch))
+            self.results.put((batch, raw_data))
+    
+    def _replace_plan(self, viewpoints):
+        """
+        用新计划替换尚未执行的视点，跳过正在采集的批次已对准的目标
+        """
+        with self.condition:
+            busy = {tuple(np.round(vp['target'], 3)) for batch in self.in_flight for vp in batch}
+            self.pending.clear()
+            self.pending.extend(vp for vp in viewpoints if tuple(np.round(vp['target'], 3)) not in busy)
+            self.condition.notify_all()
+    
+    def _planning_angles(self):
+        """
+        重规划的起始电机角度：正在采集的最后一个视点，否则为当前编码器读数
+        """
+        with self.condition:
+            last = self.in_flight[-1][-1] if self.in_flight else None
+        if last is None:
+            return self.controller.motor_angles()
+        h_angle, v_angle = self.controller.path_planner.viewpoint_angles(last['position'], last['target'])
+        return (float(h_angle), float(v_angle))
+    
+    def _check_owner(self):
+        if threading.current_thread() is not self._owner:
+            raise RuntimeError("Map and planning state must be accessed from the pipeline's main thread")
+    
+    def _plan(self, robot_constraints, completion_threshold):
+        self._check_owner()
+        start = time.perf_counter()
+        plan = self.controller.scan_optimizer.generate_next_scan(
+            self.controller.global_map.coords,
+            robot_constraints,
+            version=self.controller.cloud_version,
+            current_angles=self._planning_angles(),
+            target_coverage=completion_threshold
+        )
+        self._record('planning', time.perf_counter() - start)
+        return plan['viewpoints'] if plan else []
+    
+    def _integrate(self, batch, raw_data, registration_mode):
+        """
+        合并一批采集数据；每合并一批计为完成一轮扫描，与 run_automated_scan 一致，并写入检查点
+        """
+        self._check_owner()
+        controller = self.controller
+        start = time.perf_counter()
+        if not raw_data or not controller.integrate_scan(raw_data, registration_mode):
+            return False
+        controller.cost_model.record_processing(len(raw_data), time.perf_counter() - start)
+        controller.iterations_completed += 1
+        if controller.checkpoint is not None:
+            controller.checkpoint.save(controller, registration_mode, batch)
+        self._record('processing', time.perf_counter() - start, len(raw_data))
+        return True
+    
+    def _completion(self, completion_threshold):
+        self._check_owner()
+        return self.controller.scan_optimizer.estimate_completion(
+            self.controller.global_map,
+            threshold=completion_threshold,
+            version=self.controller.cloud_version
+        )
+    
+    def run(self, completion_threshold=0.9, max_iterations=5, registration_mode='sequential'):
+        """
+        运行流水线扫描；max_iterations 限制规划(含重规划)的轮数
+        """
+        controller = self.controller
+        acquisition = None
+        try:
+            self.logger.info("Starting pipelined scanning process...")
+            
+            if not controller.initialize_system():
+                return False
+            
+            robot_constraints = controller.prepare_workspace()
+            self.stage_times = {}
+            self._owner = threading.current_thread()
+            scan_start = time.perf_counter()
+            
+            viewpoints = self._plan(robot_constraints, completion_threshold)
+            rounds = 1
+            if not viewpoints:
+                self.logger.info("No more scanning required")
+                return controller.current_scan_data
+            self._replace_plan(viewpoints)
+            
+            acquisition = threading.Thread(target=self._acquisition_loop, name='scan-acquisition', daemon=True)
+            acquisition.start()
+            
+            while True:
+                try:
+                    batch, raw_data = self.results.get(timeout=0.1)
+                except queue.Empty:
+                    with self.condition:
+                        idle = not self.pending and not self.in_flight
+                    if idle or not acquisition.is_alive():
+                        break
+                    continue
+                
+                # 处理上一批数据的同时，采集线程已开始下一批
+                self._integrate(batch, raw_data, registration_mode)
+                with self.condition:
+                    self.in_flight.remove(batch)
+                
+                completion = self._completion(completion_threshold)
+                if completion and completion['is_complete']:
+                    self.logger.info("Scanning completed successfully")
+                    break
+                
+                # 按更新后的地图细化剩余计划
+                if raw_data and rounds < max_iterations:
+                    self._replace_plan(self._plan(robot_constraints, completion_threshold))
+                    rounds += 1
+            
+            # 停止采集后合并已采集但尚未处理的批次
+            self._stop(acquisition)
+            while not self.results.empty():
+                self._integrate(*self.results.get(), registration_mode)
+            
+            self._summarize(time.perf_counter() - scan_start, rounds)
+            controller.cost_model.calibrate()
+            return controller.current_scan_data
+            
+        except Exception as e:
+            self.logger.error(f"Pipelined scanning failed: {str(e)}")
+            self._stop(acquisition)
+            return None
+    
+    def _stop(self, acquisition):
+        """
+        清空待执行视点并等待采集线程完成当前批次后退出
+        """
+        self.stop_event.set()
+        with self.condition:
+            self.pending.clear()
+            self.condition.notify_all()
+        if acquisition is not None:
+            acquisition.join()
+        self.stop_event.clear()
+        self.in_flight = []
+    
+    def _summarize(self, wall_time, rounds):
+        """
+        汇总各阶段的忙碌时间与利用率，serial_time 超出 wall_time 的部分即为重叠
+        """
+        if wall_time > 0:
+            stages = {
+                stage: {
+                    'busy': busy,
+                    'items': count,
+                    'utilization': busy / wall_time
+                }
+                for stage, (busy, count) in self.stage_times.items()
+            }
+            serial = sum(busy for stage, (busy, _) in self.stage_times.items() if stage != 'acquisition_wait')
+            self.last_pipeline_stats = {
+                'wall_time': wall_time,
+                'serial_time': serial,
+                'overlap': max(serial - wall_time, 0.0) / wall_time,
+                'planning_rounds': rounds,
+                'stages': stages
+            }
+            self.logger.info(
+                f"Pipeline finished in {wall_time:.1f}s (serial work {serial:.1f}s), "
+                + ", ".join(f"{stage} {info['utilization']:.0%}" for stage, info in stages.items())
+            )
+    
+    def queue_depths(self):
+        """
+        待执行视点数、正在采集的批次数和待处理的采集结果数
+        """
+        with self.condition:
+            pending, in_flight = len(self.pending), len(self.in_flight)
+        return {
+            'pending_viewpoints': pending,
+            'in_flight_batches': in_flight,
+            'unprocessed_batches': self.results.qsize()
+        }
+    
+    def stats(self):
+        return self.last_pipeline_stats
@@ -3,12 +3,22 @@ System controller for automated scanning process
 """
 import time
 import logging
+import threading
+import numpy as np
 from config import *
+from performance_monitor import traced, count_result
+from scanner_kinematics import ScannerKinematics
+from global_map import GlobalMap
+from pose_graph import PoseGraph
+from log_odds_grid import LogOddsGrid
+from scan_pipeline import ScanPipeline
+from scan_checkpoint import ScanCheckpoint
+from rig_orchestrator import RigOrchestrator
 
 class SystemController:
     def __init__(self, sensor_ctrl, motor_ctrl, data_acq, 
                  preprocessor, reconstructor, coverage_detector,
-                 path_planner, scan_optimizer, data_fusion):
+                 path_planner, scan_optimizer, data_fusion, kinematics=None, checkpoint=None):
         self.logger = logging.getLogger(__name__)
         
         # 组件初始化
@@ -21,12 +31,49 @@ class SystemController:
         self.path_planner = path_planner
         self.scan_optimizer = scan_optimizer
         self.data_fusion = data_fusion
+        self.kinematics = kinematics or ScannerKinematics()
         
         # 系统状态
         self.is_scanning = False
-        self.current_scan_data = []
         self.all_scans = []
+        self.raw_scans = []
         self.transformations = []
+        self.scan_priors = []
+        self.global_map = GlobalMap()
+        self.pose_graph = None
+        self.free_space = None
+        # 配准失败而使用编码器位姿先验的扫描数
+        self.registration_fallbacks = 0
+        
+        # 点云版本号，每次合并新扫描后递增，用作覆盖分析缓存的键
+        self.cloud_version = 0
+        
+        # 与扫描优化器共享的时间预测模型，执行时记录计时用于标定
+        self.cost_model = scan_optimizer.cost_model
+        self.last_eta = {}
+        
+        # 流水线扫描调度器与多扫描仪编排器，首次运行时创建
+        self.pipeline = None
+        self.orchestrator = None
+        
+        # 可选的检查点存储(ScanCheckpoint)，每轮扫描后增量写入
+        self.checkpoint = checkpoint
+        self.iterations_completed = 0
+        
+        # 累计电机行程(度)及最近一次预算扫描的报告
+        self.motor_travel = 0.0
+        self._travel_lock = threading.Lock()
+        self.last_budget_report = {}
+        # 最近一次扫描序列实际访问的视点数，及因预算提前停止的原因(未停止时为None)
+        self.last_sequence_visited = 0
+        self.last_sequence_stop = None
+    
+    @property
+    def current_scan_data(self):
+        """
+        当前全局地图的点字典列表(每次新建)；分析和规划使用 self.global_map.coords
+        """
+        return self.global_map.to_points()
     
     def initialize_system(self):
         """
@@ -51,33 +98,70 @@ class SystemController:
             self.logger.error(f"System initialization failed: {str(e)}")
             return False
     
-    def execute_scanning_sequence(self, scan_sequence):
+    @traced('acquisition', count=count_result)
+    def execute_scanning_sequence(self, scan_sequence, motor_ctrl=None, data_acq=None,
+                                  deadline=None, travel_limit=None, progress=None):
         """
         执行扫描序列
+        motor_ctrl/data_acq: 多扫描仪编排时指定执行的扫描仪，默认使用本控制器的组件
+        deadline/travel_limit: 预算扫描的截止时刻(time.perf_counter)和累计电机行程上限(度)，
+        每个视点转动前按当前时刻和实际累计行程检查，下一视点会超出预算时停止
+        progress: 本次序列的访问视点数、停止原因和电机行程写入该字典，不修改控制器的计数器；
+        多台扫描仪并发执行时各自传入，由调用方在汇合后合计。未提供时行程实时累加到 motor_travel，
+        结束后写入 last_sequence_visited/last_sequence_stop
         """
+        publish = progress is None
+        progress = {} if progress is None else progress
+        progress.update(visited=0, stop=None, travel=0.0)
+        travel_base = self.motor_travel
         try:
+            motor_ctrl = motor_ctrl or self.motor_ctrl
+            data_acq = data_acq or self.data_acq
             scan_data = []
             
             for viewpoint in scan_sequence:
-                # 移动到视点位置
-                position = viewpoint['position']
-                target = viewpoint['target']
+                before = self.motor_angles(motor_ctrl)
                 
-                # 计算电机角度
-                h_angle = np.arctan2(target[1] - position[1], target[0] - position[0])
-                v_angle = np.arctan2(target[2] - position[2], 
-                                   np.sqrt((target[0] - position[0])**2 + 
-                                         (target[1] - position[1])**2))
+                # 计算视点对应的电机绝对角度，与扫描序列和时间模型的计算一致
+                h_angle, v_angle = self.path_planner.viewpoint_angles(viewpoint['position'], viewpoint['target'])
                 
-                # 控制电机运动
-                self.motor_ctrl.rotate_horizontal(np.degrees(h_angle))
-                self.motor_ctrl.rotate_vertical(np.degrees(v_angle))
+                if travel_limit is not None and travel_base + progress['travel'] + \
+                        abs(h_angle - before[0]) + abs(v_angle - before[1]) > travel_limit:
+                    progress['stop'] = 'travel_budget'
+                    break
+                if deadline is not None:
+                    view_time = (float(self.cost_model.motion_time(before, (h_angle, v_angle)))
+                                 + self.cost_model.params['settle_time'] + self.cost_model.params['read_time'])
+                    if time.perf_counter() + view_time > deadline:
+                        progress['stop'] = 'time_budget'
+                        break
+                
+                move_start = time.perf_counter()
+                # 电机指令为相对转动，转动量为目标角度与当前编码器读数之差
+                motor_ctrl.rotate_horizontal(float(h_angle) - before[0])
+                motor_ctrl.rotate_vertical(float(v_angle) - before[1])
+                move_end = time.perf_counter()
+                after = self.motor_angles(motor_ctrl)
                 
                 # 等待运动完成
-                time.sleep(0.5)
+                time.sleep(VIEWPOINT_SETTLE_TIME)
+                settle_end = time.perf_counter()
                 
                 # 采集数据
-                point_data = self.data_acq.single_point_scan()
+                point_data = data_acq.single_point_scan()
+                read_end = time.perf_counter()
+                
+                # 记录各阶段计时，编码器读数给出实际转动角度
+                self.cost_model.record_move(after[0] - before[0], after[1] - before[1], move_end - move_start)
+                self.cost_model.record_settle(settle_end - move_end)
+                self.cost_model.record_read(read_end - settle_end)
+                leg = float(abs(after[0] - before[0]) + abs(after[1] - before[1]))
+                progress['travel'] += leg
+                progress['visited'] += 1
+                if publish:
+                    # 单扫描仪执行时实时累加，进度统计可以看到当前行程
+                    self.add_motor_travel(leg)
+                
                 if point_data:
                     scan_data.append(point_data)
             
@@ -86,10 +170,24 @@ class SystemController:
         except Exception as e:
             self.logger.error(f"Scanning sequence execution failed: {str(e)}")
             return None
+        
+        finally:
+            if publish:
+                self.last_sequence_visited = progress['visited']
+                self.last_sequence_stop = progress['stop']
+    
+    def add_motor_travel(self, travel):
+        """
+        累加电机行程(度)；采集线程与主线程都可能调用
+        """
+        with self._travel_lock:
+            self.motor_travel += travel
     
-    def run_automated_scan(self, completion_threshold=0.9, max_iterations=5):
+    def run_automated_scan(self, completion_threshold=0.9, max_iterations=5,
+                           registration_mode='sequential'):
         """
         运行自动化扫描过程
+        registration_mode: 'sequential' 逐次配准到全局地图，'multiway' 使用位姿图联合优化
         """
         try:
             self.logger.info("Starting automated scanning process...")
@@ -98,26 +196,33 @@ class SystemController:
             if not self.initialize_system():
                 return False
             
+            robot_constraints = self.prepare_workspace()
+            
+            scan_start = time.perf_counter()
             iteration = 0
             while iteration < max_iterations:
                 self.logger.info(f"Starting scan iteration {iteration + 1}")
                 
                 # 获取当前扫描计划
-                robot_constraints = {
-                    'x_min': -500, 'x_max': 500,
-                    'y_min': -500, 'y_max': 500,
-                    'z_min': 0, 'z_max': 500
-                }
-                
                 scan_plan = self.scan_optimizer.generate_next_scan(
-                    self.current_scan_data,
-                    robot_constraints
+                    self.global_map.coords,
+                    robot_constraints,
+                    version=self.cloud_version,
+                    current_angles=self.motor_angles(),
+                    target_coverage=completion_threshold
                 )
                 
                 if not scan_plan:
                     self.logger.info("No more scanning required")
                     break
                 
+                # 预测本轮耗时并报告预计剩余时间
+                prediction = scan_plan.get('prediction') or self.cost_model.predict_plan(
+                    scan_plan['viewpoints'], self.motor_angles()
+                )
+                self.report_eta(prediction, iteration, max_iterations, time.perf_counter() - scan_start)
+                iteration_start = time.perf_counter()
+                
                 # 执行扫描
                 new_scan_data = self.execute_scanning_sequence(scan_plan['viewpoints'])
                 
@@ -125,34 +230,31 @@ class SystemController:
                     self.logger.error("Failed to collect scan data")
                     break
                 
-                # 处理新数据
-                processed_data = self.process_scan_data(new_scan_data)
-                
-                # 注册和合并点云
-                if self.current_scan_data:
-                    transform, error = self.data_fusion.icp_registration(
-                        processed_data,
-                        self.current_scan_data
-                    )
-                    
-                    if transform is not None:
-                        self.transformations.append(transform)
-                        self.all_scans.append(processed_data)
-                        
-                        # 合并点云
-                        self.current_scan_data = self.data_fusion.merge_point_clouds(
-                            self.all_scans,
-                            self.transformations
-                        )
-                else:
-                    self.current_scan_data = processed_data
-                    self.all_scans.append(processed_data)
-                    self.transformations.append(np.eye(4))
+                processing_start = time.perf_counter()
+                
+                # 处理、配准并合并新数据
+                if not self.integrate_scan(new_scan_data, registration_mode):
+                    self.logger.error("Failed to process scan data")
+                    break
+                self.iterations_completed += 1
+                if self.checkpoint is not None:
+                    self.checkpoint.save(self, registration_mode, scan_plan['viewpoints'])
+                
+                # 用本轮实际计时标定时间模型
+                now = time.perf_counter()
+                self.cost_model.record_processing(len(new_scan_data), now - processing_start)
+                self.cost_model.record_prediction(prediction['total'], now - iteration_start)
+                self.cost_model.calibrate()
+                self.logger.info(
+                    f"Iteration {iteration + 1} took {now - iteration_start:.1f}s "
+                    f"(predicted {prediction['total']:.1f}s)"
+                )
                 
                 # 检查完成度
                 completion = self.scan_optimizer.estimate_completion(
-                    self.current_scan_data,
-                    threshold=completion_threshold
+                    self.global_map,
+                    threshold=completion_threshold,
+                    version=self.cloud_version
                 )
                 
                 if completion and completion['is_complete']:
@@ -161,12 +263,364 @@ class SystemController:
                 
                 iteration += 1
             
+            self.cost_model.save()
             return self.current_scan_data
             
         except Exception as e:
             self.logger.error(f"Automated scanning failed: {str(e)}")
             return None
     
+    def prepare_workspace(self):
+        """
+        返回机器人运动约束，并在工作空间上建立自由空间栅格
+        """
+        robot_constraints = {
+            'x_min': -500, 'x_max': 500,
+            'y_min': -500, 'y_max': 500,
+            'z_min': 0, 'z_max': 500
+        }
+        
+        if FREE_SPACE_CARVING and self.free_space is None:
+            self.free_space = LogOddsGrid(
+                (robot_constraints['x_min'], robot_constraints['y_min'], robot_constraints['z_min']),
+                (robot_constraints['x_max'], robot_constraints['y_max'], robot_constraints['z_max'])
+            )
+            self.scan_optimizer.free_space = self.free_space
+        
+        return robot_constraints
+    
+    def integrate_scan(self, raw_data, registration_mode='sequential', extrinsic=None):
+        """
+        处理一批原始数据并配准合并到全局地图，随后更新完成度统计和自由空间
+        extrinsic: 采集该数据的扫描仪到夹具坐标系的外参，单扫描仪时为None
+        """
+        # 处理新数据
+        processed_data = self.process_scan_data(raw_data)
+        
+        # 注册和合并点云
+        registered = self.register_scan(raw_data, processed_data, registration_mode, extrinsic)
+        
+        # 用新增的点增量更新完成度统计
+        self.scan_optimizer.update_occupancy(self.global_map)
+        
+        # 沿每条测量射线更新自由空间
+        if self.free_space is not None and registered:
+            self.integrate_free_space(raw_data)
+        
+        return registered
+    
+    def motor_angles(self, motor_ctrl=None):
+        """
+        当前水平/垂直电机编码器角度
+        """
+        motor_ctrl = motor_ctrl or self.motor_ctrl
+        return (motor_ctrl.horizontal_motor.position, motor_ctrl.vertical_motor.position)
+    
+    def progress_stats(self):
+        """
+        扫描进度与流水线队列深度，供性能报告和指标导出读取
+        """
+        stats = {
+            'iterations': self.iterations_completed,
+            'scans': len(self.all_scans),
+            'map_points': len(self.global_map),
+            'completion': self.scan_optimizer.last_completion,
+            'motor_travel': self.motor_travel,
+            'registration_fallbacks': self.registration_fallbacks,
+            'elapsed': self.last_eta.get('elapsed', 0.0),
+            'eta_remaining': self.last_eta.get('worst_case_remaining', 0.0)
+        }
+        if self.pipeline is not None:
+            stats['queues'] = self.pipeline.queue_depths()
+        return stats
+    
+    def report_eta(self, prediction, iteration, max_iterations, elapsed):
+        """
+        记录并输出本轮计划的预计耗时；剩余轮数未知，以剩余轮数上限按本轮预测估计最晚完成时间
+        """
+        remaining = max_iterations - iteration
+        self.last_eta = {
+            'iteration': iteration + 1,
+            'elapsed': elapsed,
+            'iteration_eta': prediction['total'],
+            'breakdown': {k: prediction[k] for k in ('motion', 'settle', 'sensing', 'processing')},
+            'worst_case_remaining': prediction['total'] * remaining
+        }
+        self.logger.info(
+            f"Iteration {iteration + 1}: {prediction['views']} views, ETA {prediction['total']:.1f}s "
+            f"(elapsed {elapsed:.1f}s, at most {self.last_eta['worst_case_remaining']:.1f}s remaining)"
+        )
+        return self.last_eta
+    
+    def run_budgeted_scan(self, time_budget, travel_budget=None, completion_threshold=0.9,
+                          registration_mode='sequential'):
+        """
+        在给定的时间预算(秒)和可选的电机行程预算(度)内尽可能提高覆盖率
+        每轮只执行预测能在剩余预算内完成的视点前缀，全局地图每轮合并后始终可用，
+        预算耗尽时返回目前最好的结果，覆盖率与预算使用情况见 self.last_budget_report
+        """
+        start = time.perf_counter()
+        travel_start = self.motor_travel
+        iterations, views = 0, 0
+        planning_time = 0.0
+        stop_reason = None
+        try:
+            self.logger.info(f"Starting budgeted scan: {time_budget:.0f}s"
+                             + (f", {travel_budget:.0f} degrees of travel" if travel_budget is not None else ""))
+            
+            if not self.initialize_system():
+                return False
+            
+            robot_constraints = self.prepare_workspace()
+            
+            while True:
+                # 剩余时间不足以完成上一轮的规划耗时则停止
+                if time_budget - (time.perf_counter() - start) <= planning_time:
+                    stop_reason = 'time_budget'
+                    break
+                
+                planning_start = time.perf_counter()
+                scan_plan = self.scan_optimizer.generate_next_scan(
+                    self.global_map.coords,
+                    robot_constraints,
+                    version=self.cloud_version,
+                    current_angles=self.motor_angles(),
+                    target_coverage=completion_threshold
+                )
+                planning_time = time.perf_counter() - planning_start
+                if not scan_plan:
+                    stop_reason = 'no_more_scanning'
+                    break
+                
+                # 规划本身也消耗预算，截取计划前再计算剩余量，并留出安全裕量
+                time_left = (time_budget - (time.perf_counter() - start)) * (1 - BUDGET_SAFETY_MARGIN)
+                travel_left = None if travel_budget is None else travel_budget - (self.motor_travel - travel_start)
+                viewpoints, prediction = self.cost_model.fit_to_budget(
+                    scan_plan['viewpoints'], self.motor_angles(), time_left, travel_left
+                )
+                if not viewpoints:
+                    stop_reason = 'budget_exhausted'
+                    break
+                
+                # 执行时逐个视点按实际用时和行程检查，并为之后的数据处理预留预测的处理时间
+                deadline = time.perf_counter() + time_left - prediction['processing']
+                travel_limit = None if travel_budget is None else travel_start + travel_budget
+                
+                self.logger.info(
+                    f"Budgeted iteration {self.iterations_completed + 1}: {len(viewpoints)}/"
+                    f"{len(scan_plan['viewpoints'])} views, predicted {prediction['total']:.1f}s "
+                    f"of {time_left:.1f}s left"
+                )
+                iteration_start = time.perf_counter()
+                
+                new_scan_data = self.execute_scanning_sequence(viewpoints, deadline=deadline,
+                                                               travel_limit=travel_limit)
+                budget_stop = self.last_sequence_stop
+                if not new_scan_data:
+                    stop_reason = budget_stop or 'acquisition_failed'
+                    break
+                
+                processing_start = time.perf_counter()
+                if not self.integrate_scan(new_scan_data, registration_mode):
+                    stop_reason = 'processing_failed'
+                    break
+                self.iterations_completed += 1
+                iterations += 1
+                views += self.last_sequence_visited
+                if self.checkpoint is not None:
+                    self.checkpoint.save(self, registration_mode, viewpoints)
+                
+                # 用实际计时标定，下一轮的计划截取随之调整
+                now = time.perf_counter()
+                self.cost_model.record_processing(len(new_scan_data), now - processing_start)
+                self.cost_model.record_prediction(prediction['total'], now - iteration_start)
+                self.cost_model.calibrate()
+                
+                completion = self.scan_optimizer.estimate_completion(
+                    self.global_map,
+                    threshold=completion_threshold,
+                    version=self.cloud_version
+                )
+                if completion and completion['is_complete']:
+                    stop_reason = 'complete'
+                    break
+                if budget_stop:
+                    # 已采集的视点合并后停止
+                    stop_reason = budget_stop
+                    break
+            
+        except Exception as e:
+            self.logger.error(f"Budgeted scanning failed: {str(e)}")
+            stop_reason = 'error'
+        
+        self.report_budget(start, time_budget, travel_start, travel_budget, iterations, views, stop_reason,
+                           completion_threshold)
+        return self.current_scan_data
+    
+    def report_budget(self, start, time_budget, travel_start, travel_budget, iterations, views, stop_reason,
+                      completion_threshold=0.9):
+        """
+        记录预算扫描达到的覆盖率与预算使用情况
+        """
+        completion = self.scan_optimizer.estimate_completion(
+            self.global_map,
+            threshold=completion_threshold,
+            version=self.cloud_version
+        ) if len(self.global_map) else None
+        time_spent = time.perf_counter() - start
+        travel_spent = self.motor_travel - travel_start
+        
+        self.last_budget_report = {
+            'coverage': completion['completion_rate'] if completion else 0.0,
+            'time_budget': time_budget,
+            'time_spent': time_spent,
+            'travel_budget': travel_budget,
+            'travel_spent': travel_spent,
+            'iterations': iterations,
+            'views': views,
+            'stop_reason': stop_reason
+        }
+        self.logger.info(
+            f"Budgeted scan stopped ({stop_reason}): coverage {self.last_budget_report['coverage']:.1%}, "
+            f"{time_spent:.1f}/{time_budget:.1f}s, {travel_spent:.0f} degrees of travel"
+        )
+        return self.last_budget_report
+    
+    def resume_automated_scan(self, checkpoint, completion_threshold=0.9, max_iterations=5):
+        """
+        从检查点恢复已完成的扫描并继续自动扫描；已采集的视点数据直接恢复，不会重新采集
+        checkpoint: ScanCheckpoint 或检查点目录；max_iterations 包含恢复前已完成的轮数
+        """
+        try:
+            if not isinstance(checkpoint, ScanCheckpoint):
+                checkpoint = ScanCheckpoint(checkpoint)
+            if checkpoint.manifest.get('raw_only'):
+                # 新的扫描不能追加到只有原始数据的会话中
+                self.logger.error("Checkpoint holds raw scans only and cannot be resumed")
+                return None
+            self.checkpoint = checkpoint
+            
+            state = checkpoint.restore(self)
+            if state is None:
+                self.logger.warning("No checkpoint found, starting a new scan")
+                return self.run_automated_scan(completion_threshold, max_iterations)
+            
+            remaining = max_iterations - self.iterations_completed
+            if remaining <= 0:
+                self.logger.info("Checkpoint already reached the iteration limit")
+                return self.current_scan_data
+            
+            return self.run_automated_scan(completion_threshold, remaining, state['registration_mode'])
+            
+        except Exception as e:
+            self.logger.error(f"Resuming automated scan failed: {str(e)}")
+            return None
+    
+    def run_multi_rig_scan(self, rigs, completion_threshold=0.9, max_iterations=5,
+                           registration_mode='sequential'):
+        """
+        用多台扫描仪(ScannerRig 列表)并行采集同一夹具上的物体并融合到本控制器的全局地图
+        各扫描仪的采集时间与并行加速比见 self.orchestrator.last_orchestration_stats
+        """
+        self.orchestrator = RigOrchestrator(self, rigs)
+        return self.orchestrator.run(completion_threshold, max_iterations, registration_mode)
+    
+    def run_pipelined_scan(self, completion_threshold=0.9, max_iterations=5,
+                           registration_mode='sequential', batch_size=PIPELINE_BATCH_SIZE):
+        """
+        流水线式自动扫描：采集下一批视点的同时处理上一批数据并重规划剩余视点
+        各阶段利用率见 self.pipeline.stats()
+        """
+        if self.pipeline is None or self.pipeline.batch_size != batch_size:
+            self.pipeline = ScanPipeline(self, batch_size)
+        return self.pipeline.run(completion_threshold, max_iterations, registration_mode)
+    
+    def register_scan(self, raw_data, processed_data, registration_mode='sequential', extrinsic=None):
+        """
+        配准新扫描并合并到全局地图
+        extrinsic: 扫描仪外参，与编码器位姿先验组合后作为配准初值
+        处理后没有数据(处理失败)时不合并，返回False
+        """
+        if not processed_data:
+            self.logger.error(f"Scan {len(self.all_scans)} has no processed points, not registered")
+            return False
+        
+        # 由电机编码器角度推算扫描位姿先验，以首次扫描坐标系为参考
+        prior = self.kinematics.scan_prior(raw_data)
+        if extrinsic is not None:
+            prior = np.asarray(extrinsic, dtype=float) @ prior
+        initial_transform = np.linalg.inv(self.scan_priors[0]) @ prior if self.scan_priors else np.eye(4)
+        max_distance = self.kinematics.correspondence_radius(raw_data)
+        
+        if registration_mode == 'multiway':
+            if self.pose_graph is None:
+                self.pose_graph = PoseGraph(max_correspondence_distance=max_distance)
+            
+            # 只计算新扫描相关的边，并以当前位姿为初值重新优化
+            self.pose_graph.add_scan(processed_data, initial_transform)
+            self.scan_priors.append(prior)
+            self.all_scans.append(processed_data)
+            self.transformations = list(self.pose_graph.optimize())
+            
+            for edge in self.pose_graph.edge_report():
+                self.logger.debug(f"Edge {edge['edge']}: error {edge['error']:.4f}, {edge['elapsed']:.3f}s")
+            
+            # 位姿整体更新后重建全局地图，之前的覆盖分析结果不再有效
+            self.global_map = GlobalMap()
+            for points, transform in zip(self.all_scans, self.transformations):
+                self.global_map.add_scan(points, transform)
+            self.scan_optimizer.coverage_cache.invalidate()
+        
+        elif len(self.global_map):
+            # 按位姿不确定度限制对应点搜索半径
+            transform, error = self.data_fusion.icp_registration(
+                processed_data,
+                self.global_map.coords,
+                initial_transform=initial_transform,
+                max_correspondence_distance=max_distance
+            )
+            
+            if transform is None:
+                # 配准失败时退回编码器位姿先验，扫描仍然合并
+                self.logger.warning(f"Registration of scan {len(self.all_scans)} failed, "
+                                    f"falling back to the encoder pose prior")
+                self.registration_fallbacks += 1
+                transform = initial_transform
+            
+            self.scan_priors.append(prior)
+            self.transformations.append(transform)
+            self.all_scans.append(processed_data)
+            
+            # 增量合并：只变换新扫描并按体素与全局地图去重
+            self.global_map.add_scan(processed_data, transform)
+        
+        else:
+            self.scan_priors.append(prior)
+            self.all_scans.append(processed_data)
+            self.transformations.append(np.eye(4))
+            self.global_map.add_scan(processed_data, np.eye(4))
+        
+        self.raw_scans.append(raw_data)
+        self.cloud_version += 1
+        return True
+    
+    def integrate_free_space(self, raw_data, transform=None):
+        """
+        将一次扫描的测量射线变换到全局坐标系并积分到自由空间栅格
+        transform: 扫描的配准变换，默认为最近一次扫描的变换
+        """
+        try:
+            origins, endpoints = self.kinematics.measurement_rays(raw_data)
+            if transform is None:
+                transform = self.transformations[-1]
+            rotation, translation = transform[:3, :3], transform[:3, 3]
+            return self.free_space.integrate_rays(origins @ rotation.T + translation,
+                                                  endpoints @ rotation.T + translation)
+            
+        except Exception as e:
+            self.logger.error(f"Free space update failed: {str(e)}")
+            return False
+    
     def process_scan_data(self, raw_data):
         """
         处理扫描数据
@@ -196,6 +650,8 @@ class SystemController:
             
             # 停止所有进行中的操作
             self.is_scanning = False
+            if self.pose_graph is not None:
+                self.pose_graph.close()
             
             # 重置到安全位置
             self.motor_ctrl.reset_motors()
@@ -20,11 +20,13 @@ class DataAcquisition:
             if distance is not None:
                 angle_h = self.motor_ctrl.horizontal_motor.position
                 angle_v = self.motor_ctrl.vertical_motor.position
+                lift = self.motor_ctrl.scanner_motor.position
                 
                 point_data = {
                     'distance': distance,
                     'angle_h': angle_h,
                     'angle_v': angle_v,
+                    'lift': lift,
                     'timestamp': time.time()
                 }
                 return point_data
@@ -2,107 +2,242 @@
 Data fusion and registration for multiple scans
 """
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
 import logging
 from config import *
+from performance_monitor import traced, count_argument
+from global_map import GlobalMap
 
 class DataFusion:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        self.last_registration_stats = {}
         
-    def icp_registration(self, source_points, target_points, max_iterations=50, tolerance=0.001):
+    @traced('icp', count=count_argument(1, 'source_points'))
+    def icp_registration(self, source_points, target_points, max_iterations=50, tolerance=0.001,
+                         voxel_sizes=None, relative_tolerance=ICP_RELATIVE_TOLERANCE,
+                         method='point_to_point', target_normals=None,
+                         initial_transform=None, max_correspondence_distance=None):
         """
-        使用ICP（迭代最近点）算法进行点云配准
+        使用由粗到精的多分辨率ICP（迭代最近点）算法进行点云配准
+        voxel_sizes: 由粗到细的体素尺寸列表，最后总是在原始分辨率上精配准；None时按点云尺寸自动选择
+        method: 'point_to_point' 或 'point_to_plane'（使用目标点云的法向量）
+        initial_transform: 初始4x4转换矩阵（如由电机编码器位姿推算），None时从单位矩阵开始
+        max_correspondence_distance: 对应点的最大搜索半径，超出的点对不参与求解
+        返回累积的4x4转换矩阵及原始分辨率下的平均配准误差
+        原始分辨率层在搜索半径内的对应点不足时配准失败，返回 (None, None)，
+        last_registration_stats['converged'] 为 False，调用方应退回初值(编码器位姿先验)
         """
         try:
             # 转换为numpy数组
-            source = np.array([[p['x'], p['y'], p['z']] for p in source_points])
-            target = np.array([[p['x'], p['y'], p['z']] for p in target_points])
+            source = self._to_array(source_points)
+            target = self._to_array(target_points)
             
-            # 初始化转换矩阵
-            transformation = np.eye(4)
+            if method == 'point_to_plane' and target_normals is None:
+                target_normals = self.estimate_normals(target)
+            if target_normals is not None:
+                target_normals = np.asarray(target_normals, dtype=float)
             
-            # 创建最近邻搜索器
-            nbrs = NearestNeighbors(n_neighbors=1, algorithm='kd_tree').fit(target)
+            # 构建由粗到精的金字塔
+            if voxel_sizes is None:
+                diagonal = np.linalg.norm(np.ptp(target, axis=0))
+                voxel_sizes = [diagonal * ratio for ratio in ICP_PYRAMID_RATIOS]
+            levels = [size for size in voxel_sizes if size and size > 0] + [None]
             
-            for iteration in range(max_iterations):
-                # 找到最近邻点
-                distances, indices = nbrs.kneighbors(source)
-                
-                # 计算质心
-                source_centroid = np.mean(source, axis=0)
-                target_centroid = np.mean(target[indices[:, 0]], axis=0)
-                
-                # 去中心化
-                source_centered = source - source_centroid
-                target_centered = target[indices[:, 0]] - target_centroid
-                
-                # 计算最优旋转
-                H = np.dot(source_centered.T, target_centered)
-                U, S, Vt = np.linalg.svd(H)
-                R = np.dot(Vt.T, U.T)
-                
-                # 确保旋转矩阵是正交的
-                if np.linalg.det(R) < 0:
-                    Vt[-1, :] *= -1
-                    R = np.dot(Vt.T, U.T)
-                
-                # 计算平移
-                t = target_centroid - np.dot(source_centroid, R.T)
+            # 初始化转换矩阵
+            transformation = np.eye(4) if initial_transform is None else np.array(initial_transform, dtype=float)
+            error = None
+            self.last_registration_stats = {'levels': []}
+            
+            for voxel_size in levels:
+                if voxel_size is None:
+                    level_source, level_target, level_normals = source, target, target_normals
+                else:
+                    level_source, _ = self.voxel_downsample(source, voxel_size)
+                    level_target, keep = self.voxel_downsample(target, voxel_size)
+                    level_normals = target_normals[keep] if target_normals is not None else None
+                    # 下采样后点数过少则跳过该层
+                    if len(level_source) < ICP_MIN_LEVEL_POINTS or len(level_target) < ICP_MIN_LEVEL_POINTS:
+                        continue
                 
-                # 更新源点云
-                source = np.dot(source, R.T) + t
+                # 粗层的搜索半径不能小于体素尺寸
+                max_distance = max_correspondence_distance
+                if max_distance is not None and voxel_size is not None:
+                    max_distance = max(max_distance, voxel_size)
                 
-                # 检查收敛
-                error = np.mean(distances)
-                if error < tolerance:
-                    break
-            
-            # 构建最终转换矩阵
-            transformation[:3, :3] = R
-            transformation[:3, 3] = t
+                level_transform, error, iterations = self._icp_level(
+                    level_source, level_target, transformation, max_iterations,
+                    tolerance, relative_tolerance, method, level_normals, max_distance
+                )
+                transformation = level_transform
+                self.last_registration_stats['levels'].append({
+                    'voxel_size': float(voxel_size) if voxel_size else None,
+                    'source_points': len(level_source),
+                    'target_points': len(level_target),
+                    'iterations': iterations,
+                    'error': error
+                })
             
+            self.last_registration_stats['converged'] = error is not None
+            if error is None:
+                self.logger.warning("ICP registration failed: too few correspondences within the search radius")
+                return None, None
             return transformation, error
             
         except Exception as e:
             self.logger.error(f"ICP registration failed: {str(e)}")
+            self.last_registration_stats['converged'] = False
             return None, None
     
-    def merge_point_clouds(self, point_clouds, transformations):
+    def _icp_level(self, source, target, transformation, max_iterations, tolerance,
+                   relative_tolerance, method, target_normals=None, max_distance=None):
         """
-        合并多个已配准的点云
+        在单个金字塔层上执行ICP迭代，目标点云的最近邻索引只构建一次
+        搜索半径内的对应点不足时该层失败：误差为None，返回输入的转换
         """
-        try:
-            merged_points = []
+        from sklearn.neighbors import NearestNeighbors
+        
+        # 创建最近邻搜索器
+        nbrs = NearestNeighbors(n_neighbors=1, algorithm='kd_tree').fit(target)
+        use_plane = method == 'point_to_plane' and target_normals is not None
+        
+        initial = transformation
+        error = None
+        prev_error = None
+        iteration = 0
+        for iteration in range(1, max_iterations + 1):
+            # 应用当前累积的转换
+            moved = source @ transformation[:3, :3].T + transformation[:3, 3]
             
-            for i, points in enumerate(point_clouds):
-                # 应用转换
-                transformed_points = []
-                for point in points:
-                    p = np.array([point['x'], point['y'], point['z'], 1.0])
-                    p_transformed = np.dot(transformations[i], p)
-                    transformed_points.append({
-                        'x': p_transformed[0],
-                        'y': p_transformed[1],
-                        'z': p_transformed[2],
-                        'timestamp': point['timestamp']
-                    })
-                
-                merged_points.extend(transformed_points)
+            # 找到最近邻点
+            distances, indices = nbrs.kneighbors(moved)
+            distances, indices = distances[:, 0], indices[:, 0]
+            
+            # 剔除超出搜索半径的对应点
+            if max_distance is not None:
+                inliers = distances <= max_distance
+                if np.count_nonzero(inliers) < 3:
+                    self.logger.debug(f"Too few correspondences within {max_distance:.2f} at iteration {iteration}")
+                    return initial, None, iteration
+                moved, distances, indices = moved[inliers], distances[inliers], indices[inliers]
             
-            # 移除重复点
-            coords = np.array([[p['x'], p['y'], p['z']] for p in merged_points])
-            tree = NearestNeighbors(n_neighbors=2, algorithm='kd_tree').fit(coords)
-            distances, indices = tree.kneighbors(coords)
+            matched = target[indices]
+            error = float(np.mean(distances))
             
-            # 使用集合记录要保留的点的索引
-            unique_indices = set()
-            for i, (dist, idx) in enumerate(zip(distances, indices)):
-                if i not in unique_indices and dist[1] > 0.01:  # 距离阈值
-                    unique_indices.add(i)
+            # 检查收敛：绝对误差或误差的相对改善停滞
+            if error < tolerance:
+                break
+            if prev_error is not None and prev_error - error <= relative_tolerance * prev_error:
+                break
+            prev_error = error
+            
+            if use_plane:
+                R, t = self._solve_point_to_plane(moved, matched, target_normals[indices])
+            else:
+                R, t = self._solve_point_to_point(moved, matched)
+            
+            # 累积转换
+            step = np.eye(4)
+            step[:3, :3] = R
+            step[:3, 3] = t
+            transformation = step @ transformation
+        
+        return transformation, error, iteration
+    
+    def _solve_point_to_point(self, source, target):
+        """
+        使用SVD求解点到点的最优刚体变换
+        """
+        # 计算质心
+        source_centroid = np.mean(source, axis=0)
+        target_centroid = np.mean(target, axis=0)
+        
+        # 计算最优旋转
+        H = (source - source_centroid).T @ (target - target_centroid)
+        U, S, Vt = np.linalg.svd(H)
+        R = Vt.T @ U.T
+        
+        # 确保旋转矩阵是正交的
+        if np.linalg.det(R) < 0:
+            Vt[-1, :] *= -1
+            R = Vt.T @ U.T
+        
+        # 计算平移
+        t = target_centroid - source_centroid @ R.T
+        return R, t
+    
+    def _solve_point_to_plane(self, source, target, normals):
+        """
+        线性化求解点到平面的最优刚体变换
+        """
+        A = np.hstack([np.cross(source, normals), normals])
+        b = np.einsum('ij,ij->i', target - source, normals)
+        x, *_ = np.linalg.lstsq(A, b, rcond=None)
+        return self._rotation_from_vector(x[:3]), x[3:]
+    
+    @staticmethod
+    def _rotation_from_vector(rotvec):
+        """
+        由旋转向量计算旋转矩阵（Rodrigues公式）
+        """
+        theta = np.linalg.norm(rotvec)
+        if theta < 1e-12:
+            return np.eye(3)
+        k = rotvec / theta
+        K = np.array([[0, -k[2], k[1]],
+                      [k[2], 0, -k[0]],
+                      [-k[1], k[0], 0]])
+        return np.eye(3) + np.sin(theta) * K + (1 - np.cos(theta)) * (K @ K)
+    
+    @staticmethod
+    def _to_array(points):
+        """
+        将点字典列表转换为Nx3数组
+        """
+        if isinstance(points, np.ndarray):
+            return points[:, :3].astype(float)
+        return np.array([[p['x'], p['y'], p['z']] for p in points], dtype=float).reshape(-1, 3)
+    
+    @staticmethod
+    def voxel_downsample(coords, voxel_size):
+        """
+        体素下采样：每个体素用其内点的质心表示
+        返回下采样后的点及每个体素中第一个原始点的索引
+        """
+        keys = np.floor(coords / voxel_size).astype(np.int64)
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse)
+        centroids = np.column_stack([
+            np.bincount(inverse, weights=coords[:, i]) / counts for i in range(3)
+        ])
+        return centroids, first
+    
+    def estimate_normals(self, coords, k_neighbors=10):
+        """
+        基于局部协方差的批量法向量估计
+        """
+        from sklearn.neighbors import NearestNeighbors
+        
+        k = min(k_neighbors, len(coords))
+        _, indices = NearestNeighbors(n_neighbors=k, algorithm='kd_tree').fit(coords).kneighbors(coords)
+        neighbors = coords[indices]
+        centered = neighbors - neighbors.mean(axis=1, keepdims=True)
+        cov = np.einsum('nki,nkj->nij', centered, centered)
+        # 最小特征值对应的特征向量即为法向量
+        _, eigvecs = np.linalg.eigh(cov)
+        return eigvecs[:, :, 0]
+    
+    def merge_point_clouds(self, point_clouds, transformations, voxel_size=MERGE_VOXEL_SIZE):
+        """
+        合并多个已配准的点云，同一体素内只保留一个点
+        扫描过程中应使用 GlobalMap 增量合并，只处理新扫描的点
+        """
+        try:
+            global_map = GlobalMap(voxel_size)
+            for points, transformation in zip(point_clouds, transformations):
+                global_map.add_scan(points, transformation)
             
-            # 返回唯一的点
-            return [merged_points[i] for i in unique_indices]
+            return global_map.to_points()
             
         except Exception as e:
             self.logger.error(f"Point cloud merging failed: {str(e)}")
@@ -2,14 +2,15 @@
 Data preprocessing and cleaning for scanned point data
 """
 import numpy as np
-from scipy.signal import medfilt
 import logging
 from config import *
+from performance_monitor import traced, count_argument
 
 class DataPreprocessor:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
     
+    @traced('conversion', count=count_argument(1, 'scan_data'))
     def convert_to_cartesian(self, scan_data):
         """
         将极坐标数据转换为笛卡尔坐标系
@@ -40,6 +41,7 @@ class DataPreprocessor:
             self.logger.error(f"Coordinate conversion failed: {str(e)}")
             return None
 
+    @traced('outlier_removal', count=count_argument(1, 'points'))
     def remove_outliers(self, points, std_dev_threshold=2.0):
         """
         使用统计方法移除异常点
@@ -72,6 +74,8 @@ class DataPreprocessor:
         对点云数据应用中值滤波
         """
         try:
+            from scipy.signal import medfilt
+            
             coords = np.array([[p['x'], p['y'], p['z']] for p in points])
             
             # 对每个维度分别进行中值滤波
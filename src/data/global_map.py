@@ -0,0 +1,124 @@
+"""
+Incrementally maintained global point cloud map
+增量维护的全局点云地图，按体素去重
+"""
+import numpy as np
+import logging
+from config import *
+from performance_monitor import traced, count_argument
+
+# 体素坐标打包为单个int64时每个轴占用的位数
+_KEY_BITS = 21
+_KEY_OFFSET = 1 << (_KEY_BITS - 1)
+_KEY_MASK = (1 << _KEY_BITS) - 1
+
+
+def as_coords(points):
+    """
+    点字典列表或Nx3数组 -> Nx3浮点数组；已是浮点数组时直接返回，不复制
+    """
+    if isinstance(points, np.ndarray):
+        return points[:, :3] if points.dtype == float else points[:, :3].astype(float)
+    return np.array([[p['x'], p['y'], p['z']] for p in points], dtype=float).reshape(-1, 3)
+
+
+def voxel_keys(coords, voxel_size):
+    """
+    将点坐标量化为体素并打包为int64键
+    """
+    cells = np.floor(coords / voxel_size).astype(np.int64) + _KEY_OFFSET
+    cells &= _KEY_MASK
+    return (cells[:, 0] << (2 * _KEY_BITS)) | (cells[:, 1] << _KEY_BITS) | cells[:, 2]
+
+
+class GlobalMap:
+    def __init__(self, voxel_size=MERGE_VOXEL_SIZE, initial_capacity=1024):
+        self.logger = logging.getLogger(__name__)
+        self.voxel_size = voxel_size
+        
+        # 按容量倍增的坐标缓冲区，避免每次合并都复制全部点
+        self._coords = np.empty((initial_capacity, 3))
+        self._size = 0
+        self._keys = set()
+        self._timestamps = []
+        
+        self.version = 0
+        self.last_added = np.empty((0, 3))
+    
+    def __len__(self):
+        return self._size
+    
+    @property
+    def coords(self):
+        """
+        当前地图中所有点的Nx3坐标（只读视图，随地图增量维护，覆盖分析和配准直接使用）
+        """
+        view = self._coords[:self._size]
+        view.flags.writeable = False
+        return view
+    
+    @traced('merge', count=count_argument(1, 'points'))
+    def add_scan(self, points, transformation=None):
+        """
+        将一次新扫描变换到全局坐标系并合并，只处理新点
+        返回实际加入地图的点数
+        """
+        try:
+            if len(points) == 0:
+                self.last_added = np.empty((0, 3))
+                return 0
+            
+            if isinstance(points, np.ndarray):
+                coords, timestamps = as_coords(points), [None] * len(points)
+            else:
+                coords = as_coords(points)
+                timestamps = [p.get('timestamp') for p in points]
+            
+            # 一次矩阵乘法完成刚体变换
+            if transformation is not None:
+                coords = coords @ transformation[:3, :3].T + transformation[:3, 3]
+            
+            # 新扫描内部去重：每个体素保留第一个点
+            keys = voxel_keys(coords, self.voxel_size)
+            keys, first = np.unique(keys, return_index=True)
+            
+            # 与已有地图去重
+            existing = self._keys
+            fresh = np.fromiter((k not in existing for k in keys.tolist()), dtype=bool, count=len(keys))
+            keep = np.sort(first[fresh])
+            existing.update(keys[fresh].tolist())
+            
+            new_coords = coords[keep]
+            self._append(new_coords)
+            self._timestamps.extend(timestamps[i] for i in keep.tolist())
+            
+            self.last_added = new_coords
+            self.version += 1
+            return len(new_coords)
+            
+        except Exception as e:
+            self.logger.error(f"Global map update failed: {str(e)}")
+            return 0
+    
+    def _append(self, new_coords):
+        """
+        追加坐标，容量不足时倍增
+        """
+        required = self._size + len(new_coords)
+        if required > len(self._coords):
+            capacity = max(required, 2 * len(self._coords))
+            grown = np.empty((capacity, 3))
+            grown[:self._size] = self._coords[:self._size]
+            self._coords = grown
+        self._coords[self._size:required] = new_coords
+        self._size = required
+    
+    def to_points(self):
+        """
+        以点字典列表的形式返回地图；每次返回新的列表，修改它不会影响地图
+        需要坐标数组时应使用 coords，避免构建字典
+        """
+        return [
+            {'x': x, 'y': y, 'z': z, 'timestamp': timestamp}
+            for (x, y, z), timestamp in zip(self.coords.tolist(), self._timestamps)
+        ]
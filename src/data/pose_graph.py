@@ -0,0 +1,229 @@
+"""
+Multi-way registration with pose-graph optimization
+多视角配准：并行计算两两ICP并联合优化所有扫描位姿
+"""
+import time
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from config import *
+from data_fusion import DataFusion
+
+
+def _pairwise_registration(task):
+    """
+    在工作进程中执行一条边的ICP配准（模块级函数以便进程池序列化）
+    """
+    i, j, target, source, initial_transform, max_distance = task
+    start = time.time()
+    transform, error = DataFusion().icp_registration(
+        source, target,
+        initial_transform=initial_transform,
+        max_correspondence_distance=max_distance
+    )
+    return i, j, transform, error, time.time() - start
+
+
+def _to_vector(pose):
+    """
+    4x4位姿转换为6维参数（旋转向量 + 平移）
+    """
+    from scipy.spatial.transform import Rotation
+    return np.concatenate([Rotation.from_matrix(pose[:3, :3]).as_rotvec(), pose[:3, 3]])
+
+
+def _to_matrix(vector):
+    """
+    6维参数转换为4x4位姿
+    """
+    from scipy.spatial.transform import Rotation
+    pose = np.eye(4)
+    pose[:3, :3] = Rotation.from_rotvec(vector[:3]).as_matrix()
+    pose[:3, 3] = vector[3:]
+    return pose
+
+
+class PoseGraph:
+    def __init__(self, max_workers=None, min_overlap=POSE_GRAPH_MIN_OVERLAP,
+                 max_correspondence_distance=None):
+        self.logger = logging.getLogger(__name__)
+        self.max_workers = max_workers
+        self.min_overlap = min_overlap
+        self.max_correspondence_distance = max_correspondence_distance
+        
+        self.scans = []
+        self.poses = []
+        self.edges = {}
+        
+        # 并行配准复用的进程池，首次需要时创建，close() 时关闭
+        self._executor = None
+    
+    def add_scan(self, points, initial_pose=None):
+        """
+        加入一次新扫描，只为新扫描与重叠的已有扫描计算新的边
+        返回新扫描的节点编号
+        """
+        coords = DataFusion._to_array(points)
+        self.scans.append(coords)
+        self.poses.append(np.eye(4) if initial_pose is None else np.array(initial_pose, dtype=float))
+        
+        new_index = len(self.scans) - 1
+        pairs = [(i, new_index) for i in range(new_index) if self._overlaps(i, new_index)]
+        # 至少与前一次扫描相连，保证位姿图连通
+        if new_index > 0 and not any(i == new_index - 1 for i, _ in pairs):
+            pairs.append((new_index - 1, new_index))
+        
+        self.compute_edges(pairs)
+        if new_index > 0 and not any(new_index in edge for edge in self.edges):
+            self.logger.warning(f"Scan {new_index} has no registration edges, keeping its encoder prior pose")
+        return new_index
+    
+    def _world_bounds(self, index):
+        """
+        扫描在当前位姿估计下的世界坐标包围盒
+        """
+        pose = self.poses[index]
+        coords = self.scans[index] @ pose[:3, :3].T + pose[:3, 3]
+        return coords.min(axis=0), coords.max(axis=0)
+    
+    def _overlaps(self, i, j):
+        """
+        以包围盒交集体积占较小包围盒的比例判断两次扫描是否重叠
+        """
+        min_i, max_i = self._world_bounds(i)
+        min_j, max_j = self._world_bounds(j)
+        extent = np.clip(np.minimum(max_i, max_j) - np.maximum(min_i, min_j), 0, None)
+        smaller = min(np.prod(max_i - min_i), np.prod(max_j - min_j))
+        if smaller <= 0:
+            return bool(np.all(extent > 0))
+        return np.prod(extent) / smaller >= self.min_overlap
+    
+    def compute_edges(self, pairs):
+        """
+        计算两两ICP配准，结果保存为位姿图的边
+        新增的边较少时串行计算，否则在复用的进程池中并行计算
+        """
+        tasks = []
+        for i, j in pairs:
+            if (i, j) in self.edges:
+                continue
+            # 用当前位姿估计作为相对变换的初值
+            initial = np.linalg.inv(self.poses[i]) @ self.poses[j]
+            tasks.append((i, j, self.scans[i], self.scans[j], initial, self.max_correspondence_distance))
+        
+        if not tasks:
+            return
+        
+        if self.max_workers == 1 or len(tasks) < POSE_GRAPH_PARALLEL_MIN_PAIRS:
+            results = map(_pairwise_registration, tasks)
+        else:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            results = list(self._executor.map(_pairwise_registration, tasks))
+        
+        for i, j, transform, error, elapsed in results:
+            # 配准失败(无有效对应点)的点对不建立边，不能以默认误差参与优化
+            if transform is None or error is None:
+                self.logger.warning(f"Pairwise registration {i}-{j} failed, edge skipped")
+                continue
+            # 以配准误差的倒数平方作为边的信息权重
+            self.edges[(i, j)] = {
+                'transform': transform,
+                'error': error,
+                'weight': 1.0 / (error ** 2 + 1e-9),
+                'elapsed': elapsed
+            }
+    
+    def edge_array(self):
+        """
+        所有边按行打包为浮点数组(i, j, 误差, 信息权重, 耗时, 4x4变换)，供检查点保存
+        """
+        return np.array([
+            [i, j, edge['error'], edge['weight'], edge['elapsed']] + edge['transform'].ravel().tolist()
+            for (i, j), edge in sorted(self.edges.items())
+        ], dtype=float).reshape(-1, 21)
+    
+    def restore(self, scans, poses, edges=None):
+        """
+        从检查点恢复节点；有保存的边时直接使用，否则一次性提交所有点对，经复用的进程池并行计算
+        """
+        self.scans = [DataFusion._to_array(points) for points in scans]
+        self.poses = [np.array(pose, dtype=float) for pose in poses]
+        self.edges = {}
+        
+        if edges is not None and len(edges):
+            for row in np.asarray(edges, dtype=float):
+                self.edges[(int(row[0]), int(row[1]))] = {
+                    'transform': row[5:].reshape(4, 4),
+                    'error': float(row[2]),
+                    'weight': float(row[3]),
+                    'elapsed': float(row[4])
+                }
+            return
+        
+        pairs = []
+        for j in range(1, len(self.scans)):
+            pairs += [(i, j) for i in range(j) if self._overlaps(i, j)]
+            if (j - 1, j) not in pairs:
+                pairs.append((j - 1, j))
+        self.compute_edges(pairs)
+    
+    def close(self):
+        """
+        关闭复用的进程池
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+    
+    def optimize(self, max_nfev=100):
+        """
+        以第一次扫描为参考，稀疏最小二乘联合优化所有位姿
+        """
+        try:
+            n = len(self.poses)
+            if n < 2 or not self.edges:
+                return self.poses
+            
+            edges = list(self.edges.items())
+            anchor = self.poses[0]
+            x0 = np.concatenate([_to_vector(pose) for pose in self.poses[1:]])
+            
+            def pose_of(x, k):
+                return anchor if k == 0 else _to_matrix(x[6 * (k - 1):6 * k])
+            
+            def residuals(x):
+                res = np.empty(6 * len(edges))
+                for e, ((i, j), edge) in enumerate(edges):
+                    predicted = np.linalg.inv(pose_of(x, i)) @ pose_of(x, j)
+                    delta = np.linalg.inv(edge['transform']) @ predicted
+                    res[6 * e:6 * e + 6] = np.sqrt(edge['weight']) * _to_vector(delta)
+                return res
+            
+            from scipy.optimize import least_squares
+            from scipy.sparse import lil_matrix
+            
+            # 每条边的残差只依赖两端节点的参数
+            sparsity = lil_matrix((6 * len(edges), 6 * (n - 1)), dtype=int)
+            for e, ((i, j), _) in enumerate(edges):
+                for k in (i, j):
+                    if k > 0:
+                        sparsity[6 * e:6 * e + 6, 6 * (k - 1):6 * k] = 1
+            
+            result = least_squares(residuals, x0, jac_sparsity=sparsity, x_scale='jac',
+                                   method='trf', max_nfev=max_nfev)
+            self.poses = [anchor] + [pose_of(result.x, k) for k in range(1, n)]
+            return self.poses
+            
+        except Exception as e:
+            self.logger.error(f"Pose graph optimization failed: {str(e)}")
+            return self.poses
+    
+    def edge_report(self):
+        """
+        每条边的配准误差与耗时
+        """
+        return [
+            {'edge': (i, j), 'error': edge['error'], 'elapsed': edge['elapsed']}
+            for (i, j), edge in sorted(self.edges.items())
+        ]
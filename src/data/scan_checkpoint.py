@@ -0,0 +1,237 @@
+"""
+Checkpoint storage for long automated scans
+长时间自动扫描的检查点存储
+"""
+import os
+import json
+import logging
+import numpy as np
+from config import *
+from global_map import GlobalMap
+from pose_graph import PoseGraph
+
+RAW_FIELDS = ('distance', 'angle_h', 'angle_v', 'lift', 'timestamp')
+POINT_FIELDS = ('x', 'y', 'z', 'timestamp')
+
+def _to_records(points, fields):
+    """
+    点字典列表 -> 按字段排列的浮点数组，缺失字段记为NaN
+    """
+    return np.array([[np.nan if p.get(f) is None else p[f] for f in fields] for p in points],
+                    dtype=float).reshape(-1, len(fields))
+
+def _from_records(array, fields):
+    """
+    浮点数组 -> 点字典列表
+    """
+    return [
+        {f: (None if np.isnan(v) else v) for f, v in zip(fields, row)}
+        for row in np.asarray(array).tolist()
+    ]
+
+class ScanCheckpoint:
+    """
+    分块的二进制检查点：每次扫描的原始数据和处理后点云各写一个 .npy 文件（只写新增扫描），
+    位姿数组较小，每次整体重写；manifest.json 最后原子替换，是唯一的提交点
+    """
+    def __init__(self, directory=CHECKPOINT_DIR):
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.scan_dir = os.path.join(directory, 'scans')
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        os.makedirs(self.scan_dir, exist_ok=True)
+        self.manifest = self._load_manifest()
+    
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'scans': [], 'iterations': 0, 'registration_mode': 'sequential', 'viewpoints': []}
+    
+    @staticmethod
+    def _atomic_save(path, array):
+        """
+        先写临时文件并落盘，再原子替换
+        """
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.save(f, array)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    
+    def _atomic_json(self, path, data):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    
+    def save(self, controller, registration_mode='sequential', viewpoints=None):
+        """
+        增量写入检查点：只写入上次检查点之后新增的扫描
+        """
+        try:
+            scans = self.manifest['scans']
+            for index in range(len(scans), len(controller.all_scans)):
+                raw_name = f"raw_{index:05d}.npy"
+                points_name = f"points_{index:05d}.npy"
+                self._atomic_save(os.path.join(self.scan_dir, raw_name),
+                                  _to_records(controller.raw_scans[index], RAW_FIELDS))
+                self._atomic_save(os.path.join(self.scan_dir, points_name),
+                                  _to_records(controller.all_scans[index], POINT_FIELDS))
+                scans.append({
+                    'raw': raw_name,
+                    'points': points_name,
+                    'raw_count': len(controller.raw_scans[index]),
+                    'point_count': len(controller.all_scans[index])
+                })
+            
+            # 多视图配准会更新所有位姿，位姿数组较小，整体重写
+            previous_poses = self.manifest.get('poses', {})
+            poses = {}
+            for name, matrices in (('transformations', controller.transformations),
+                                   ('priors', controller.scan_priors)):
+                poses[name] = f"{name}_{len(scans):05d}.npy"
+                self._atomic_save(os.path.join(self.directory, poses[name]),
+                                  np.asarray(matrices, dtype=float).reshape(-1, 4, 4))
+            if registration_mode == 'multiway' and controller.pose_graph is not None:
+                # 位姿图的边(配准变换与信息权重)一并保存，恢复时不需要重新配准
+                poses['edges'] = f"edges_{len(scans):05d}.npy"
+                self._atomic_save(os.path.join(self.directory, poses['edges']), controller.pose_graph.edge_array())
+            
+            self.manifest.update(
+                scans=scans,
+                poses=poses,
+                iterations=controller.iterations_completed,
+                registration_mode=registration_mode,
+                cloud_version=controller.cloud_version
+            )
+            if viewpoints:
+                self.manifest['viewpoints'].extend(
+                    {'position': list(map(float, vp['position'])), 'target': list(map(float, vp['target']))}
+                    for vp in viewpoints
+                )
+            self._atomic_json(self.manifest_path, self.manifest)
+            
+            # 提交后再删除旧的位姿文件
+            for name in set(previous_poses.values()) - set(poses.values()):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Checkpoint save failed: {str(e)}")
+            return False
+    
+    def save_raw(self, raw_data):
+        """
+        只记录一次扫描的原始数据(采集专用入口)，处理后点云和位姿留空，由离线批处理重新计算
+        """
+        try:
+            if 'poses' in self.manifest and not self.manifest.get('raw_only'):
+                raise ValueError("Checkpoint already contains processed scans")
+            scans = self.manifest['scans']
+            index = len(scans)
+            raw_name = f"raw_{index:05d}.npy"
+            points_name = f"points_{index:05d}.npy"
+            self._atomic_save(os.path.join(self.scan_dir, raw_name), _to_records(raw_data, RAW_FIELDS))
+            self._atomic_save(os.path.join(self.scan_dir, points_name), np.empty((0, len(POINT_FIELDS))))
+            scans.append({'raw': raw_name, 'points': points_name, 'raw_count': len(raw_data), 'point_count': 0})
+            
+            if 'poses' not in self.manifest:
+                poses = {name: f"{name}_raw.npy" for name in ('transformations', 'priors')}
+                for path in poses.values():
+                    self._atomic_save(os.path.join(self.directory, path), np.empty((0, 4, 4)))
+                self.manifest['poses'] = poses
+            self.manifest.update(scans=scans, raw_only=True)
+            self._atomic_json(self.manifest_path, self.manifest)
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Raw checkpoint save failed: {str(e)}")
+            return False
+    
+    def load(self):
+        """
+        读取最近一次一致的检查点(以内存映射方式读取分块)；没有检查点时返回None
+        """
+        try:
+            scans = self.manifest['scans']
+            if not scans or 'poses' not in self.manifest:
+                return None
+            
+            poses = {name: np.load(os.path.join(self.directory, path))
+                     for name, path in self.manifest['poses'].items()}
+            raw_scans, all_scans = [], []
+            for entry in scans:
+                raw = np.load(os.path.join(self.scan_dir, entry['raw']), mmap_mode='r')
+                points = np.load(os.path.join(self.scan_dir, entry['points']), mmap_mode='r')
+                if len(raw) != entry['raw_count'] or len(points) != entry['point_count']:
+                    raise ValueError(f"Checkpoint chunk {entry['points']} is inconsistent")
+                raw_scans.append(_from_records(raw, RAW_FIELDS))
+                all_scans.append(_from_records(points, POINT_FIELDS))
+            
+            return {
+                'raw_scans': raw_scans,
+                'all_scans': all_scans,
+                'transformations': list(poses['transformations']),
+                'scan_priors': list(poses['priors']),
+                'edges': poses.get('edges'),
+                'iterations': self.manifest['iterations'],
+                'registration_mode': self.manifest['registration_mode'],
+                'viewpoints': self.manifest['viewpoints']
+            }
+        
+        except Exception as e:
+            self.logger.error(f"Checkpoint load failed: {str(e)}")
+            return None
+    
+    def restore(self, controller):
+        """
+        将检查点状态恢复到系统控制器：重建全局地图、位姿图、占据地图和自由空间
+        """
+        if self.manifest.get('raw_only'):
+            self.logger.warning("Checkpoint holds raw scans only, reprocess it with batch_reprocess.py")
+            return None
+        state = self.load()
+        if state is None:
+            return None
+        
+        controller.raw_scans = state['raw_scans']
+        controller.all_scans = state['all_scans']
+        controller.transformations = state['transformations']
+        controller.scan_priors = state['scan_priors']
+        controller.iterations_completed = state['iterations']
+        
+        if state['registration_mode'] == 'multiway':
+            # 使用保存的配准边；旧检查点没有边时经进程池一次性重新计算
+            if controller.pose_graph is not None:
+                controller.pose_graph.close()
+            controller.pose_graph = PoseGraph(
+                max_correspondence_distance=controller.kinematics.correspondence_radius(state['raw_scans'][-1])
+            )
+            controller.pose_graph.restore(controller.all_scans, controller.transformations, state['edges'])
+        
+        controller.global_map = GlobalMap()
+        for points, transform in zip(controller.all_scans, controller.transformations):
+            controller.global_map.add_scan(points, transform)
+        controller.cloud_version = len(controller.all_scans)
+        # 版本号从恢复的扫描数重新计数，清除以前按版本号缓存的覆盖分析
+        controller.scan_optimizer.coverage_cache.invalidate()
+        controller.scan_optimizer.update_occupancy(controller.global_map)
+        
+        controller.prepare_workspace()
+        if controller.free_space is not None:
+            for raw_data, transform in zip(controller.raw_scans, controller.transformations):
+                controller.integrate_free_space(raw_data, transform)
+        
+        self.logger.info(
+            f"Restored {len(controller.all_scans)} scans after {state['iterations']} iterations "
+            f"({len(controller.global_map)} map points)"
+        )
+        return state
@@ -2,7 +2,6 @@
 Basic 3D reconstruction from processed point cloud data
 """
 import numpy as np
-from sklearn.neighbors import KDTree
 import logging
 
 class StaticReconstructor:
@@ -16,6 +15,8 @@ class StaticReconstructor:
         设置点云数据并构建KD树用于近邻搜索
         """
         try:
+            from sklearn.neighbors import KDTree
+            
             self.point_cloud = np.array([[p['x'], p['y'], p['z']] for p in points])
             self.kdtree = KDTree(self.point_cloud)
             return True
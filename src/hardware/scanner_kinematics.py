@@ -0,0 +1,87 @@
+"""
+Scanner kinematics for pose priors
+根据电机编码器读数推算传感器位姿
+"""
+import numpy as np
+import logging
+from config import *
+
+class ScannerKinematics:
+    def __init__(self, lift_per_degree=LIFT_MM_PER_DEGREE, mount_offset=SENSOR_MOUNT_OFFSET):
+        self.logger = logging.getLogger(__name__)
+        self.lift_per_degree = lift_per_degree
+        self.mount_offset = np.array(mount_offset, dtype=float)
+    
+    def sensor_pose(self, angle_h, angle_v, lift=0):
+        """
+        计算传感器在基座坐标系下的4x4位姿
+        angle_h, angle_v: 水平/垂直电机角度(度)，lift: 升降电机角度(度)
+        """
+        h = np.radians(angle_h)
+        v = np.radians(angle_v)
+        rot_h = np.array([[np.cos(h), -np.sin(h), 0],
+                          [np.sin(h), np.cos(h), 0],
+                          [0, 0, 1]])
+        rot_v = np.array([[np.cos(v), 0, np.sin(v)],
+                          [0, 1, 0],
+                          [-np.sin(v), 0, np.cos(v)]])
+        
+        pose = np.eye(4)
+        pose[:3, :3] = rot_h @ rot_v
+        pose[:3, 3] = pose[:3, :3] @ self.mount_offset + [0, 0, lift * self.lift_per_degree]
+        return pose
+    
+    def scan_prior(self, raw_data):
+        """
+        由一次扫描记录的电机角度计算其初始转换矩阵
+        convert_to_cartesian 已经处理了旋转，这里补上升降和安装偏移带来的平移
+        """
+        try:
+            angle_h = np.median([p['angle_h'] for p in raw_data])
+            angle_v = np.median([p['angle_v'] for p in raw_data])
+            lift = np.median([p.get('lift', 0) for p in raw_data])
+            
+            prior = np.eye(4)
+            prior[:3, 3] = self.sensor_pose(angle_h, angle_v, lift)[:3, 3]
+            return prior
+            
+        except Exception as e:
+            self.logger.error(f"Pose prior computation failed: {str(e)}")
+            return np.eye(4)
+    
+    def measurement_rays(self, raw_data):
+        """
+        计算每次测量的射线起点（传感器位置）和终点（命中点）
+        坐标与 convert_to_cartesian 的输出同一坐标系，即扣除了本次扫描的位姿先验平移
+        """
+        h = np.radians([p['angle_h'] for p in raw_data])
+        v = np.radians([p['angle_v'] for p in raw_data])
+        r = np.array([p['distance'] for p in raw_data], dtype=float)
+        lift = np.array([p.get('lift', 0) for p in raw_data], dtype=float)
+        
+        # 与 convert_to_cartesian 相同的测量方向
+        direction = np.column_stack([np.sin(v) * np.cos(h), np.sin(v) * np.sin(h), np.cos(v)])
+        
+        # 传感器位置：安装偏移随两个旋转轴转动，再加上升降位移
+        ox, oy, oz = self.mount_offset
+        x = np.cos(v) * ox + np.sin(v) * oz
+        z = -np.sin(v) * ox + np.cos(v) * oz
+        origins = np.column_stack([np.cos(h) * x - np.sin(h) * oy,
+                                   np.sin(h) * x + np.cos(h) * oy,
+                                   z + lift * self.lift_per_degree])
+        origins -= self.scan_prior(raw_data)[:3, 3]
+        
+        return origins, origins + direction * r[:, None]
+    
+    def pose_uncertainty(self, raw_data):
+        """
+        估计由编码器误差引起的最大位置不确定度
+        """
+        max_range = max((p['distance'] for p in raw_data), default=MAX_SCAN_DISTANCE)
+        return max_range * np.radians(ENCODER_ANGLE_UNCERTAINTY) + LIFT_POSITION_UNCERTAINTY
+    
+    def correspondence_radius(self, raw_data):
+        """
+        根据位姿不确定度给出ICP对应点的搜索半径
+        """
+        return CORRESPONDENCE_SIGMA_SCALE * self.pose_uncertainty(raw_data)
@@ -0,0 +1,98 @@
+"""
+Simulated sensor and motor controllers for running the scanner without EV3 hardware
+无需EV3硬件即可运行扫描系统的仿真传感器与电机控制器
+"""
+import time
+import numpy as np
+from config import *
+
+class SimulatedMotor:
+    """
+    与 ev3dev2 电机接口一致的仿真电机，转动耗时按转速计算
+    """
+    def __init__(self, speed=SCAN_SPEED, time_scale=1.0):
+        self.position = 0
+        self.speed = speed
+        self.time_scale = time_scale
+    
+    def reset(self):
+        self.position = 0
+    
+    def on_for_degrees(self, speed, degrees):
+        time.sleep(abs(degrees) / self.speed * self.time_scale)
+        self.position += degrees
+    
+    def on_to_position(self, speed, position):
+        self.on_for_degrees(speed, position - self.position)
+
+class SimulatedMotorController:
+    """
+    与 MotorController 接口一致的仿真电机控制器
+    """
+    def __init__(self, speed=SCAN_SPEED, time_scale=1.0):
+        self.horizontal_motor = SimulatedMotor(speed, time_scale)
+        self.vertical_motor = SimulatedMotor(speed, time_scale)
+        self.scanner_motor = SimulatedMotor(speed, time_scale)
+    
+    def reset_motors(self):
+        """Reset all motors to home position"""
+        self.horizontal_motor.reset()
+        self.vertical_motor.reset()
+        self.scanner_motor.reset()
+    
+    def rotate_horizontal(self, angle, speed=SCAN_SPEED):
+        """Rotate horizontal motor by specified angle"""
+        self.horizontal_motor.on_for_degrees(speed, angle)
+        return True
+    
+    def rotate_vertical(self, angle, speed=SCAN_SPEED):
+        """Rotate vertical motor by specified angle"""
+        self.vertical_motor.on_for_degrees(speed, angle)
+        return True
+    
+    def move_scanner(self, position, speed=SCAN_SPEED):
+        """Move scanner to specified position"""
+        self.scanner_motor.on_to_position(speed, position)
+        return True
+
+class SimulatedSensorController:
+    """
+    与 SensorController 接口一致的仿真传感器：沿当前电机角度方向测量到球形物体的距离
+    球心使用扫描仪坐标系，方向约定与 DataPreprocessor.convert_to_cartesian 一致
+    """
+    def __init__(self, motor_ctrl, center=(0.0, 0.0, 100.0), radius=50.0, noise=1.0,
+                 read_time=0.0, seed=None):
+        self.motor_ctrl = motor_ctrl
+        self.center = np.asarray(center, dtype=float)
+        self.radius = radius
+        self.noise = noise
+        self.read_time = read_time
+        self.rng = np.random.default_rng(seed)
+    
+    def get_distance(self):
+        """Get simulated distance along the current beam direction"""
+        time.sleep(self.read_time)
+        theta = np.radians(self.motor_ctrl.horizontal_motor.position)
+        phi = np.radians(self.motor_ctrl.vertical_motor.position)
+        direction = np.array([np.sin(phi) * np.cos(theta), np.sin(phi) * np.sin(theta), np.cos(phi)])
+        
+        # 射线与球面求交，取最近的正根
+        b = direction @ self.center
+        disc = b * b - (self.center @ self.center - self.radius ** 2)
+        if disc < 0:
+            return None
+        distance = b - np.sqrt(disc)
+        if distance <= 0:
+            return None
+        distance += self.rng.normal(0.0, self.noise)
+        if MIN_SCAN_DISTANCE <= distance <= MAX_SCAN_DISTANCE:
+            return float(distance)
+        return None
+    
+    def get_angle(self):
+        """Get current simulated heading"""
+        return self.motor_ctrl.horizontal_motor.position
+    
+    def reset_gyro(self):
+        """Reset gyro sensor"""
+        pass
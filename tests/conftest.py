@@ -0,0 +1,69 @@
+"""
+Pytest configuration: the project uses flat imports, so put the source directories on sys.path
+测试配置：项目使用扁平导入，将各源码目录加入模块搜索路径
+"""
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIRS = ('config', 'src/core', 'src/data', 'src/analysis', 'src/hardware', 'utils')
+
+# config 目录放在最前，保证 `from config import *` 导入的是 config/config.py
+for directory in reversed(SOURCE_DIRS):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def build_offline_controller():
+    """
+    不连接硬件的系统控制器，只使用处理、配准和规划组件
+    """
+    from system_controller import SystemController
+    from data_preprocessing import DataPreprocessor
+    from static_reconstruction import StaticReconstructor
+    from coverage_detection import CoverageDetector
+    from path_planning import PathPlanner
+    from scan_optimizer import ScanOptimizer
+    from data_fusion import DataFusion
+    
+    coverage_detector = CoverageDetector()
+    path_planner = PathPlanner()
+    return SystemController(
+        None, None, None,
+        DataPreprocessor(), StaticReconstructor(), coverage_detector,
+        path_planner, ScanOptimizer(coverage_detector, path_planner), DataFusion()
+    )
+
+
+@pytest.fixture
+def controller_factory(tmp_path, monkeypatch):
+    """
+    返回创建离线系统控制器的函数，用于需要多个控制器的测试；工作目录切换到临时目录
+    """
+    monkeypatch.chdir(tmp_path)
+    return build_offline_controller
+
+
+@pytest.fixture
+def offline_controller(controller_factory):
+    return controller_factory()
+
+
+@pytest.fixture
+def simulated_controller(offline_controller, monkeypatch):
+    """
+    连接仿真电机和传感器的系统控制器，电机转动和稳定等待不耗时
+    """
+    import system_controller
+    from simulated_rig import SimulatedMotorController, SimulatedSensorController
+    from data_acquisition import DataAcquisition
+    
+    monkeypatch.setattr(system_controller, 'VIEWPOINT_SETTLE_TIME', 0.0)
+    motor_ctrl = SimulatedMotorController(time_scale=0.0)
+    sensor_ctrl = SimulatedSensorController(motor_ctrl, seed=0)
+    offline_controller.motor_ctrl = motor_ctrl
+    offline_controller.sensor_ctrl = sensor_ctrl
+    offline_controller.data_acq = DataAcquisition(sensor_ctrl, motor_ctrl)
+    return offline_controller
@@ -0,0 +1,104 @@
+"""
+Unit tests for the offline batch reprocessing CLI
+离线批量重新处理命令行的单元测试
+"""
+import csv
+import os
+import logging
+import multiprocessing
+import batch_reprocess
+from scan_checkpoint import ScanCheckpoint
+from config import BATCH_SUMMARY_FILE
+
+
+def sphere_scan(h_angles, v_angles, distance=80.0):
+    return [
+        {'distance': distance, 'angle_h': h, 'angle_v': v, 'lift': 0, 'timestamp': float(i)}
+        for i, (h, v) in enumerate((h, v) for h in h_angles for v in v_angles)
+    ]
+
+
+def record_sessions(controller_factory, root):
+    for name, distance in (('session_a', 80.0), ('session_b', 82.0)):
+        controller = controller_factory()
+        controller.integrate_scan(sphere_scan(range(0, 90, 10), range(30, 150, 10), distance=distance))
+        controller.iterations_completed += 1
+        assert ScanCheckpoint(str(root / name)).save(controller)
+
+
+def read_summary(output):
+    with open(os.path.join(output, BATCH_SUMMARY_FILE), newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def count_workers(monkeypatch):
+    """
+    记录启动的工作进程数和同时运行的最大进程数
+    """
+    started, running = [], []
+    start_worker, finish_worker = batch_reprocess._start_worker, batch_reprocess._finish_worker
+    
+    def tracked_start(*args):
+        started.append(args[1])
+        running.append((running[-1] if running else 0) + 1)
+        return start_worker(*args)
+    
+    def tracked_finish(*args):
+        running.append(running[-1] - 1)
+        return finish_worker(*args)
+    
+    monkeypatch.setattr(batch_reprocess, '_start_worker', tracked_start)
+    monkeypatch.setattr(batch_reprocess, '_finish_worker', tracked_finish)
+    return started, running
+
+
+def test_cli_writes_summary_and_resumes(controller_factory, tmp_path, monkeypatch, caplog):
+    root, output = tmp_path / 'sessions', str(tmp_path / 'out')
+    record_sessions(controller_factory, root)
+    started, running = count_workers(monkeypatch)
+    
+    with caplog.at_level(logging.INFO, logger='batch_reprocess'):
+        assert batch_reprocess.main([str(root), '--output', output, '--limit-cores', '1']) == 0
+    
+    # --limit-cores 1 时逐个会话处理
+    assert len(started) == 2 and max(running) == 1
+    assert 'with 1 workers' in caplog.text
+    rows = read_summary(output)
+    assert [row['session'] for row in rows] == ['session_a', 'session_b']
+    assert all(row['status'] == 'ok' and int(row['points']) > 0 for row in rows)
+    
+    # 重新运行时跳过已完成的会话，只处理缺少结果的会话
+    os.remove(os.path.join(output, 'session_b', 'result.json'))
+    started.clear()
+    assert batch_reprocess.main([str(root), '--output', output]) == 0
+    assert started == [str(root / 'session_b')]
+    assert [row['status'] for row in read_summary(output)] == ['ok', 'ok']
+    
+    started.clear()
+    assert batch_reprocess.main([str(root), '--output', output]) == 0
+    assert started == []
+
+
+def test_memory_budget_is_opt_in(monkeypatch):
+    assert batch_reprocess.worker_memory_budget(0, 4) is None
+    assert batch_reprocess.worker_memory_budget(None, 4) is None
+    assert batch_reprocess.worker_memory_budget(512, 4) == 512
+    
+    # auto 时可用内存按工作进程数均分
+    monkeypatch.setattr(batch_reprocess, '_available_memory_mb', lambda: 8000.0)
+    assert batch_reprocess.worker_memory_budget('auto', 4) == 2000
+    assert batch_reprocess.parse_args(['root', '--max-memory-mb', 'auto']).max_memory_mb == 'auto'
+
+
+def test_dead_worker_is_recorded_as_failed(tmp_path, caplog):
+    output_dir = str(tmp_path / 'session')
+    process = multiprocessing.get_context('spawn').Process(target=os._exit, args=(3,))
+    process.start()
+    
+    with caplog.at_level(logging.ERROR, logger='batch_reprocess'):
+        result = batch_reprocess._finish_worker(process, 'session', output_dir, 256)
+    
+    # 没有写出结果就退出的工作进程记为失败，并在日志中注明内存上限
+    assert result['status'] == 'failed' and 'exit code 3' in result['error']
+    assert batch_reprocess.load_result(output_dir) == result
+    assert 'died with exit code 3' in caplog.text and '256 MB' in caplog.text
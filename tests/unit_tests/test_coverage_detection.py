@@ -0,0 +1,111 @@
+"""
+Unit tests for the visibility map and hole detection
+可见性地图与空洞检测的单元测试
+"""
+import numpy as np
+import pytest
+from coverage_detection import CoverageDetector
+
+
+def random_points(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform(0.0, 1.0, (n, 3)) * [1.0, 0.8, 0.6]
+    return [{'x': x, 'y': y, 'z': z} for x, y, z in coords]
+
+
+def brute_force_counts(points, visibility_map):
+    """
+    逐个网格点统计 3x3x3 邻域体素内的点数
+    """
+    coords = np.array([[p['x'], p['y'], p['z']] for p in points])
+    shape = np.array(visibility_map.shape)
+    indices = np.clip(np.rint((coords - visibility_map.origin) / visibility_map.resolution).astype(int), 0, shape - 1)
+    counts = np.zeros(visibility_map.shape, dtype=int)
+    for voxel in np.ndindex(*visibility_map.shape):
+        counts[voxel] = np.count_nonzero(np.all(np.abs(indices - voxel) <= 1, axis=1))
+    return counts
+
+
+def test_box_filter_matches_brute_force():
+    points = random_points()
+    visibility_map = CoverageDetector().create_visibility_map(points, resolution=0.1)
+    
+    assert np.array_equal(visibility_map.counts, brute_force_counts(points, visibility_map))
+    # 每个点被计入其所在体素及邻域内的所有网格点
+    assert visibility_map.counts.sum() <= 27 * len(points)
+
+
+def test_coarsened_grid_matches_brute_force():
+    points = random_points(seed=1)
+    visibility_map = CoverageDetector().create_visibility_map(points, resolution=0.01, max_voxels=500)
+    
+    # 体素数超过上限时放大分辨率
+    assert visibility_map.resolution > 0.01
+    assert np.array_equal(visibility_map.counts, brute_force_counts(points, visibility_map))
+
+
+def test_detect_holes_finds_missing_patch():
+    # 平面网格上挖去一个方块
+    grid = np.stack(np.meshgrid(np.arange(20), np.arange(20), indexing='ij'), axis=-1).reshape(-1, 2) * 0.05
+    keep = ~np.all((grid >= 0.3) & (grid <= 0.6), axis=1)
+    points = [{'x': x, 'y': y, 'z': 0.0} for x, y in grid[keep]]
+    detector = CoverageDetector()
+    
+    holes = detector.detect_holes(detector.create_visibility_map(points), min_size=3)
+    
+    assert len(holes) == 1
+    assert np.allclose(holes[0]['center'][:2], [0.45, 0.45], atol=0.05)
+
+
+def shell_with_gaps(n=6000, seed=0):
+    """
+    带两块缺口的带噪半球壳，网格尺寸不是最粗单元的整数倍
+    """
+    rng = np.random.default_rng(seed)
+    theta = rng.uniform(0, 2 * np.pi, n)
+    phi = rng.uniform(0, np.pi / 2, n)
+    keep = ~((theta < 0.8) & (phi > 0.7)) & ~((np.abs(theta - 3.0) < 0.4) & (phi < 0.5))
+    coords = np.column_stack([np.cos(theta) * np.sin(phi), np.sin(theta) * np.sin(phi), np.cos(phi)])[keep]
+    return coords * 1.3 + rng.normal(0, 0.02, coords.shape)
+
+
+@pytest.mark.parametrize('connectivity', [1, 2, 3])
+def test_hierarchical_holes_match_dense_pass(connectivity):
+    coords = shell_with_gaps()
+    detector = CoverageDetector()
+    dense = detector.detect_holes(detector.create_visibility_map(coords), min_size=1, connectivity=connectivity)
+    
+    holes = detector.detect_holes_hierarchical(coords, min_size=1, connectivity=connectivity)
+    
+    # 与稠密逐体素标记的结果一致，且顺序相同
+    assert len(holes) == len(dense) > 0
+    for hole, expected in zip(holes, dense):
+        assert hole['size'] == expected['size']
+        assert np.allclose(hole['center'], expected['center'])
+        assert np.allclose(hole['extent'], expected['extent'])
+        assert hole['surface_area'] == pytest.approx(expected['surface_area'])
+
+
+def test_hierarchical_level_stats():
+    detector = CoverageDetector()
+    
+    detector.detect_holes_hierarchical(shell_with_gaps(), levels=4)
+    
+    stats = detector.last_level_stats
+    assert [level['level'] for level in stats['levels']] == [3, 2, 1, 0]
+    # 每层只评估上一层细分出的单元
+    for coarse, fine in zip(stats['levels'], stats['levels'][1:]):
+        assert fine['evaluated'] <= 8 * coarse['subdivided']
+    assert stats['evaluated'] < 0.5 * stats['total_voxels']
+    assert stats['leaves'] < stats['total_voxels'] - stats['covered_voxels']
+
+
+def test_hierarchical_holes_without_covered_voxels():
+    detector = CoverageDetector()
+    
+    holes = detector.detect_holes_hierarchical(random_points(n=5), min_size=1)
+    
+    dense = detector.detect_holes(detector.create_visibility_map(random_points(n=5)), min_size=1)
+    assert detector.last_level_stats['covered_voxels'] == 0
+    assert [hole['size'] for hole in holes] == [hole['size'] for hole in dense]
+    assert np.allclose([hole['center'] for hole in holes], [hole['center'] for hole in dense])
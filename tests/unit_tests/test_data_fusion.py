@@ -0,0 +1,81 @@
+"""
+Unit tests for coarse-to-fine ICP registration
+由粗到精ICP配准的单元测试
+"""
+import numpy as np
+import pytest
+from data_fusion import DataFusion
+
+
+def ellipsoid(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    u = rng.uniform(0, 2 * np.pi, n)
+    v = rng.uniform(0, np.pi, n)
+    return np.column_stack([100 * np.cos(u) * np.sin(v), 60 * np.sin(u) * np.sin(v), 40 * np.cos(v)])
+
+
+def rigid(rotvec, translation):
+    transform = np.eye(4)
+    transform[:3, :3] = DataFusion._rotation_from_vector(np.asarray(rotvec, dtype=float))
+    transform[:3, 3] = translation
+    return transform
+
+
+def apply_inverse(transform, coords):
+    # 源点云 = 真值变换的逆作用于目标点云，配准结果应等于真值变换
+    return (coords - transform[:3, 3]) @ transform[:3, :3]
+
+
+@pytest.mark.parametrize('method', ['point_to_point', 'point_to_plane'])
+def test_icp_recovers_known_transform(method):
+    target = ellipsoid()
+    truth = rigid([0.05, -0.03, 0.08], [4.0, -3.0, 2.0])
+    fusion = DataFusion()
+    
+    transform, error = fusion.icp_registration(apply_inverse(truth, target), target, method=method)
+    
+    assert np.allclose(transform[:3, :3], truth[:3, :3], atol=1e-2)
+    assert np.allclose(transform[:3, 3], truth[:3, 3], atol=0.5)
+    assert error < 0.5
+    # 两个下采样层加上原始分辨率层，最后一层总是原始分辨率
+    levels = fusion.last_registration_stats['levels']
+    assert len(levels) == 3
+    assert levels[-1]['voxel_size'] is None
+    assert levels[-1]['source_points'] == len(target)
+
+
+def test_icp_coarse_levels_reduce_fine_iterations():
+    target = ellipsoid()
+    truth = rigid([0.1, 0.0, -0.1], [8.0, 5.0, -4.0])
+    source = apply_inverse(truth, target)
+    fusion = DataFusion()
+    
+    fusion.icp_registration(source, target, voxel_sizes=[])
+    single_level = fusion.last_registration_stats['levels'][-1]['iterations']
+    fusion.icp_registration(source, target)
+    pyramid = fusion.last_registration_stats['levels'][-1]['iterations']
+    
+    assert pyramid < single_level
+
+
+def test_icp_reports_convergence():
+    target = ellipsoid()
+    fusion = DataFusion()
+    
+    transform, error = fusion.icp_registration(target, target, max_correspondence_distance=5.0)
+    
+    assert transform is not None and error is not None
+    assert fusion.last_registration_stats['converged']
+
+
+def test_icp_fails_without_correspondences_in_radius():
+    target = ellipsoid()
+    # 源点云远离目标，搜索半径内没有对应点
+    source = target + [500.0, 0.0, 0.0]
+    fusion = DataFusion()
+    
+    transform, error = fusion.icp_registration(source, target, max_correspondence_distance=5.0)
+    
+    assert transform is None and error is None
+    assert not fusion.last_registration_stats['converged']
+    assert all(level['error'] is None for level in fusion.last_registration_stats['levels'])
@@ -0,0 +1,92 @@
+"""
+Unit tests for the voxel-deduplicated global map
+按体素去重的全局地图的单元测试
+"""
+import numpy as np
+from global_map import GlobalMap, voxel_keys, _KEY_BITS
+
+
+def as_points(coords):
+    return [{'x': x, 'y': y, 'z': z, 'timestamp': float(i)} for i, (x, y, z) in enumerate(coords)]
+
+
+def test_duplicates_within_scan_keep_first_point():
+    global_map = GlobalMap(voxel_size=1.0)
+    coords = [(0.1, 0.1, 0.1), (0.9, 0.9, 0.9), (1.5, 0.2, 0.2)]
+    
+    added = global_map.add_scan(as_points(coords))
+    
+    assert added == 2
+    assert np.allclose(global_map.coords, [coords[0], coords[2]])
+    assert [p['timestamp'] for p in global_map.to_points()] == [0.0, 2.0]
+
+
+def test_repeated_scan_adds_only_new_voxels():
+    global_map = GlobalMap(voxel_size=1.0)
+    rng = np.random.default_rng(0)
+    coords = rng.uniform(-20, 20, (500, 3))
+    first = global_map.add_scan(as_points(coords))
+    
+    assert global_map.add_scan(as_points(coords)) == 0
+    assert len(global_map.last_added) == 0
+    
+    shifted = np.vstack([coords, [[100.0, 100.0, 100.0]]])
+    assert global_map.add_scan(as_points(shifted)) == 1
+    assert len(global_map) == first + 1 == len(global_map.to_points())
+    assert global_map.version == 3
+
+
+def test_transformation_applied_before_dedup():
+    global_map = GlobalMap(voxel_size=1.0)
+    global_map.add_scan(as_points([(0.5, 0.5, 0.5)]))
+    transform = np.eye(4)
+    transform[:3, 3] = [10.0, 0.0, 0.0]
+    
+    # 变换后落在不同体素，不应被去重
+    assert global_map.add_scan(as_points([(0.5, 0.5, 0.5)]), transform) == 1
+    assert np.allclose(global_map.last_added, [[10.5, 0.5, 0.5]])
+
+
+def test_voxel_keys_unique_over_key_range():
+    # 每个轴的有效范围为 [-2^20, 2^20)，正负坐标及各轴的取值不能互相混淆
+    limit = 1 << (_KEY_BITS - 1)
+    values = np.array([-limit, -limit + 1, -2, -1, 0, 1, limit - 2, limit - 1], dtype=float)
+    cells = np.stack(np.meshgrid(values, values, values, indexing='ij'), axis=-1).reshape(-1, 3)
+    
+    keys = voxel_keys(cells + 0.5, 1.0)
+    
+    assert len(np.unique(keys)) == len(cells)
+    assert keys.dtype == np.int64
+
+
+def test_growth_keeps_existing_points():
+    global_map = GlobalMap(voxel_size=1.0, initial_capacity=4)
+    batches = [np.column_stack([np.arange(10) + 10 * k, np.zeros(10), np.zeros(10)]) for k in range(5)]
+    for batch in batches:
+        global_map.add_scan(as_points(batch))
+    
+    assert np.allclose(global_map.coords, np.vstack(batches))
+
+
+def test_to_points_returns_independent_copy():
+    global_map = GlobalMap(voxel_size=1.0)
+    global_map.add_scan(as_points([(0.5, 0.5, 0.5), (2.5, 0.5, 0.5)]))
+    
+    points = global_map.to_points()
+    points[0]['x'] = 100.0
+    points.append({'x': 0.0, 'y': 0.0, 'z': 0.0, 'timestamp': None})
+    
+    assert len(global_map.to_points()) == len(global_map) == 2
+    assert global_map.to_points()[0]['x'] == 0.5
+    assert not global_map.coords.flags.writeable
+
+
+def test_add_scan_accepts_coordinate_array():
+    global_map = GlobalMap(voxel_size=1.0)
+    coords = np.array([(0.5, 0.5, 0.5), (0.6, 0.6, 0.6), (2.5, 0.5, 0.5)])
+    
+    assert global_map.add_scan(coords) == 2
+    # 另一个地图的坐标视图可以直接合并
+    merged = GlobalMap(voxel_size=1.0)
+    assert merged.add_scan(global_map.coords) == 2
+    assert [p['timestamp'] for p in merged.to_points()] == [None, None]
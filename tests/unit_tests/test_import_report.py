@@ -0,0 +1,30 @@
+"""
+Unit tests for the import time regression check
+导入耗时回归检查的单元测试
+"""
+from import_report import check, format_report
+
+
+def timing(module, total_ms, heavy=()):
+    return {'module': module, 'total_ms': total_ms, 'self_ms': 1.0, 'heavy': list(heavy), 'heavy_ms': 0.0}
+
+
+def test_missing_hardware_package_is_skipped_not_a_regression():
+    results = [{'module': 'motor_control', 'skipped': 'hardware'}, timing('config', 1.0)]
+    
+    assert check(results, baseline={'motor_control': 5.0, 'config': 1.0}) == []
+    assert 'skipped' in format_report(results).splitlines()[-1]
+
+
+def test_regressions_are_reported():
+    results = [
+        timing('data_acquisition', 10.0, heavy=['scipy']),
+        timing('path_planning', 400.0),
+        {'module': 'broken', 'error': "ModuleNotFoundError: No module named 'missing'"}
+    ]
+    
+    problems = check(results, baseline={'path_planning': 100.0, 'data_acquisition': 10.0})
+    
+    assert len(problems) == 3
+    assert any('imports scipy' in problem for problem in problems)
+    assert any('baseline 100.0ms' in problem for problem in problems)
@@ -0,0 +1,58 @@
+"""
+Unit tests for ray-cast free-space carving
+射线遍历与自由空间标记的单元测试
+"""
+import numpy as np
+from log_odds_grid import LogOddsGrid
+from config import LOG_ODDS_HIT, LOG_ODDS_MISS
+
+
+def random_rays(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(1.0, 99.0, (n, 3)), rng.uniform(1.0, 99.0, (n, 3))
+
+
+def test_traversal_visits_face_adjacent_cells_to_the_end():
+    grid = LogOddsGrid((0, 0, 0), (100, 100, 100), resolution=5.0)
+    origins, endpoints = random_rays()
+    free_cells, end_cells = grid._traverse(origins, endpoints)
+    
+    start = np.floor(origins / 5.0).astype(int)
+    lengths = np.abs(end_cells - start).sum(axis=1)
+    assert len(free_cells) == lengths.sum()
+    
+    # 所有射线同步前进，结果按步序排列，第 s 步包含仍未到达终点的射线；还原每条射线的体素序列
+    paths = [[] for _ in range(len(origins))]
+    offset = 0
+    for s in range(lengths.max()):
+        for r in np.flatnonzero(lengths > s):
+            paths[r].append(free_cells[offset])
+            offset += 1
+    for r, path in enumerate(paths):
+        path = np.array(path + [end_cells[r]])
+        assert np.array_equal(path[0], start[r])
+        # 相邻体素只共面，每步只沿一个轴移动一格
+        assert np.all(np.abs(np.diff(path, axis=0)).sum(axis=1) == 1)
+        
+        # 沿线段密集采样得到的体素都在遍历结果中
+        samples = origins[r] + np.linspace(0, 1, 2000)[:, None] * (endpoints[r] - origins[r])
+        sampled = {tuple(c) for c in np.floor(samples / 5.0).astype(int)}
+        assert sampled <= {tuple(c) for c in path}
+
+
+def test_axis_aligned_ray_marks_free_and_hit_cells():
+    grid = LogOddsGrid((0, 0, 0), (50, 50, 50), resolution=5.0)
+    grid.integrate_rays([[2.5, 2.5, 2.5]], [[47.5, 2.5, 2.5]])
+    
+    assert np.allclose(grid.log_odds[:9, 0, 0], LOG_ODDS_MISS)
+    assert np.isclose(grid.log_odds[9, 0, 0], LOG_ODDS_HIT)
+    assert np.count_nonzero(grid.log_odds) == 10
+    assert grid.is_free([12.0, 2.0, 2.0]) and not grid.is_free([47.0, 2.0, 2.0])
+
+
+def test_max_range_reading_only_carves_free_space():
+    grid = LogOddsGrid((0, 0, 0), (50, 50, 50), resolution=5.0)
+    grid.integrate_rays([[2.5, 2.5, 2.5]], [[2.5, 47.5, 2.5]], hits=[False])
+    
+    assert np.allclose(grid.log_odds[0, :9, 0], LOG_ODDS_MISS)
+    assert grid.log_odds[0, 9, 0] == 0.0
@@ -0,0 +1,85 @@
+"""
+Unit tests for the Prometheus text rendering of live metrics
+实时指标 Prometheus 文本格式的单元测试
+"""
+import re
+from metrics_exporter import MetricsExporter
+from performance_monitor import PerformanceMonitor, StageTracer
+
+
+def render(stages=None, process=None, components=None):
+    monitor = PerformanceMonitor(tracer=StageTracer())
+    exporter = MetricsExporter(monitor)
+    snapshot = {
+        'timestamp': 0.0,
+        'run_id': 'test',
+        'uptime': 12.5,
+        'stages': stages or {},
+        'process': process or {},
+        'components': components or {}
+    }
+    return exporter.render_prometheus(snapshot)
+
+
+def stage_stats(**overrides):
+    stats = {'calls': 4, 'total_time': 0.5, 'p50': 0.1, 'p95': 0.2, 'p99': 0.25,
+             'max': 0.25, 'points': 4000, 'points_per_second': 8000.0}
+    stats.update(overrides)
+    return stats
+
+
+def test_every_sample_has_help_and_type():
+    text = render(stages={'icp': stage_stats()},
+                  process={'process_cpu': 150.0, 'rss': 2.0, 'stage': 'icp'},
+                  components={'scan': {'completion': 0.5, 'done': True, 'label': 'text'}})
+    
+    assert text.endswith('\n') and not text.endswith('\n\n')
+    declared = {}
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            declared[name] = kind
+            continue
+        if line.startswith('#'):
+            continue
+        match = re.match(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$', line)
+        assert match, line
+        name = match.group(1)
+        # summary 的 _sum/_count 样本属于同名指标
+        summary = re.sub(r'_(sum|count)$', '', name)
+        assert name in declared or declared.get(summary) == 'summary', line
+        float(match.group(3))
+    
+    assert declared['scanner_stage_duration_seconds'] == 'summary'
+    assert 'scanner_process_cpu_percent 150\n' in text
+    assert 'scanner_process_resident_memory_bytes 2.09715e+06\n' in text
+    # 非数值的组件统计不导出
+    assert 'stat="label"' not in text
+    assert 'scanner_component{component="scan",stat="done"} 1\n' in text
+
+
+def test_summary_quantiles_sum_and_count():
+    text = render(stages={'icp': stage_stats(), 'idle_stage': stage_stats(calls=0)})
+    
+    for quantile, value in (('0.5', '0.1'), ('0.95', '0.2'), ('0.99', '0.25')):
+        assert f'scanner_stage_duration_seconds{{stage="icp",quantile="{quantile}"}} {value}\n' in text
+    assert 'scanner_stage_duration_seconds_sum{stage="icp"} 0.5\n' in text
+    assert 'scanner_stage_duration_seconds_count{stage="icp"} 4\n' in text
+    assert 'scanner_stage_points_total{stage="icp"} 4000\n' in text
+    # 没有调用的阶段不输出
+    assert 'idle_stage' not in text
+
+
+def test_label_values_are_escaped():
+    text = render(stages={'a"b\\c\nd': stage_stats()})
+    
+    assert 'stage="a\\"b\\\\c\\nd"' in text
+    assert all(line.count('{') <= 1 for line in text.splitlines())
+
+
+def test_empty_snapshot_only_reports_uptime():
+    assert render() == (
+        "# HELP scanner_uptime_seconds Time since the exporter started\n"
+        "# TYPE scanner_uptime_seconds gauge\n"
+        "scanner_uptime_seconds 12.500\n"
+    )
@@ -0,0 +1,134 @@
+"""
+Unit tests for viewpoint planning and scan sequencing
+视点规划与扫描序列的单元测试
+"""
+import math
+import numpy as np
+import pytest
+from path_planning import PathPlanner
+from config import MIN_SCAN_DISTANCE, MAX_SCAN_DISTANCE
+
+CONSTRAINTS = {'x_min': -500, 'x_max': 500, 'y_min': -500, 'y_max': 500, 'z_min': 0, 'z_max': 500}
+
+
+def random_holes(n=12, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform([-150, -150, 20], [150, 150, 150], (n, 3))
+    return [{'center': center.tolist(), 'size': 5} for center in centers]
+
+
+def standoff(viewpoints):
+    return np.array([np.linalg.norm(np.subtract(vp['position'], vp['target'])) for vp in viewpoints])
+
+
+@pytest.mark.parametrize('method', ['lattice', 'optimize'])
+def test_viewpoints_keep_sensor_standoff(method):
+    planner = PathPlanner()
+    holes = random_holes()
+    
+    viewpoints = planner.plan_scanning_path(holes, CONSTRAINTS, method=method, seed=0)
+    
+    # 分数随距离减小而增大，但视点不能落到空洞上
+    assert len(viewpoints) == len(holes)
+    distances = standoff(viewpoints)
+    assert np.all(distances >= MIN_SCAN_DISTANCE - 1e-6)
+    assert np.all(distances <= MAX_SCAN_DISTANCE + 1e-6)
+
+
+def test_refine_projects_starts_into_range():
+    planner = PathPlanner()
+    targets = np.array([[0.0, 0.0, 100.0], [50.0, 50.0, 50.0], [0.0, 0.0, 100.0]])
+    # 与目标重合、过近和超出量程的起点
+    starts = np.array([[0.0, 0.0, 100.0], [55.0, 50.0, 50.0], [400.0, 0.0, 100.0]])
+    
+    points, scores = planner.refine_viewpoints(starts, targets, CONSTRAINTS)
+    
+    distances = np.linalg.norm(points - targets, axis=1)
+    assert np.all(distances >= MIN_SCAN_DISTANCE - 1e-6) and np.all(distances <= MAX_SCAN_DISTANCE + 1e-6)
+    assert np.allclose(scores, 1.0 / (1.0 + distances))
+
+
+def test_per_hole_planning_is_deterministic_across_workers():
+    holes = random_holes(n=8, seed=1)
+    
+    serial = PathPlanner().plan_scanning_path(holes, CONSTRAINTS, method='optimize', workers=1, seed=7)
+    parallel = PathPlanner().plan_scanning_path(holes, CONSTRAINTS, method='optimize', workers=2, seed=7)
+    repeated = PathPlanner().plan_scanning_path(holes, CONSTRAINTS, method='optimize', workers=2, seed=7)
+    
+    # 每个空洞的随机初始点由 (种子, 空洞编号) 决定，与工作进程数和分块无关
+    assert [vp['target'] for vp in serial] == [vp['target'] for vp in parallel]
+    assert np.array_equal([vp['position'] for vp in serial], [vp['position'] for vp in parallel])
+    assert np.array_equal([vp['position'] for vp in parallel], [vp['position'] for vp in repeated])
+
+
+def exhaustive_greedy(planner, holes, current_angles=(0.0, 0.0), target_coverage=0.9):
+    """
+    每一步对全部候选计算 增益/时间 的参考贪心
+    """
+    targets, weights, positions, aims, visible = planner.next_best_view_candidates(holes, CONSTRAINTS)
+    h_angles, v_angles = planner.viewpoint_angles(positions, targets[aims])
+    revealed = np.zeros(len(targets), dtype=bool)
+    current, plan = current_angles, []
+    while weights[revealed].sum() < target_coverage * weights.sum():
+        gains = (visible & ~revealed) @ weights
+        if not np.any(gains > 0):
+            break
+        times = np.array([planner.estimate_view_time(current, (h, v)) for h, v in zip(h_angles, v_angles)])
+        ratios = np.where(gains > 0, gains / times, -np.inf)
+        p = int(np.argmax(ratios))
+        plan.append((positions[p].tolist(), ratios[p]))
+        revealed |= visible[p]
+        current = (h_angles[p], v_angles[p])
+    return plan
+
+
+def test_lazy_greedy_matches_exhaustive_greedy():
+    planner = PathPlanner()
+    holes = [dict(hole, surface_area=float(area))
+             for hole, area in zip(random_holes(n=10, seed=2), np.linspace(1.0, 4.0, 10))]
+    
+    result = planner.select_next_best_views(holes, CONSTRAINTS, current_angles=(10.0, 5.0))
+    expected = exhaustive_greedy(planner, holes, current_angles=(10.0, 5.0))
+    
+    # 每一步都选中单位时间信息增益最大的候选
+    assert len(result['viewpoints']) == len(expected) > 1
+    for viewpoint, (position, ratio) in zip(result['viewpoints'], expected):
+        assert viewpoint['position'] == position
+        assert viewpoint['score'] == pytest.approx(ratio)
+    assert result['coverage'] >= 0.9
+
+
+def test_next_best_view_visibility_is_chunked(monkeypatch):
+    planner = PathPlanner()
+    holes = random_holes(n=10, seed=3)
+    full = planner.next_best_view_candidates(holes, CONSTRAINTS)[-1]
+    
+    # 每块只容纳不足一个候选的射线时逐个候选计算
+    monkeypatch.setattr('path_planning.VIEWPOINT_SCORE_CHUNK', 7)
+    chunked = planner.next_best_view_candidates(holes, CONSTRAINTS)[-1]
+    
+    assert full.dtype == bool and full.shape[1] == len(holes)
+    assert np.array_equal(full, chunked)
+
+
+def test_custom_sequence_cost_is_called_pairwise():
+    planner = PathPlanner()
+    viewpoints = planner.plan_scanning_path(random_holes(n=6, seed=4), CONSTRAINTS)
+    calls = []
+    
+    def angular_distance(a, b):
+        # 标量实现，只接受单对角度
+        calls.append((a, b))
+        return math.hypot(a[0] - b[0], a[1] - b[1])
+    
+    sequence = planner.generate_scanning_sequence(viewpoints, start_angles=(0.0, 0.0), cost=angular_distance)
+    
+    assert sorted(vp['target'] for vp in sequence) == sorted(vp['target'] for vp in viewpoints)
+    # 对称代价每对节点（含起始姿态）只计算一次
+    assert len(calls) == 7 * 6 // 2
+    assert all(len(a) == 2 and len(b) == 2 for a, b in calls)
+    stats = planner.last_sequence_stats
+    assert stats['cost'] == 'angular_distance'
+    angles = [(0.0, 0.0)] + [planner.viewpoint_angles(vp['position'], vp['target']) for vp in sequence]
+    expected = sum(angular_distance(a, b) for a, b in zip(angles, angles[1:]))
+    assert stats['optimized_time'] == pytest.approx(expected)
@@ -0,0 +1,73 @@
+"""
+Unit tests for stage latency histograms and background metrics
+阶段耗时直方图与后台指标采样的单元测试
+"""
+import math
+import numpy as np
+import pytest
+from performance_monitor import StageHistogram
+from config import TRACE_BUCKETS_PER_OCTAVE
+
+
+@pytest.mark.parametrize('q', [50, 95, 99])
+def test_histogram_percentile_within_one_bucket(q):
+    # 跨越多个数量级的对数正态耗时
+    durations = np.random.default_rng(0).lognormal(mean=-4.0, sigma=1.5, size=5000)
+    histogram = StageHistogram()
+    for duration in durations:
+        histogram.record(float(duration))
+    
+    exact = np.percentile(durations, q, method='inverted_cdf')
+    estimate = histogram.percentile(q)
+    
+    # 取桶上界：不低于真实值，且相对误差不超过一个桶宽
+    assert exact <= estimate <= exact * 2 ** (1.0 / TRACE_BUCKETS_PER_OCTAVE) * (1 + 1e-9)
+
+
+def test_histogram_summary_tracks_totals_and_extremes():
+    histogram = StageHistogram()
+    for duration, points in ((0.01, 100), (0.02, 300), (5e-7, None), (2e4, None)):
+        histogram.record(duration, points)
+    
+    summary = histogram.summary()
+    
+    assert summary['calls'] == 4
+    assert summary['points'] == 400
+    assert summary['max'] == 2e4
+    assert math.isclose(summary['total_time'], 0.03 + 5e-7 + 2e4)
+    # 超出范围的耗时落入首尾桶，分位数不超过实际最大值
+    assert histogram.percentile(100) == 2e4
+    assert StageHistogram().percentile(50) is None
+
+
+@pytest.fixture
+def monitor():
+    from performance_monitor import PerformanceMonitor
+    monitor = PerformanceMonitor()
+    monitor.low_overhead = True
+    monitor.start_monitoring()
+    yield monitor
+    monitor.stop_monitoring()
+
+
+def test_sampler_keeps_process_cpu_out_of_system_cpu(monitor):
+    monitor.sample_process_metrics()
+    sum(i * i for i in range(200000))
+    sample = monitor.sample_process_metrics()
+    
+    assert 'process_cpu' in sample and 'cpu' not in sample
+    assert len(monitor.histories['process_cpu']) == 1
+    assert len(monitor.cpu_history) == 0
+    assert 'samples' in monitor.stage_resource_usage()['idle']
+
+
+def test_cpu_recommendation_uses_system_cpu_only(monitor):
+    # 多线程进程按单核计的占用超过100%，不应触发CPU建议
+    monitor.record_metrics('process_cpu', 350.0, 'icp')
+    report = monitor.generate_report()
+    assert not any('CPU' in text for text in report['recommendations'])
+    
+    monitor.record_metrics('cpu', 90.0, 'icp')
+    report = monitor.generate_report()
+    assert any('CPU' in text for text in report['recommendations'])
+    assert report['performance_metrics']['cpu_utilization']['average'] == "90.0%"
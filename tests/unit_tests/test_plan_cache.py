@@ -0,0 +1,145 @@
+"""
+Unit tests for the persistent viewpoint plan cache
+持久化视点计划缓存的单元测试
+"""
+import os
+import numpy as np
+import pytest
+from plan_cache import PlanCache
+from config import PLAN_CACHE_QUANTUM
+
+CONSTRAINTS = {'x_min': -1000, 'x_max': 1000, 'y_min': -1000, 'y_max': 1000, 'z_min': -1000, 'z_max': 1000}
+
+
+def object_cloud(n=2000, seed=0):
+    """
+    三个主轴长度不同且不对称的物体点云
+    """
+    rng = np.random.default_rng(seed)
+    coords = rng.normal(size=(n, 3)) * [120.0, 60.0, 25.0]
+    coords[:, 0] += 0.004 * coords[:, 1] ** 2
+    return coords
+
+
+def rigid_transform(angle, translation):
+    transform = np.eye(4)
+    c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    transform[:3, :3] = [[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]]
+    transform[:3, 3] = translation
+    return transform
+
+
+def make_holes(coords, cells, offset=(0.0, 0.0, 0.0)):
+    """
+    物体坐标系下位于量化单元中心（可加偏移）的空洞
+    """
+    local = (np.asarray(cells, dtype=float) + 0.5) * PLAN_CACHE_QUANTUM + offset
+    centers = PlanCache._apply(PlanCache.object_frame(coords), local)
+    return [{'center': center.tolist(), 'size': 4} for center in centers]
+
+
+def make_plan(holes):
+    return [{'position': (np.add(hole['center'], [0.0, 0.0, 100.0])).tolist(), 'target': hole['center']}
+            for hole in holes]
+
+
+CELLS = [[-3, 1, 0], [2, -1, 1], [4, 2, -1], [0, 3, 0]]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PlanCache(directory=str(tmp_path / 'plans'))
+
+
+def test_exact_hit_on_pose_shifted_copy(cache):
+    coords = object_cloud()
+    holes = make_holes(coords, CELLS)
+    plan = make_plan(holes)
+    assert cache.store(holes, coords, plan, planning_time=2.0)
+    
+    # 同一物体与空洞整体刚体移动后命中同一条目，视点随之变换
+    transform = rigid_transform(35.0, [40.0, -25.0, 10.0])
+    moved_coords = PlanCache._apply(transform, coords)
+    moved_holes = [{'center': PlanCache._apply(transform, hole['center'])[0].tolist(), 'size': 4} for hole in holes]
+    
+    viewpoints = cache.lookup(moved_holes, moved_coords, CONSTRAINTS)
+    
+    assert viewpoints is not None and cache.hits == 1 and cache.near_hits == 0
+    expected = PlanCache._apply(transform, [vp['position'] for vp in plan])
+    assert np.allclose([vp['position'] for vp in viewpoints], expected, atol=1e-6)
+    assert [vp['target'] for vp in viewpoints] == [hole['center'] for hole in moved_holes]
+
+
+def test_near_match_is_validated(cache):
+    coords = object_cloud()
+    holes = make_holes(coords, CELLS)
+    cache.store(holes, coords, make_plan(holes), planning_time=1.0)
+    # 偏移超过半个量化单元，签名不同但仍在匹配容差内
+    shifted = make_holes(coords, CELLS, offset=(0.6 * PLAN_CACHE_QUANTUM, 0.0, 0.0))
+    
+    accepted = cache.lookup(shifted, coords, CONSTRAINTS)
+    
+    assert accepted is not None and cache.near_hits == 1
+    # 缓存视点的目标吸附到当前空洞中心
+    assert [vp['target'] for vp in accepted] == [hole['center'] for hole in shifted]
+    
+    # 视点超出当前工作空间时拒绝复用
+    narrow = dict(CONSTRAINTS, z_max=0.0, z_min=-1000)
+    assert cache.lookup(shifted, coords, narrow) is None
+    assert cache.rejected == 1 and cache.misses == 1
+    
+    # 超出匹配容差时不作为近似匹配
+    far = make_holes(coords, CELLS, offset=(3.0 * PLAN_CACHE_QUANTUM, 0.0, 0.0))
+    assert cache.lookup(far, coords, CONSTRAINTS) is None
+    assert cache.rejected == 1 and cache.misses == 2
+
+
+def test_lru_eviction_at_size_bound(cache):
+    coords = object_cloud()
+    hole_sets = [make_holes(coords, np.add(CELLS, [10 * i, 0, 0])) for i in range(3)]
+    cache.store(hole_sets[0], coords, make_plan(hole_sets[0]), planning_time=1.0)
+    entry_bytes = next(iter(cache.index.values()))['bytes']
+    cache.max_bytes = int(2.5 * entry_bytes)
+    
+    cache.store(hole_sets[1], coords, make_plan(hole_sets[1]), planning_time=1.0)
+    # 使用第一个条目后，最近最少使用的是第二个
+    assert cache.lookup(hole_sets[0], coords, CONSTRAINTS) is not None
+    cache.store(hole_sets[2], coords, make_plan(hole_sets[2]), planning_time=1.0)
+    
+    assert len(cache.index) == 2 and cache.stats()['bytes'] <= cache.max_bytes
+    assert cache.lookup(hole_sets[1], coords, CONSTRAINTS) is None
+    assert cache.lookup(hole_sets[0], coords, CONSTRAINTS) is not None
+    assert cache.lookup(hole_sets[2], coords, CONSTRAINTS) is not None
+    # 被淘汰条目的文件也被删除
+    files = set(os.listdir(cache.directory))
+    assert files == {'index.json'} | {f"{key}.json" for key in cache.index}
+
+
+def test_entries_persist_across_instances(tmp_path):
+    directory = str(tmp_path / 'plans')
+    coords = object_cloud()
+    holes = make_holes(coords, CELLS)
+    PlanCache(directory=directory).store(holes, coords, make_plan(holes), planning_time=1.0)
+    
+    reopened = PlanCache(directory=directory)
+    
+    assert len(reopened.index) == 1
+    assert reopened.lookup(holes, coords, CONSTRAINTS) is not None
+    assert reopened.hits == 1
+
+
+def test_hit_rate_and_time_saved(cache):
+    coords = object_cloud()
+    holes = make_holes(coords, CELLS)
+    cache.store(holes, coords, make_plan(holes), planning_time=2.0)
+    
+    cache.lookup(holes, coords, CONSTRAINTS)
+    cache.lookup(holes, coords, CONSTRAINTS)
+    cache.lookup(make_holes(coords, np.add(CELLS, [20, 20, 0])), coords, CONSTRAINTS)
+    
+    stats = cache.stats()
+    assert stats['hits'] == 2 and stats['misses'] == 1
+    assert stats['hit_rate'] == pytest.approx(2 / 3)
+    # 节省时间为保存的规划时间减去查找耗时
+    assert 3.5 < stats['planning_time_saved'] <= 4.0
+    assert stats['entries'] == 1 and cache.index[next(iter(cache.index))]['uses'] == 2
@@ -0,0 +1,76 @@
+"""
+Unit tests for multi-way registration with the pose graph
+位姿图多视角配准的单元测试
+"""
+import numpy as np
+import pose_graph
+from pose_graph import PoseGraph, _to_matrix
+
+
+def ellipsoid(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    u = rng.uniform(0, 2 * np.pi, n)
+    v = rng.uniform(0, np.pi, n)
+    return np.column_stack([100 * np.cos(u) * np.sin(v), 60 * np.sin(u) * np.sin(v), 40 * np.cos(v)])
+
+
+def partial_scans(poses, seed=0):
+    """
+    物体的部分采样，按位姿(扫描 -> 世界)变换到各自的扫描坐标系
+    """
+    rng = np.random.default_rng(seed)
+    obj = ellipsoid(seed=seed)
+    scans = []
+    for pose in poses:
+        selected = obj[rng.random(len(obj)) < 0.9]
+        scans.append((selected - pose[:3, 3]) @ pose[:3, :3])
+    return scans
+
+
+def test_optimized_poses_match_truth():
+    truth = [np.eye(4), _to_matrix(np.r_[0.03, -0.02, 0.04, 3.0, -2.0, 1.0]),
+             _to_matrix(np.r_[-0.02, 0.03, -0.03, -2.0, 4.0, -1.0])]
+    graph = PoseGraph(max_workers=1, max_correspondence_distance=5.0)
+    for k, scan in enumerate(partial_scans(truth)):
+        # 初值带有编码器级别的误差
+        noise = _to_matrix(np.r_[0.01, -0.01, 0.01, 1.0, -1.0, 0.5]) if k else np.eye(4)
+        graph.add_scan(scan, truth[k] @ noise)
+    poses = graph.optimize()
+    
+    for pose, true_pose in zip(poses, truth):
+        assert np.allclose(pose[:3, :3], true_pose[:3, :3], atol=0.05)
+        assert np.allclose(pose[:3, 3], true_pose[:3, 3], atol=1.0)
+    assert all(edge['error'] is not None for edge in graph.edge_report())
+
+
+def test_failed_pair_does_not_become_an_edge():
+    scans = partial_scans([np.eye(4), np.eye(4)])
+    graph = PoseGraph(max_workers=1, max_correspondence_distance=2.0)
+    graph.add_scan(scans[0])
+    # 初值偏离很远，搜索半径内没有对应点
+    offset = np.eye(4)
+    offset[:3, 3] = [500.0, 0.0, 0.0]
+    graph.add_scan(scans[1], offset)
+    
+    assert graph.edges == {}
+    # 没有边时保持初值(编码器位姿先验)
+    assert np.allclose(graph.optimize()[1], offset)
+
+
+def test_process_pool_is_reused_across_scans(monkeypatch):
+    monkeypatch.setattr(pose_graph, 'POSE_GRAPH_PARALLEL_MIN_PAIRS', 2)
+    scans = partial_scans([np.eye(4)] * 4)
+    graph = PoseGraph(max_workers=2)
+    executors = []
+    try:
+        for scan in scans:
+            graph.add_scan(scan)
+            executors.append(graph._executor)
+    finally:
+        graph.close()
+    
+    # 前两次扫描的新增边少于阈值，串行计算；之后复用同一个进程池
+    assert executors[:2] == [None, None]
+    assert executors[2] is not None and executors[3] is executors[2]
+    assert len(graph.edges) == 6
+    assert graph._executor is None
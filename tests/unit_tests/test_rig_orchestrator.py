@@ -0,0 +1,97 @@
+"""
+Unit tests for multi-scanner orchestration on simulated rigs
+仿真多扫描仪协同扫描的单元测试
+"""
+import numpy as np
+import pytest
+from rig_orchestrator import RigOrchestrator, ScannerRig
+from simulated_rig import SimulatedMotorController, SimulatedSensorController
+
+# 夹具坐标系下的球形物体，偏离竖直轴，外参用错时融合结果不在同一球面上
+SPHERE_CENTER = np.array([20.0, 0.0, 100.0])
+SPHERE_RADIUS = 50.0
+
+
+def rotation_z(angle):
+    transform = np.eye(4)
+    c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    transform[:2, :2] = [[c, -s], [s, c]]
+    return transform
+
+
+def simulated_rigs(angles=(0.0, 120.0, 240.0), time_scale=0.02, constraints=None):
+    """
+    绕夹具竖直轴旋转安装的仿真扫描仪，传感器中的球心使用各自扫描仪坐标系
+    """
+    rigs = []
+    for i, angle in enumerate(angles):
+        extrinsic = rotation_z(angle)
+        center = np.linalg.inv(extrinsic)[:3, :3] @ SPHERE_CENTER
+        motor_ctrl = SimulatedMotorController(time_scale=time_scale)
+        sensor_ctrl = SimulatedSensorController(motor_ctrl, center=center, radius=SPHERE_RADIUS,
+                                                noise=0.0, seed=i)
+        rigs.append(ScannerRig(f"rig{i}", sensor_ctrl, motor_ctrl, extrinsic,
+                               constraints[i] if constraints else None))
+    return rigs
+
+
+def upward_viewpoints(n=150):
+    """
+    从夹具原点对准球面的视点，电机垂直角即仿真传感器的天顶角
+    """
+    h = np.radians(np.linspace(0.0, 345.0, n))
+    v = np.radians(np.linspace(5.0, 20.0, n))
+    targets = np.column_stack([np.cos(h) * np.cos(v), np.sin(h) * np.cos(v), np.sin(v)]) * 80.0
+    return [{'position': [0.0, 0.0, 0.0], 'target': target.tolist()} for target in targets]
+
+
+def test_partition_respects_reachability(simulated_controller):
+    constraints = [
+        {'x_min': -500, 'x_max': 0, 'y_min': -500, 'y_max': 500, 'z_min': -500, 'z_max': 500},
+        {'x_min': 0, 'x_max': 500, 'y_min': -500, 'y_max': 500, 'z_min': -500, 'z_max': 500}
+    ]
+    orchestrator = RigOrchestrator(simulated_controller, simulated_rigs((0.0, 0.0), constraints=constraints))
+    viewpoints = [{'position': [x, 0.0, 0.0], 'target': [x, 0.0, 100.0]} for x in (-40.0, -20.0, 20.0, 40.0)]
+    viewpoints.append({'position': [0.0, 900.0, 0.0], 'target': [0.0, 900.0, 100.0]})
+    
+    sequences, dropped = orchestrator.partition(viewpoints)
+    
+    # 每个视点只分给能到达它的扫描仪，两台都到不了的视点被丢弃
+    assert dropped == 1
+    assert sorted(vp['position'][0] for vp in sequences[0]) == [-40.0, -20.0]
+    assert sorted(vp['position'][0] for vp in sequences[1]) == [20.0, 40.0]
+
+
+def test_multi_rig_scan_partitions_and_fuses_with_extrinsics(simulated_controller, monkeypatch):
+    controller = simulated_controller
+    viewpoints = upward_viewpoints()
+    plans = iter([{'viewpoints': viewpoints}])
+    monkeypatch.setattr(controller.scan_optimizer, 'generate_next_scan', lambda *args, **kwargs: next(plans, None))
+    rigs = simulated_rigs()
+    
+    assert controller.run_multi_rig_scan(rigs, max_iterations=1) is not None
+    
+    stats = controller.orchestrator.last_orchestration_stats
+    # 视点在三台扫描仪间分配，每个视点恰好执行一次
+    views = [stats['rigs'][rig.name]['views'] for rig in rigs]
+    assert sum(views) == len(viewpoints) and min(views) > 0
+    assert controller.last_sequence_visited == len(viewpoints)
+    # 各扫描仪的行程在汇合后合计，不在并发执行中相互干扰
+    assert controller.motor_travel == pytest.approx(sum(stats['rigs'][rig.name]['travel'] for rig in rigs))
+    assert all(stats['rigs'][rig.name]['travel'] > 0 for rig in rigs)
+    
+    # 外参作为配准初值，配准结果只在其附近微调
+    assert len(controller.all_scans) == len(rigs)
+    for rig, prior, transform in zip(rigs, controller.scan_priors, controller.transformations):
+        assert np.allclose(prior, rig.extrinsic)
+        residual = np.linalg.inv(rig.extrinsic) @ transform
+        assert np.degrees(np.arccos(np.clip((np.trace(residual[:3, :3]) - 1) / 2, -1, 1))) < 5.0
+        assert np.linalg.norm(residual[:3, 3]) < 3.0
+    # 融合后所有扫描仪的点都落在夹具坐标系下的同一球面上(外参用错时球心相差约35)
+    map_to_fixture = controller.scan_priors[0]
+    points = controller.global_map.coords @ map_to_fixture[:3, :3].T + map_to_fixture[:3, 3]
+    assert np.allclose(np.linalg.norm(points - SPHERE_CENTER, axis=1), SPHERE_RADIUS, atol=4.0)
+    
+    # 三台扫描仪并行采集
+    assert stats['parallel_speedup'] > 1.5
+    assert stats['serial_acquisition_time'] > stats['acquisition_time']
@@ -0,0 +1,114 @@
+"""
+Unit tests for checkpoint save, restore and resume
+检查点保存、恢复与续扫的单元测试
+"""
+import numpy as np
+from scan_checkpoint import ScanCheckpoint
+
+
+def sphere_scan(h_angles, v_angles, distance=80.0):
+    return [
+        {'distance': distance, 'angle_h': h, 'angle_v': v, 'lift': 0, 'timestamp': float(i)}
+        for i, (h, v) in enumerate((h, v) for h in h_angles for v in v_angles)
+    ]
+
+
+def scanned_controller(controller_factory, scans):
+    controller = controller_factory()
+    for scan in scans:
+        controller.integrate_scan(scan)
+        controller.iterations_completed += 1
+    return controller
+
+
+def test_checkpoint_round_trip(controller_factory, tmp_path):
+    scans = [sphere_scan(range(0, 90, 5), range(30, 150, 5)),
+             sphere_scan(range(60, 150, 5), range(30, 150, 5), distance=82.0)]
+    original = scanned_controller(controller_factory, scans[:1])
+    checkpoint = ScanCheckpoint(str(tmp_path / 'session'))
+    assert checkpoint.save(original, viewpoints=[{'position': [0, 0, 0], 'target': [0, 0, 100]}])
+    # 第二次保存只追加新增的扫描
+    original.integrate_scan(scans[1])
+    original.iterations_completed += 1
+    assert checkpoint.save(original)
+    
+    restored = controller_factory()
+    state = ScanCheckpoint(str(tmp_path / 'session')).restore(restored)
+    
+    assert state is not None and state['iterations'] == 2
+    assert len(state['viewpoints']) == 1
+    assert restored.raw_scans == original.raw_scans
+    assert restored.all_scans == original.all_scans
+    assert np.allclose(restored.transformations, original.transformations)
+    assert np.allclose(restored.scan_priors, original.scan_priors)
+    assert restored.iterations_completed == 2 and restored.cloud_version == original.cloud_version
+    assert np.array_equal(restored.global_map.coords, original.global_map.coords)
+    assert restored.scan_optimizer.occupancy.completion() == original.scan_optimizer.occupancy.completion()
+
+
+def test_raw_only_checkpoint_is_not_restored(controller_factory, tmp_path):
+    checkpoint = ScanCheckpoint(str(tmp_path / 'raw'))
+    assert checkpoint.save_raw(sphere_scan(range(0, 90, 5), range(30, 150, 5)))
+    controller = controller_factory()
+    
+    # 只有原始数据的会话需由离线批处理重新计算，不能恢复或续扫
+    assert checkpoint.restore(controller) is None
+    assert controller.all_scans == [] and len(controller.global_map) == 0
+    assert controller.resume_automated_scan(checkpoint) is None
+    assert ScanCheckpoint(str(tmp_path / 'raw')).manifest['raw_only']
+    
+    # 已有处理结果的检查点不接受原始数据
+    processed = ScanCheckpoint(str(tmp_path / 'processed'))
+    processed.save(scanned_controller(controller_factory, [sphere_scan(range(0, 90, 5), range(30, 150, 5))]))
+    assert not processed.save_raw(sphere_scan(range(0, 90, 5), range(30, 150, 5)))
+
+
+def multiway_checkpoint(controller_factory, path):
+    original = controller_factory()
+    for scan in (sphere_scan(range(0, 90, 5), range(30, 150, 5)),
+                 sphere_scan(range(60, 150, 5), range(30, 150, 5)),
+                 sphere_scan(range(120, 210, 5), range(30, 150, 5))):
+        original.integrate_scan(scan, 'multiway')
+        original.iterations_completed += 1
+    checkpoint = ScanCheckpoint(path)
+    assert checkpoint.save(original, 'multiway')
+    original.pose_graph.close()
+    return original, checkpoint
+
+
+def test_multiway_restore_reuses_saved_edges(controller_factory, tmp_path, monkeypatch):
+    original, checkpoint = multiway_checkpoint(controller_factory, str(tmp_path / 'multiway'))
+    assert 'edges' in checkpoint.manifest['poses']
+    
+    # 保存的边直接恢复，不再执行任何配准
+    import pose_graph
+    monkeypatch.setattr(pose_graph, '_pairwise_registration', None)
+    restored = controller_factory()
+    state = ScanCheckpoint(str(tmp_path / 'multiway')).restore(restored)
+    
+    assert state is not None
+    assert sorted(restored.pose_graph.edges) == sorted(original.pose_graph.edges)
+    for key, edge in original.pose_graph.edges.items():
+        assert np.allclose(restored.pose_graph.edges[key]['transform'], edge['transform'])
+        assert restored.pose_graph.edges[key]['weight'] == edge['weight']
+
+
+def test_multiway_restore_without_saved_edges_batches_registration(controller_factory, tmp_path, monkeypatch):
+    original, checkpoint = multiway_checkpoint(controller_factory, str(tmp_path / 'legacy'))
+    # 旧检查点没有保存边
+    del checkpoint.manifest['poses']['edges']
+    checkpoint._atomic_json(checkpoint.manifest_path, checkpoint.manifest)
+    
+    from pose_graph import PoseGraph
+    batches = []
+    compute_edges = PoseGraph.compute_edges
+    monkeypatch.setattr(PoseGraph, 'compute_edges',
+                        lambda self, pairs: batches.append(list(pairs)) or compute_edges(self, pairs))
+    restored = controller_factory()
+    ScanCheckpoint(str(tmp_path / 'legacy')).restore(restored)
+    
+    # 所有点对一次提交，点对足够多时由进程池并行计算
+    assert len(batches) == 1
+    assert set(original.pose_graph.edges) <= set(batches[0])
+    assert sorted(restored.pose_graph.edges) == sorted(original.pose_graph.edges)
+    restored.pose_graph.close()
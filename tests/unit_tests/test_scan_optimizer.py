@@ -0,0 +1,112 @@
+"""
+Unit tests for coverage analysis and completion estimation
+覆盖分析与完成度估计的单元测试
+"""
+import numpy as np
+import pytest
+from coverage_detection import CoverageDetector
+from path_planning import PathPlanner
+from scan_optimizer import ScanOptimizer
+from global_map import GlobalMap
+
+
+def reference_cloud(n=3000, seed=0):
+    """
+    带有一块缺口的半球面参考点云
+    """
+    rng = np.random.default_rng(seed)
+    theta = rng.uniform(0, 2 * np.pi, n)
+    phi = rng.uniform(0, np.pi / 2, n)
+    coords = np.column_stack([np.cos(theta) * np.sin(phi), np.sin(theta) * np.sin(phi), np.cos(phi)]) * 50.0
+    keep = ~((theta < 1.0) & (phi > 0.6))
+    return coords[keep]
+
+
+def as_points(coords):
+    return [{'x': x, 'y': y, 'z': z} for x, y, z in coords]
+
+
+@pytest.fixture
+def optimizer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return ScanOptimizer(CoverageDetector(), PathPlanner())
+
+
+def visibility_completion(coords):
+    visibility_map = CoverageDetector().create_visibility_map(coords)
+    return visibility_map.covered_voxels / visibility_map.total_voxels
+
+
+def test_incremental_completion_tracks_visibility_map(optimizer, monkeypatch):
+    coords = reference_cloud(n=6000)
+    # 按方位角分段的四次扫描，覆盖范围和包围盒逐次扩大
+    azimuth = np.arctan2(coords[:, 1], coords[:, 0])
+    bounds = np.linspace(-np.pi, np.pi + 1e-9, 5)
+    global_map = GlobalMap()
+    # 完成度只由占据地图增量统计，不构建可见性地图
+    monkeypatch.setattr(optimizer.coverage_detector, 'create_visibility_map', None)
+    
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        global_map.add_scan(coords[(azimuth >= low) & (azimuth < high)])
+        expected = visibility_completion(global_map.coords)
+        
+        estimate = optimizer.estimate_completion(global_map)
+        
+        assert estimate['completion_rate'] == pytest.approx(expected, rel=0.03)
+        assert optimizer.last_completion == estimate['completion_rate']
+        # 阈值不在误差范围内时，停止判断与可见性地图一致
+        assert optimizer.estimate_completion(global_map, threshold=expected * 0.95)['is_complete']
+        assert not optimizer.estimate_completion(global_map, threshold=expected * 1.05)['is_complete']
+    assert optimizer.occupancy.total_points == len(global_map)
+
+
+def test_completion_of_point_list_matches_visibility_map(optimizer):
+    coords = reference_cloud(seed=2)
+    
+    estimate = optimizer.estimate_completion(as_points(coords), version=7)
+    
+    assert estimate['completion_rate'] == pytest.approx(visibility_completion(coords), rel=0.03)
+    assert estimate['uncovered_regions'] is None
+    # 同一版本已有覆盖分析时报告其空洞数
+    holes = optimizer.analyze_coverage(as_points(coords), version=7)['holes']
+    assert optimizer.estimate_completion(coords, version=7)['uncovered_regions'] == len(holes)
+
+
+def test_occupancy_rebuilds_when_bounds_coarsen_resolution(optimizer):
+    global_map = GlobalMap()
+    global_map.add_scan(reference_cloud())
+    optimizer.update_occupancy(global_map)
+    resolution = optimizer.occupancy.resolution
+    
+    # 包围盒扩大到原来的数倍，可见性地图的分辨率随之变粗
+    global_map.add_scan(reference_cloud(seed=3) * 4.0)
+    optimizer.update_occupancy(global_map)
+    
+    assert optimizer.occupancy.resolution > resolution * 2
+    assert optimizer.occupancy.resolution == pytest.approx(optimizer.occupancy.target_resolution())
+    assert optimizer.occupancy.completion() == pytest.approx(visibility_completion(global_map.coords), rel=0.03)
+
+
+def test_hierarchical_coverage_analysis_matches_dense_pass(optimizer):
+    points = as_points(reference_cloud(seed=1))
+    dense_optimizer = ScanOptimizer(CoverageDetector(), PathPlanner(), hierarchical_coverage=False)
+    
+    coverage_info = optimizer.analyze_coverage(points)
+    dense_info = dense_optimizer.analyze_coverage(points)
+    
+    assert coverage_info['visibility_map'] is None and dense_info['visibility_map'] is not None
+    assert coverage_info['level_stats']['evaluated'] < coverage_info['level_stats']['total_voxels']
+    assert len(coverage_info['holes']) == len(dense_info['holes']) > 0
+    for hole, expected in zip(coverage_info['holes'], dense_info['holes']):
+        assert hole['size'] == expected['size']
+        assert np.allclose(hole['center'], expected['center'])
+        assert hole['surface_area'] == pytest.approx(expected['surface_area'])
+
+
+def test_cost_model_is_not_persisted_by_default(optimizer, tmp_path):
+    optimizer.cost_model.calibrated = True
+    
+    assert not optimizer.cost_model.save()
+    assert list(tmp_path.iterdir()) == []
+    # 规划与计划比较共用同一时间模型
+    assert optimizer.path_planner.motion_model is optimizer.cost_model
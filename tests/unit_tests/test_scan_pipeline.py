@@ -0,0 +1,147 @@
+"""
+Unit tests for the pipelined scan scheduler on the simulated rig
+仿真扫描仪上流水线扫描调度的单元测试
+"""
+import time
+import threading
+import numpy as np
+import pytest
+from scan_pipeline import ScanPipeline
+from scan_checkpoint import ScanCheckpoint
+
+
+def sphere_scan(h_angles, v_angles, distance=80.0):
+    return [
+        {'distance': distance, 'angle_h': h, 'angle_v': v, 'lift': 0, 'timestamp': float(i)}
+        for i, (h, v) in enumerate((h, v) for h in h_angles for v in v_angles)
+    ]
+
+
+def zenith_viewpoints(n=12):
+    """
+    从原点出发的视点，电机垂直角即仿真传感器的天顶角，这些方向上都能测到球面
+    """
+    h = np.radians(np.linspace(0.0, 330.0, n))
+    v = np.radians(np.linspace(5.0, 25.0, n))
+    targets = np.column_stack([np.cos(h) * np.cos(v), np.sin(h) * np.cos(v), np.sin(v)]) * 80.0
+    return [{'position': [0.0, 0.0, 0.0], 'target': target.tolist()} for target in targets]
+
+
+@pytest.fixture
+def pipeline_controller(simulated_controller, monkeypatch, tmp_path):
+    """
+    已有一次局部扫描的仿真控制器；电机按实际耗时的 1/50 转动，合并每批数据额外耗时 50ms
+    规划器返回固定视点中尚未采集的部分
+    """
+    controller = simulated_controller
+    monkeypatch.setattr(controller, 'initialize_system', lambda: True)
+    for motor in (controller.motor_ctrl.horizontal_motor, controller.motor_ctrl.vertical_motor):
+        motor.time_scale = 0.02
+    controller.integrate_scan(sphere_scan(range(0, 90, 5), range(30, 150, 5)))
+    controller.checkpoint = ScanCheckpoint(str(tmp_path / 'checkpoint'))
+    
+    viewpoints = zenith_viewpoints()
+    controller.acquired = []
+    controller.integrated = []
+    
+    def plan_remaining(*args, **kwargs):
+        return {'viewpoints': [vp for vp in viewpoints if vp['target'] not in controller.acquired]}
+    monkeypatch.setattr(controller.scan_optimizer, 'generate_next_scan', plan_remaining)
+    
+    execute = controller.execute_scanning_sequence
+    
+    def recording_execute(sequence, *args, **kwargs):
+        controller.acquired.extend(vp['target'] for vp in sequence)
+        return execute(sequence, *args, **kwargs)
+    monkeypatch.setattr(controller, 'execute_scanning_sequence', recording_execute)
+    
+    integrate_scan = controller.integrate_scan
+    
+    def slow_integrate(raw_data, registration_mode='sequential', extrinsic=None):
+        time.sleep(0.05)
+        ok = integrate_scan(raw_data, registration_mode, extrinsic)
+        controller.integrated.append((threading.current_thread(), len(raw_data), ok))
+        return ok
+    monkeypatch.setattr(controller, 'integrate_scan', slow_integrate)
+    return controller
+
+
+def successful_integrations(controller):
+    return sum(1 for _, _, ok in controller.integrated if ok)
+
+
+def test_pipeline_overlaps_acquisition_with_processing(pipeline_controller):
+    controller = pipeline_controller
+    pipeline = ScanPipeline(controller, batch_size=2)
+    
+    assert pipeline.run(completion_threshold=1.1, max_iterations=3) is not None
+    
+    # 所有视点都已采集；每合并一批计为一轮，检查点记录相同的轮数；数据只在主线程合并
+    assert len(controller.acquired) == len(zenith_viewpoints())
+    assert successful_integrations(controller) > 1
+    assert controller.iterations_completed == successful_integrations(controller)
+    assert controller.checkpoint.manifest['iterations'] == controller.iterations_completed
+    assert {thread for thread, _, _ in controller.integrated} == {threading.current_thread()}
+    
+    stats = pipeline.stats()
+    assert stats['planning_rounds'] == 3
+    assert {'acquisition', 'processing', 'planning'} <= set(stats['stages'])
+    assert stats['stages']['acquisition']['items'] == len(controller.acquired)
+    for info in stats['stages'].values():
+        assert 0.0 <= info['utilization'] <= 1.0 + 1e-6
+    # 采集与处理并行，各阶段忙碌时间之和超过总耗时
+    assert stats['serial_time'] > stats['wall_time'] and stats['overlap'] > 0
+    assert pipeline.queue_depths() == {'pending_viewpoints': 0, 'in_flight_batches': 0, 'unprocessed_batches': 0}
+
+
+def test_pipeline_stops_early_on_completion(pipeline_controller, monkeypatch):
+    controller = pipeline_controller
+    # 采集一批明显慢于处理一批，完成时最多已开始采集第二批
+    for motor in (controller.motor_ctrl.horizontal_motor, controller.motor_ctrl.vertical_motor):
+        motor.time_scale = 0.2
+    pipeline = ScanPipeline(controller, batch_size=2)
+    monkeypatch.setattr(controller.scan_optimizer, 'estimate_completion',
+                        lambda *args, **kwargs: {'completion': 1.0, 'is_complete': True})
+    
+    assert pipeline.run(max_iterations=5) is not None
+    
+    # 第一批合并后即完成：不再重规划，剩余视点不再采集
+    assert pipeline.stats()['planning_rounds'] == 1
+    assert 0 < len(controller.acquired) <= 2 * pipeline.batch_size < len(zenith_viewpoints())
+    assert pipeline.queue_depths()['pending_viewpoints'] == 0
+
+
+def test_pipeline_drains_acquired_batches_after_stop(pipeline_controller, monkeypatch):
+    controller = pipeline_controller
+    pipeline = ScanPipeline(controller, batch_size=2)
+    
+    def complete_after_next_batch(*args, **kwargs):
+        # 等到下一批已采集完成、尚未处理时宣告完成
+        deadline = time.perf_counter() + 5.0
+        while pipeline.results.empty() and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        return {'completion': 1.0, 'is_complete': True}
+    monkeypatch.setattr(controller.scan_optimizer, 'estimate_completion', complete_after_next_batch)
+    
+    assert pipeline.run(max_iterations=5) is not None
+    
+    # 停止后仍合并所有已采集的批次
+    batches = len(controller.acquired) // pipeline.batch_size
+    assert batches >= 2 and len(controller.integrated) == batches
+    assert controller.iterations_completed == successful_integrations(controller) == batches
+    assert controller.checkpoint.manifest['iterations'] == controller.iterations_completed
+    assert pipeline.results.empty()
+
+
+def test_pipeline_state_is_owned_by_the_main_thread(pipeline_controller):
+    pipeline = ScanPipeline(pipeline_controller)
+    pipeline._owner = threading.current_thread()
+    errors = []
+    
+    worker = threading.Thread(target=lambda: errors.append(
+        pytest.raises(RuntimeError, pipeline._completion, 0.9)))
+    worker.start()
+    worker.join()
+    
+    assert len(errors) == 1
+    assert pipeline._completion(0.9) is not None
@@ -0,0 +1,148 @@
+"""
+Unit tests for scan registration and execution in SystemController
+系统控制器中扫描配准与执行的单元测试
+"""
+import time
+import numpy as np
+import pytest
+
+
+def sphere_scan(h_angles, v_angles, distance=80.0):
+    return [
+        {'distance': distance, 'angle_h': h, 'angle_v': v, 'lift': 0, 'timestamp': float(i)}
+        for i, (h, v) in enumerate((h, v) for h in h_angles for v in v_angles)
+    ]
+
+
+def test_failed_registration_falls_back_to_encoder_prior(offline_controller, monkeypatch):
+    controller = offline_controller
+    first = sphere_scan(range(0, 90, 5), range(30, 150, 5))
+    assert controller.register_scan(first, controller.process_scan_data(first))
+    
+    # 配准失败(搜索半径内没有对应点)时使用编码器位姿先验合并扫描
+    monkeypatch.setattr(controller.data_fusion, 'icp_registration', lambda *args, **kwargs: (None, None))
+    second = sphere_scan(range(60, 150, 5), range(30, 150, 5))
+    before = len(controller.global_map)
+    
+    assert controller.register_scan(second, controller.process_scan_data(second))
+    prior = np.linalg.inv(controller.scan_priors[0]) @ controller.kinematics.scan_prior(second)
+    assert np.allclose(controller.transformations[-1], prior)
+    assert controller.registration_fallbacks == 1
+    assert len(controller.all_scans) == 2
+    assert len(controller.global_map) > before
+
+
+def test_failed_processing_is_not_registered(offline_controller, monkeypatch):
+    controller = offline_controller
+    scan = sphere_scan(range(0, 90, 5), range(30, 150, 5))
+    monkeypatch.setattr(controller, 'process_scan_data', lambda raw_data: None)
+    
+    assert not controller.integrate_scan(scan)
+    assert controller.cloud_version == 0
+    assert not controller.all_scans and not controller.raw_scans
+
+
+def test_current_scan_data_is_a_copy(offline_controller):
+    controller = offline_controller
+    controller.integrate_scan(sphere_scan(range(0, 90, 5), range(30, 150, 5)))
+    size = len(controller.global_map)
+    
+    points = controller.current_scan_data
+    points.clear()
+    controller.current_scan_data[0]['x'] = 1e6
+    
+    assert len(controller.current_scan_data) == size
+    assert controller.current_scan_data[0]['x'] == controller.global_map.coords[0, 0] != 1e6
+
+
+def test_completion_check_does_not_run_coverage_analysis(offline_controller):
+    controller = offline_controller
+    scan = sphere_scan(range(0, 180, 5), range(30, 150, 5))
+    controller.integrate_scan(scan)
+    cache = controller.scan_optimizer.coverage_cache
+    
+    # 完成度由增量占据地图给出，只有下一轮规划需要覆盖分析
+    completion = controller.scan_optimizer.estimate_completion(controller.global_map, version=controller.cloud_version)
+    assert cache.stats()['entries'] == 0 and completion['uncovered_regions'] is None
+    controller.scan_optimizer.generate_next_scan(controller.global_map.coords, controller.prepare_workspace(),
+                                                 version=controller.cloud_version)
+    assert cache.stats()['misses'] == 1
+    completion = controller.scan_optimizer.estimate_completion(controller.global_map, version=controller.cloud_version)
+    assert completion['uncovered_regions'] is not None
+    assert cache.stats()['hits'] == 0
+    assert controller.progress_stats()['completion'] == completion['completion_rate']
+
+
+def test_multiway_map_rebuild_invalidates_coverage_cache(offline_controller):
+    controller = offline_controller
+    cache = controller.scan_optimizer.coverage_cache
+    first = sphere_scan(range(0, 90, 5), range(30, 150, 5))
+    controller.register_scan(first, controller.process_scan_data(first), 'multiway')
+    controller.scan_optimizer.analyze_coverage(controller.global_map.coords, controller.cloud_version)
+    assert cache.stats()['entries'] == 1
+    
+    second = sphere_scan(range(60, 150, 5), range(30, 150, 5))
+    controller.register_scan(second, controller.process_scan_data(second), 'multiway')
+    assert cache.stats()['entries'] == 0
+    controller.pose_graph.close()
+
+
+def planned_sequence(controller, start_angles, n_holes=6, seed=0):
+    rng = np.random.default_rng(seed)
+    holes = [{'center': center.tolist(), 'size': 5}
+             for center in rng.uniform([-150, -150, 20], [150, 150, 150], (n_holes, 3))]
+    viewpoints = controller.path_planner.plan_scanning_path(holes, controller.prepare_workspace())
+    return controller.path_planner.generate_scanning_sequence(viewpoints, start_angles=start_angles)
+
+
+def test_executed_travel_matches_predicted_travel(simulated_controller):
+    controller = simulated_controller
+    # 从非零的编码器位置出发
+    controller.motor_ctrl.rotate_horizontal(30)
+    controller.motor_ctrl.rotate_vertical(-10)
+    start_angles = controller.motor_angles()
+    sequence = planned_sequence(controller, start_angles)
+    predicted = controller.cost_model.predict_plan(sequence, start_angles)
+    
+    assert controller.execute_scanning_sequence(sequence) is not None
+    
+    # 编码器测得的行程等于时间模型预测的行程，最终停在最后一个视点的绝对角度
+    assert controller.motor_travel == pytest.approx(predicted['travel'])
+    # 序列规划与时间模型使用同一运动模型
+    assert controller.path_planner.last_sequence_stats['optimized_time'] == pytest.approx(predicted['motion'])
+    final = controller.path_planner.viewpoint_angles(sequence[-1]['position'], sequence[-1]['target'])
+    assert controller.motor_angles() == pytest.approx(final)
+
+
+@pytest.mark.parametrize('time_budget, travel_budget', [(30.0, 150.0), (30.0, 400.0), (6.0, None)])
+def test_budgeted_scan_never_exceeds_budgets(simulated_controller, time_budget, travel_budget):
+    controller = simulated_controller
+    # 电机转动按实际耗时的 1/20 仿真，使时间预算生效
+    for motor in (controller.motor_ctrl.horizontal_motor, controller.motor_ctrl.vertical_motor):
+        motor.time_scale = 0.05
+    # 初始的局部扫描，留下需要补扫的空洞
+    controller.integrate_scan(sphere_scan(range(0, 90, 5), range(30, 150, 5)))
+    
+    controller.run_budgeted_scan(time_budget, travel_budget)
+    report = controller.last_budget_report
+    
+    assert report['views'] > 0
+    assert report['time_spent'] <= time_budget
+    if travel_budget is not None:
+        assert report['travel_spent'] <= travel_budget
+
+
+def test_sequence_stops_before_the_viewpoint_that_exceeds_a_budget(simulated_controller):
+    controller = simulated_controller
+    sequence = planned_sequence(controller, controller.motor_angles())
+    travel_limit = controller.cost_model.predict_plan(sequence)['travel'] / 2
+    
+    controller.execute_scanning_sequence(sequence, travel_limit=travel_limit)
+    assert controller.last_sequence_stop == 'travel_budget'
+    assert 0 < controller.last_sequence_visited < len(sequence)
+    assert controller.motor_travel <= travel_limit
+    
+    travel = controller.motor_travel
+    controller.execute_scanning_sequence(sequence, deadline=time.perf_counter())
+    assert controller.last_sequence_stop == 'time_budget'
+    assert controller.last_sequence_visited == 0 and controller.motor_travel == travel
@@ -0,0 +1,158 @@
+"""
+Per-module import time report for startup regressions
+按模块统计导入耗时，用于防止启动变慢
+
+用法: python utils/import_report.py [--save import_times.json] [--baseline import_times.json]
+每个模块在独立的解释器中用 -X importtime 导入，报告总耗时和被拉入的重量级依赖
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIRS = ('config', 'src/core', 'src/data', 'src/analysis', 'src/hardware', 'utils', 'tests')
+
+# 分析相关的重量级依赖，只应在使用它们的阶段才导入
+HEAVY_PACKAGES = ('scipy', 'sklearn', 'psutil')
+
+# 采集路径上的模块，导入时不允许拉入重量级依赖
+ACQUISITION_MODULES = ('config', 'data_acquisition', 'scan_checkpoint', 'acquire',
+                       'sensor_init', 'motor_control', 'simulated_rig')
+
+# 导入会直接运行程序的入口模块不计入报告
+EXCLUDED_MODULES = ('import_report',)
+
+# 只在EV3上安装的硬件依赖，缺失时相关模块跳过而不是报告回归
+HARDWARE_PACKAGES = ('ev3dev2',)
+
+def project_modules():
+    modules = []
+    for directory in SOURCE_DIRS:
+        path = os.path.join(ROOT, directory)
+        for name in sorted(os.listdir(path)):
+            module = name[:-3]
+            if name.endswith('.py') and module != '__init__' and module not in EXCLUDED_MODULES:
+                modules.append(module)
+    return modules
+
+def measure(module, repeat=3):
+    """
+    在新解释器中导入模块，返回最快一次的总耗时、自身耗时(ms)及导入的顶层包
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.join(ROOT, d) for d in SOURCE_DIRS] + [ROOT] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else [])
+    )
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'import failed'
+            if any(f"No module named '{package}" in error for package in HARDWARE_PACKAGES):
+                return {'module': module, 'skipped': 'hardware'}
+            return {'module': module, 'error': error}
+        
+        # 每行: import time: self [us] | cumulative | 按嵌套深度缩进的包名，子模块先于父模块输出
+        entries = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            entries.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+        timings = {name: (self_us, cumulative_us) for _, name, self_us, cumulative_us in entries}
+        if module not in timings:
+            return {'module': module, 'error': 'module not found in import trace'}
+        
+        # 逆序即先父后子，只累计最外层的重量级依赖，避免重复计算
+        heavy_us, stack = 0, []
+        for depth, name, _, cumulative_us in reversed(entries):
+            while stack and stack[-1][0] >= depth:
+                stack.pop()
+            inside_heavy = bool(stack) and stack[-1][1]
+            heavy = name.split('.')[0] in HEAVY_PACKAGES
+            if heavy and not inside_heavy:
+                heavy_us += cumulative_us
+            stack.append((depth, heavy or inside_heavy))
+        
+        result = {
+            'module': module,
+            'total_ms': timings[module][1] / 1000.0,
+            'self_ms': timings[module][0] / 1000.0,
+            'heavy': sorted({name.split('.')[0] for name in timings} & set(HEAVY_PACKAGES)),
+            'heavy_ms': heavy_us / 1000.0
+        }
+        if best is None or result['total_ms'] < best['total_ms']:
+            best = result
+    return best
+
+def check(results, baseline=None, tolerance=0.5, min_delta_ms=50.0):
+    """
+    回归检查：采集路径模块不得导入重量级依赖；相对基线变慢超过 tolerance 且超过 min_delta_ms 视为回归
+    """
+    problems = []
+    for result in results:
+        module = result['module']
+        if 'skipped' in result:
+            continue
+        if 'error' in result:
+            problems.append(f"{module}: {result['error']}")
+            continue
+        if module in ACQUISITION_MODULES and result['heavy']:
+            problems.append(f"{module}: acquisition module imports {', '.join(result['heavy'])}")
+        previous = (baseline or {}).get(module)
+        if previous is not None:
+            delta = result['total_ms'] - previous
+            if delta > min_delta_ms and result['total_ms'] > previous * (1 + tolerance):
+                problems.append(f"{module}: {result['total_ms']:.1f}ms vs baseline {previous:.1f}ms")
+    return problems
+
+def format_report(results, baseline=None):
+    lines = [f"{'module':<24}{'total ms':>10}{'self ms':>10}{'baseline':>10}  heavy dependencies"]
+    for result in sorted(results, key=lambda r: -r.get('total_ms', -1)):
+        if 'skipped' in result:
+            lines.append(f"{result['module']:<24}{'skipped':>10}  ({result['skipped']})")
+            continue
+        if 'error' in result:
+            lines.append(f"{result['module']:<24}{'error':>10}  {result['error']}")
+            continue
+        previous = (baseline or {}).get(result['module'])
+        lines.append(
+            f"{result['module']:<24}{result['total_ms']:>10.1f}{result['self_ms']:>10.1f}"
+            f"{(f'{previous:.1f}' if previous is not None else '-'):>10}  "
+            + (f"{', '.join(result['heavy'])} ({result['heavy_ms']:.0f}ms)" if result['heavy'] else '')
+        )
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import time per project module")
+    parser.add_argument('modules', nargs='*', help="modules to measure (default: all project modules)")
+    parser.add_argument('--repeat', type=int, default=3, help="imports per module, fastest is reported")
+    parser.add_argument('--baseline', help="JSON file with baseline total import times (ms)")
+    parser.add_argument('--save', help="write the measured total import times to this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+    
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    
+    results = [measure(module, args.repeat) for module in (args.modules or project_modules())]
+    print(format_report(results, baseline))
+    
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({r['module']: round(r['total_ms'], 1) for r in results if 'total_ms' in r},
+                      f, indent=2, sort_keys=True)
+    
+    problems = check(results, baseline, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
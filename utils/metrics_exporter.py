@@ -0,0 +1,255 @@
+"""
+Live metrics export: Prometheus text over HTTP and a rotating JSONL time series
+实时指标导出：HTTP 提供 Prometheus 文本格式，并写入按大小轮转的 JSONL 时间序列
+"""
+import os
+import json
+import time
+import logging
+import threading
+import logging.handlers
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import *
+
+# 后台采样字段 -> (Prometheus 指标名, 类型, 换算系数, 说明)
+PROCESS_METRICS = {
+    'cpu_time': ('scanner_process_cpu_seconds_total', 'counter', 1.0, "Process CPU time"),
+    'process_cpu': ('scanner_process_cpu_percent', 'gauge', 1.0, "Process CPU utilization (percent of one core)"),
+    'rss': ('scanner_process_resident_memory_bytes', 'gauge', 1048576.0, "Process resident memory"),
+    'threads': ('scanner_process_threads', 'gauge', 1.0, "Process thread count"),
+    'memory': ('scanner_system_memory_percent', 'gauge', 1.0, "System memory utilization"),
+    'load': ('scanner_system_load1', 'gauge', 1.0, "System load average over one minute"),
+    'io_read_bytes': ('scanner_process_io_read_bytes_total', 'counter', 1.0, "Process bytes read"),
+    'io_write_bytes': ('scanner_process_io_write_bytes_total', 'counter', 1.0, "Process bytes written")
+}
+
+QUANTILES = (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99'))
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _flatten(stats, prefix=''):
+    """
+    组件统计字典展开为 (名称, 数值) 列表，非数值字段忽略
+    """
+    values = []
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.extend(_flatten(value, f"{name}_"))
+        elif isinstance(value, bool):
+            values.append((name, int(value)))
+        elif isinstance(value, (int, float)) or hasattr(value, 'item'):
+            try:
+                values.append((name, float(value)))
+            except (TypeError, ValueError):
+                pass
+    return values
+
+def _jsonable(value):
+    # numpy 标量等转换为 Python 数值
+    return value.item() if hasattr(value, 'item') else str(value)
+
+class MetricsExporter:
+    """
+    读取 PerformanceMonitor 的阶段耗时、后台采样和组件统计(含扫描进度与队列深度)，
+    通过 /metrics 提供 Prometheus 文本格式，并定期把快照追加到 JSONL 文件
+    """
+    def __init__(self, monitor, host=METRICS_HTTP_HOST, port=METRICS_HTTP_PORT,
+                 jsonl_path=METRICS_JSONL_FILE, interval=METRICS_EXPORT_INTERVAL,
+                 max_bytes=METRICS_JSONL_MAX_BYTES, backup_count=METRICS_JSONL_BACKUPS):
+        self.logger = logging.getLogger(__name__)
+        self.monitor = monitor
+        self.host = host
+        self.port = port
+        self.jsonl_path = jsonl_path
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        
+        # 每次运行的标识，JSONL 中用于区分和对比不同的扫描
+        self.run_id = time.strftime('%Y%m%d_%H%M%S')
+        self.started = time.time()
+        
+        self.server = None
+        self.server_thread = None
+        self.writer_thread = None
+        self.stop_event = threading.Event()
+        self.sink = None
+        self.records_written = 0
+    
+    def start(self, serve_http=True, write_jsonl=True):
+        """
+        启动 HTTP 服务和 JSONL 写入线程；端口为0时由系统分配，实际端口见 self.port
+        """
+        try:
+            if serve_http and self.server is None:
+                self.server = ThreadingHTTPServer((self.host, self.port), self._handler())
+                self.server.daemon_threads = True
+                self.port = self.server.server_address[1]
+                self.server_thread = threading.Thread(target=self.server.serve_forever,
+                                                      name='metrics-http', daemon=True)
+                self.server_thread.start()
+                self.logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+            
+            if write_jsonl and self.jsonl_path and self.writer_thread is None:
+                self.sink = self._open_sink()
+                self.stop_event.clear()
+                self.writer_thread = threading.Thread(target=self._writer_loop, name='metrics-jsonl', daemon=True)
+                self.writer_thread.start()
+                self.logger.info(f"Writing metrics to {self.jsonl_path} every {self.interval:.1f}s")
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Metrics exporter start failed: {str(e)}")
+            self.stop()
+            return False
+    
+    def stop(self):
+        """
+        停止服务；JSONL 在停止前写入最后一条记录
+        """
+        self.stop_event.set()
+        if self.writer_thread is not None:
+            self.writer_thread.join()
+            self.writer_thread = None
+            self.write_record()
+        if self.sink is not None:
+            for handler in self.sink.handlers:
+                handler.close()
+            self.sink.handlers = []
+            self.sink = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server_thread.join()
+            self.server = None
+            self.server_thread = None
+    
+    def _open_sink(self):
+        """
+        独立的不向上传播的记录器，按大小轮转文件
+        """
+        directory = os.path.dirname(self.jsonl_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        sink = logging.getLogger(f"{__name__}.jsonl.{id(self)}")
+        sink.propagate = False
+        sink.setLevel(logging.INFO)
+        handler = logging.handlers.RotatingFileHandler(
+            self.jsonl_path, maxBytes=self.max_bytes, backupCount=self.backup_count
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        sink.addHandler(handler)
+        return sink
+    
+    def _writer_loop(self):
+        while not self.stop_event.wait(self.interval):
+            self.write_record()
+    
+    def write_record(self):
+        if self.sink is None:
+            return False
+        try:
+            self.sink.info(json.dumps(self.snapshot(), default=_jsonable))
+            self.records_written += 1
+            return True
+        except Exception as e:
+            self.logger.error(f"Metrics record failed: {str(e)}")
+            return False
+    
+    def snapshot(self):
+        """
+        当前各项指标：阶段耗时分位数与吞吐量、最近一次后台采样、组件统计
+        """
+        components = {}
+        for name, provider in list(self.monitor.stats_providers.items()):
+            try:
+                components[name] = provider()
+            except Exception as e:
+                self.logger.debug(f"Stats provider {name} failed: {str(e)}")
+        return {
+            'timestamp': time.time(),
+            'run_id': self.run_id,
+            'uptime': time.time() - self.started,
+            'stages': self.monitor.stage_statistics(),
+            'process': dict(self.monitor.latest_sample),
+            'components': components
+        }
+    
+    def render_prometheus(self, snapshot=None):
+        """
+        Prometheus 文本格式(0.0.4)
+        """
+        snapshot = snapshot or self.snapshot()
+        lines = [
+            "# HELP scanner_uptime_seconds Time since the exporter started",
+            "# TYPE scanner_uptime_seconds gauge",
+            f"scanner_uptime_seconds {snapshot['uptime']:.3f}"
+        ]
+        
+        stages = [(stage, stats) for stage, stats in snapshot['stages'].items() if stats['calls']]
+        if stages:
+            lines += ["# HELP scanner_stage_duration_seconds Pipeline stage latency",
+                      "# TYPE scanner_stage_duration_seconds summary"]
+            for stage, stats in stages:
+                for quantile, key in QUANTILES:
+                    lines.append(f'scanner_stage_duration_seconds{{stage="{_label(stage)}",quantile="{quantile}"}} '
+                                 f'{stats[key]:.6g}')
+                lines.append(f'scanner_stage_duration_seconds_sum{{stage="{_label(stage)}"}} {stats["total_time"]:.6g}')
+                lines.append(f'scanner_stage_duration_seconds_count{{stage="{_label(stage)}"}} {stats["calls"]}')
+            lines += ["# HELP scanner_stage_points_total Points processed per stage",
+                      "# TYPE scanner_stage_points_total counter"]
+            lines += [f'scanner_stage_points_total{{stage="{_label(stage)}"}} {stats["points"]}' for stage, stats in stages]
+            lines += ["# HELP scanner_stage_points_per_second Stage throughput",
+                      "# TYPE scanner_stage_points_per_second gauge"]
+            lines += [f'scanner_stage_points_per_second{{stage="{_label(stage)}"}} {stats["points_per_second"]:.6g}'
+                      for stage, stats in stages if stats['points_per_second']]
+        
+        process = snapshot['process']
+        for key, (name, kind, scale, help_text) in PROCESS_METRICS.items():
+            if process.get(key) is not None:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}",
+                          f"{name} {process[key] * scale:.6g}"]
+        if process.get('stage'):
+            # 最近一次采样时正在运行的阶段
+            lines += ["# HELP scanner_active_stage Stage running at the latest sample",
+                      "# TYPE scanner_active_stage gauge",
+                      f'scanner_active_stage{{stage="{_label(process["stage"])}"}} 1']
+        
+        component_values = [
+            (component, stat, value)
+            for component, stats in snapshot['components'].items() if isinstance(stats, dict)
+            for stat, value in _flatten(stats)
+        ]
+        if component_values:
+            lines += ["# HELP scanner_component Component statistics (scan progress, queue depths, caches)",
+                      "# TYPE scanner_component gauge"]
+            lines += [f'scanner_component{{component="{_label(component)}",stat="{_label(stat)}"}} {value:.6g}'
+                      for component, stat, value in component_values]
+        return '\n'.join(lines) + '\n'
+    
+    def _handler(self):
+        exporter = self
+        
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] == '/metrics':
+                    body = exporter.render_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path.split('?')[0] == '/metrics.json':
+                    body = json.dumps(exporter.snapshot(), default=_jsonable).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                exporter.logger.debug(f"{self.address_string()} {format % args}")
+        
+        return MetricsHandler
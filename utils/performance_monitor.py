@@ -1,22 +1,261 @@
 """
 System performance monitoring and analysis
 """
+import os
+import math
 import time
-import psutil
 import logging
+import functools
+import threading
+import numpy as np
 from datetime import datetime
 from collections import deque
+from config import *
+
+class StageHistogram:
+    """
+    按对数分桶的耗时直方图：内存固定，分位数的相对误差不超过一个桶宽
+    """
+    def __init__(self, buckets_per_octave=TRACE_BUCKETS_PER_OCTAVE,
+                 min_duration=TRACE_MIN_DURATION, max_duration=TRACE_MAX_DURATION):
+        self.min_duration = min_duration
+        self.scale = buckets_per_octave / math.log(2)
+        self.counts = [0] * (int(math.log(max_duration / min_duration) * self.scale) + 2)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.points = 0
+    
+    def record(self, duration, points=None):
+        index = int(math.log(duration / self.min_duration) * self.scale) + 1 if duration > self.min_duration else 0
+        with self.lock:
+            self.counts[min(index, len(self.counts) - 1)] += 1
+            self.calls += 1
+            self.total_time += duration
+            if duration > self.max_time:
+                self.max_time = duration
+            if points:
+                self.points += points
+    
+    def _upper_bound(self, index):
+        return self.min_duration * math.exp(index / self.scale)
+    
+    def percentile(self, q):
+        """
+        第q百分位的耗时，取所在桶的上界(不超过实际最大值)
+        """
+        with self.lock:
+            calls, counts = self.calls, list(self.counts)
+        if not calls:
+            return None
+        rank = q / 100.0 * calls
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if count and seen >= rank:
+                # 最后一个桶收纳所有超出上限的耗时，没有上界
+                if index == len(counts) - 1:
+                    return self.max_time
+                return min(self._upper_bound(index), self.max_time)
+        return self.max_time
+    
+    def summary(self):
+        return {
+            'calls': self.calls,
+            'total_time': self.total_time,
+            'mean': self.total_time / self.calls if self.calls else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max_time,
+            'points': self.points,
+            'points_per_second': self.points / self.total_time if self.points and self.total_time > 0 else None
+        }
+
+class _Span:
+    """
+    一次阶段计时；points 可在 with 块内设置为本次处理的点数
+    """
+    __slots__ = ('tracer', 'stage', 'histogram', 'points', 'start')
+    
+    def __init__(self, tracer, stage, points):
+        self.tracer = tracer
+        self.stage = stage
+        self.histogram = tracer.histogram(stage)
+        self.points = points
+    
+    def __enter__(self):
+        self.tracer._enter(self.stage)
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.record(time.perf_counter() - self.start, self.points)
+        self.tracer._exit()
+        return False
+
+class _NullSpan:
+    """
+    关闭跟踪时共用的空计时，不做任何记录
+    """
+    points = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class StageTracer:
+    """
+    流水线各阶段(采集、坐标转换、异常值去除、ICP、合并、覆盖分析、规划)的耗时跟踪
+    关闭时 trace 返回共用的空计时，装饰器只多一次属性判断
+    """
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self._lock = threading.Lock()
+        # 各线程正在执行的阶段栈，供后台采样给样本打标签
+        self.active = {}
+    
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, StageHistogram())
+        return histogram
+    
+    def trace(self, stage, points=None):
+        """
+        上下文管理器: with tracer.trace('icp', points=n): ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage, points)
+    
+    def _enter(self, stage):
+        self.active.setdefault(threading.get_ident(), []).append(stage)
+    
+    def _exit(self):
+        ident = threading.get_ident()
+        stack = self.active.get(ident)
+        if stack:
+            stack.pop()
+            if not stack:
+                self.active.pop(ident, None)
+    
+    def current_stages(self):
+        """
+        各线程当前最内层的阶段
+        """
+        stages = set()
+        for stack in list(self.active.values()):
+            try:
+                stages.add(stack[-1])
+            except IndexError:
+                # 栈在读取期间被其他线程清空
+                pass
+        return sorted(stages)
+    
+    def traced(self, stage, count=None):
+        """
+        装饰器；count(result, *args, **kwargs) 返回本次调用处理的点数
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                self._enter(stage)
+                start = time.perf_counter()
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    self._exit()
+                points = None
+                if count is not None:
+                    try:
+                        points = count(result, *args, **kwargs)
+                    except Exception:
+                        points = None
+                self.histogram(stage).record(time.perf_counter() - start, points)
+                return result
+            return wrapper
+        return decorator
+    
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+    
+    def summary(self):
+        return {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())}
+
+def count_argument(position, keyword):
+    """
+    traced 的 count 参数：按位置或关键字取出的参数长度
+    """
+    def count(result, *args, **kwargs):
+        return len(args[position]) if len(args) > position else len(kwargs[keyword])
+    return count
+
+def count_result(result, *args, **kwargs):
+    """
+    traced 的 count 参数：返回值的长度
+    """
+    return len(result) if result else 0
+
+# 进程内共享的跟踪器，各模块用 trace/traced 记录阶段耗时，PerformanceMonitor 负责开关和汇总
+STAGE_TRACER = StageTracer()
+trace = STAGE_TRACER.trace
+traced = STAGE_TRACER.traced
+
+def _series_stats(history):
+    """
+    (时间戳, 值, 阶段标签) 序列的统计，空序列返回None
+    """
+    # 先复制，避免后台采样线程同时追加
+    values = [entry[1] for entry in list(history)]
+    if not values:
+        return None
+    return {
+        'average': float(np.mean(values)),
+        'max': max(values),
+        'min': min(values),
+        'count': len(values)
+    }
 
 class PerformanceMonitor:
-    def __init__(self, history_size=1000):
+    def __init__(self, history_size=1000, tracer=None):
         self.logger = logging.getLogger(__name__)
         self.history_size = history_size
         
-        # 性能指标历史记录
-        self.cpu_history = deque(maxlen=history_size)
-        self.memory_history = deque(maxlen=history_size)
-        self.scan_time_history = deque(maxlen=history_size)
-        self.processing_time_history = deque(maxlen=history_size)
+        # 性能指标历史记录，按指标名保存，未知指标在首次记录时创建
+        self.histories = {
+            name: deque(maxlen=history_size) for name in ('cpu', 'memory', 'scan_time', 'processing_time')
+        }
+        self.cpu_history = self.histories['cpu']
+        self.memory_history = self.histories['memory']
+        self.scan_time_history = self.histories['scan_time']
+        self.processing_time_history = self.histories['processing_time']
+        
+        # 阶段耗时跟踪，监控期间开启
+        self.tracer = tracer or STAGE_TRACER
+        
+        # 组件统计信息回调（如缓存命中率），生成报告时调用
+        self.stats_providers = {}
+        
+        # 后台采样线程及其状态
+        self.sampler = None
+        self.sampler_stop = threading.Event()
+        self.sample_interval = METRICS_SAMPLE_INTERVAL
+        self.low_overhead = False
+        self.stage_label = None
+        self.latest_sample = {}
+        self._last_cpu = None
+        self._process = None
         
         self.start_time = None
         self.is_monitoring = False
@@ -27,32 +266,186 @@ class PerformanceMonitor:
         """
         self.start_time = time.time()
         self.is_monitoring = True
+        self.tracer.enabled = True
         self.logger.info("Performance monitoring started")
     
     def stop_monitoring(self):
         """
         停止性能监控
         """
+        self.stop_sampling()
         self.is_monitoring = False
+        self.tracer.enabled = False
         self.logger.info("Performance monitoring stopped")
     
-    def record_metrics(self, metric_type, value):
+    def record_metrics(self, metric_type, value, stage=None, timestamp=None):
         """
-        记录性能指标
+        记录性能指标；stage 为样本对应的流水线阶段标签
         """
         if not self.is_monitoring:
             return
             
+        timestamp = timestamp or time.time()
+        
+        history = self.histories.get(metric_type)
+        if history is None:
+            history = self.histories.setdefault(metric_type, deque(maxlen=self.history_size))
+        history.append((timestamp, value, stage))
+    
+    def set_stage(self, stage):
+        """
+        手动设置样本的阶段标签；为None时使用跟踪器记录的当前阶段
+        """
+        self.stage_label = stage
+    
+    def current_stage(self):
+        if self.stage_label is not None:
+            return self.stage_label
+        stages = self.tracer.current_stages()
+        return '+'.join(stages) if stages else 'idle'
+    
+    def start_sampling(self, interval=None, low_overhead=False):
+        """
+        启动后台采样线程，按固定间隔记录进程CPU、内存、线程数、I/O和系统负载，不阻塞流水线线程
+        low_overhead: 只读取 os/proc 中的少量数据且不导入 psutil，适合在EV3上使用
+        """
+        if self.sampler is not None:
+            return
+        self.low_overhead = low_overhead
+        self.sample_interval = interval or (METRICS_LOW_OVERHEAD_INTERVAL if low_overhead else METRICS_SAMPLE_INTERVAL)
+        self._last_cpu = None
+        self.sampler_stop.clear()
+        self.sampler = threading.Thread(target=self._sampling_loop, name='metrics-sampler', daemon=True)
+        self.sampler.start()
+        self.logger.info(f"Metrics sampling started every {self.sample_interval:.1f}s"
+                         + (" (low overhead)" if low_overhead else ""))
+    
+    def stop_sampling(self):
+        if self.sampler is None:
+            return
+        self.sampler_stop.set()
+        self.sampler.join()
+        self.sampler = None
+    
+    def _sampling_loop(self):
+        while not self.sampler_stop.is_set():
+            started = time.perf_counter()
+            try:
+                self.sample_process_metrics()
+            except Exception as e:
+                self.logger.error(f"Metrics sampling failed: {str(e)}")
+            # 扣除采样本身的耗时，保持采样频率
+            self.sampler_stop.wait(max(self.sample_interval - (time.perf_counter() - started), 0.0))
+    
+    def sample_process_metrics(self):
+        """
+        采集一次进程指标并写入历史记录，进程CPU占用(单核百分比，多线程时可超过100)
+        由两次采样间的CPU时间差计算，记为 process_cpu，与系统CPU占用 cpu 分开
+        """
         timestamp = time.time()
+        stage = self.current_stage()
+        sample = self._read_light() if self.low_overhead else self._read_full()
         
-        if metric_type == 'cpu':
-            self.cpu_history.append((timestamp, value))
-        elif metric_type == 'memory':
-            self.memory_history.append((timestamp, value))
-        elif metric_type == 'scan_time':
-            self.scan_time_history.append((timestamp, value))
-        elif metric_type == 'processing_time':
-            self.processing_time_history.append((timestamp, value))
+        cpu_time = sample['cpu_time']
+        if self._last_cpu is not None and timestamp > self._last_cpu[0]:
+            sample['process_cpu'] = 100.0 * (cpu_time - self._last_cpu[1]) / (timestamp - self._last_cpu[0])
+        self._last_cpu = (timestamp, cpu_time)
+        
+        for name, value in sample.items():
+            if value is not None:
+                self.record_metrics(name, value, stage, timestamp)
+        sample.update(timestamp=timestamp, stage=stage)
+        self.latest_sample = sample
+        return sample
+    
+    @staticmethod
+    def _read_light():
+        """
+        低开销采样：进程CPU时间、常驻内存、Python线程数和系统负载
+        """
+        times = os.times()
+        rss = None
+        try:
+            with open('/proc/self/statm') as f:
+                rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1048576.0
+        except (OSError, ValueError, IndexError):
+            pass
+        try:
+            load = os.getloadavg()[0]
+        except (OSError, AttributeError):
+            load = None
+        return {
+            'cpu_time': times.user + times.system,
+            'rss': rss,
+            'threads': threading.active_count(),
+            'load': load
+        }
+    
+    def _read_full(self):
+        """
+        完整采样(psutil)：另含系统内存占用和进程I/O计数
+        """
+        import psutil
+        if self._process is None:
+            self._process = psutil.Process()
+        process = self._process
+        with process.oneshot():
+            cpu = process.cpu_times()
+            sample = {
+                'cpu_time': cpu.user + cpu.system,
+                'rss': process.memory_info().rss / 1048576.0,
+                'threads': process.num_threads(),
+                'memory': psutil.virtual_memory().percent,
+                'load': psutil.getloadavg()[0]
+            }
+            try:
+                io = process.io_counters()
+                sample['io_read_bytes'] = io.read_bytes
+                sample['io_write_bytes'] = io.write_bytes
+            except (AttributeError, psutil.Error):
+                # 部分平台不提供进程I/O计数
+                pass
+        return sample
+    
+    def stage_resource_usage(self):
+        """
+        按阶段标签汇总后台采样：平均CPU占用和峰值常驻内存
+        """
+        usage = {}
+        for name, key in (('process_cpu', 'average_cpu'), ('rss', 'peak_rss')):
+            grouped = {}
+            for _, value, stage in list(self.histories.get(name, ())):
+                if stage is not None:
+                    grouped.setdefault(stage, []).append(value)
+            for stage, values in grouped.items():
+                usage.setdefault(stage, {'samples': len(values)})[key] = (
+                    float(np.mean(values)) if key == 'average_cpu' else max(values)
+                )
+        return usage
+    
+    def trace(self, stage, points=None):
+        """
+        阶段计时上下文管理器，见 StageTracer.trace
+        """
+        return self.tracer.trace(stage, points)
+    
+    def traced(self, stage, count=None):
+        """
+        阶段计时装饰器，见 StageTracer.traced
+        """
+        return self.tracer.traced(stage, count)
+    
+    def stage_statistics(self):
+        """
+        各阶段的调用次数、p50/p95/p99耗时和每秒处理点数
+        """
+        return self.tracer.summary()
+    
+    def register_stats_provider(self, name, provider):
+        """
+        注册一个返回统计信息字典的回调，其结果会出现在性能报告中
+        """
+        self.stats_providers[name] = provider
     
     def get_system_metrics(self):
         """
@@ -62,14 +455,17 @@ class PerformanceMonitor:
             if not self.is_monitoring:
                 return None
                 
+            import psutil
+            # interval=None 返回自上次调用以来的占用，不阻塞调用方
             metrics = {
-                'cpu_percent': psutil.cpu_percent(interval=1),
+                'cpu_percent': psutil.cpu_percent(interval=None),
                 'memory_percent': psutil.virtual_memory().percent,
                 'timestamp': time.time()
             }
             
-            self.record_metrics('cpu', metrics['cpu_percent'])
-            self.record_metrics('memory', metrics['memory_percent'])
+            stage = self.current_stage()
+            self.record_metrics('cpu', metrics['cpu_percent'], stage)
+            self.record_metrics('memory', metrics['memory_percent'], stage)
             
             return metrics
             
@@ -82,31 +478,22 @@ class PerformanceMonitor:
         分析性能数据
         """
         try:
-            if not self.is_monitoring:
+            if self.start_time is None:
                 return None
-                
+            
+            # 没有样本的指标为None
             analysis = {
                 'duration': time.time() - self.start_time,
-                'cpu': {
-                    'average': np.mean([x[1] for x in self.cpu_history]),
-                    'max': max([x[1] for x in self.cpu_history]),
-                    'min': min([x[1] for x in self.cpu_history])
-                },
-                'memory': {
-                    'average': np.mean([x[1] for x in self.memory_history]),
-                    'max': max([x[1] for x in self.memory_history]),
-                    'min': min([x[1] for x in self.memory_history])
-                },
-                'scan_time': {
-                    'average': np.mean([x[1] for x in self.scan_time_history]),
-                    'max': max([x[1] for x in self.scan_time_history]),
-                    'min': min([x[1] for x in self.scan_time_history])
-                },
-                'processing_time': {
-                    'average': np.mean([x[1] for x in self.processing_time_history]),
-                    'max': max([x[1] for x in self.processing_time_history]),
-                    'min': min([x[1] for x in self.processing_time_history])
-                }
+                'cpu': _series_stats(self.cpu_history),
+                'memory': _series_stats(self.memory_history),
+                'scan_time': _series_stats(self.scan_time_history),
+                'processing_time': _series_stats(self.processing_time_history),
+                'process_cpu': _series_stats(self.histories.get('process_cpu', ())),
+                'rss': _series_stats(self.histories.get('rss', ())),
+                'threads': _series_stats(self.histories.get('threads', ())),
+                'load': _series_stats(self.histories.get('load', ())),
+                'stages': self.stage_statistics(),
+                'stage_resources': self.stage_resource_usage()
             }
             
             return analysis
@@ -124,40 +511,70 @@ class PerformanceMonitor:
             if not analysis:
                 return None
             
+            # 没有样本的指标不出现在报告中
+            metrics = {}
+            if analysis['cpu']:
+                metrics['cpu_utilization'] = {
+                    'average': f"{analysis['cpu']['average']:.1f}%",
+                    'peak': f"{analysis['cpu']['max']:.1f}%"
+                }
+            if analysis['memory']:
+                metrics['memory_usage'] = {
+                    'average': f"{analysis['memory']['average']:.1f}%",
+                    'peak': f"{analysis['memory']['max']:.1f}%"
+                }
+            if analysis['scan_time']:
+                metrics['scanning_performance'] = {
+                    'average_scan_time': f"{analysis['scan_time']['average']:.3f}s",
+                    'max_scan_time': f"{analysis['scan_time']['max']:.3f}s"
+                }
+            if analysis['processing_time']:
+                metrics['processing_performance'] = {
+                    'average_processing_time': f"{analysis['processing_time']['average']:.3f}s",
+                    'max_processing_time': f"{analysis['processing_time']['max']:.3f}s"
+                }
+            if analysis['rss']:
+                metrics['process'] = {
+                    'average_rss': f"{analysis['rss']['average']:.1f}MB",
+                    'peak_rss': f"{analysis['rss']['max']:.1f}MB",
+                    'average_cpu': (f"{analysis['process_cpu']['average']:.1f}%"
+                                    if analysis['process_cpu'] else None),
+                    'peak_threads': analysis['threads']['max'] if analysis['threads'] else None,
+                    'average_load': f"{analysis['load']['average']:.2f}" if analysis['load'] else None
+                }
+            
             report = {
                 'timestamp': datetime.now().isoformat(),
                 'duration': f"{analysis['duration']:.2f} seconds",
-                'performance_metrics': {
-                    'cpu_utilization': {
-                        'average': f"{analysis['cpu']['average']:.1f}%",
-                        'peak': f"{analysis['cpu']['max']:.1f}%"
-                    },
-                    'memory_usage': {
-                        'average': f"{analysis['memory']['average']:.1f}%",
-                        'peak': f"{analysis['memory']['max']:.1f}%"
-                    },
-                    'scanning_performance': {
-                        'average_scan_time': f"{analysis['scan_time']['average']:.3f}s",
-                        'max_scan_time': f"{analysis['scan_time']['max']:.3f}s"
-                    },
-                    'processing_performance': {
-                        'average_processing_time': f"{analysis['processing_time']['average']:.3f}s",
-                        'max_processing_time': f"{analysis['processing_time']['max']:.3f}s"
+                'performance_metrics': metrics,
+                'stage_latency': {
+                    stage: {
+                        'calls': stats['calls'],
+                        'p50': f"{stats['p50'] * 1000:.2f}ms",
+                        'p95': f"{stats['p95'] * 1000:.2f}ms",
+                        'p99': f"{stats['p99'] * 1000:.2f}ms",
+                        'points_per_second': (f"{stats['points_per_second']:.0f}"
+                                              if stats['points_per_second'] else None)
                     }
+                    for stage, stats in analysis['stages'].items() if stats['calls']
+                },
+                'stage_resources': analysis['stage_resources'],
+                'component_statistics': {
+                    name: provider() for name, provider in self.stats_providers.items()
                 },
                 'recommendations': []
             }
             
-            # 添加性能建议
-            if analysis['cpu']['average'] > 80:
+            # 添加性能建议；CPU阈值只针对系统CPU占用，进程CPU占用按单核计可超过100%
+            if analysis['cpu'] and analysis['cpu']['average'] > 80:
                 report['recommendations'].append(
                     "CPU utilization is high. Consider optimizing processing algorithms."
                 )
-            if analysis['memory']['average'] > 80:
+            if analysis['memory'] and analysis['memory']['average'] > 80:
                 report['recommendations'].append(
                     "Memory usage is high. Consider implementing data streaming or reducing batch size."
                 )
-            if analysis['scan_time']['average'] > 2.0:
+            if analysis['scan_time'] and analysis['scan_time']['average'] > 2.0:
                 report['recommendations'].append(
                     "Scan times are longer than expected. Check sensor and motor performance."
                 )
@@ -3,7 +3,6 @@ Validation and testing utilities for the reconstruction
 """
 import numpy as np
 import logging
-from scipy.spatial.distance import directed_hausdorff
 
 class ValidationUtils:
     def __init__(self):
@@ -51,6 +50,9 @@ class ValidationUtils:
             array1 = np.array([[p['x'], p['y'], p['z']] for p in points1])
             array2 = np.array([[p['x'], p['y'], p['z']] for p in points2])
             
+            from scipy.spatial.distance import directed_hausdorff
+            from sklearn.neighbors import KDTree
+            
             # 计算Hausdorff距离
             hausdorff_dist = directed_hausdorff(array1, array2)[0]
             